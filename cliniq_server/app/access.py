@@ -0,0 +1,93 @@
+"""
+Who may see whose data.
+
+A viewer may always see their own data, and another user's vitals or diet
+data when an accepted ``Connection`` (owner monitored by viewer) grants
+``access_vital_signs_data`` / ``access_diet_data``. Each viewer's grants are
+loaded once into an ``AccessMap`` and kept in memory, so a permission check
+is a set lookup. The map also holds the viewer's token version, which
+``app/auth.py`` compares with the one in each token. The connection endpoints
+and ``revoke_tokens`` invalidate the affected viewers;
+``settings.ACCESS_CACHE_TTL`` bounds staleness across worker processes, and
+at most ``settings.ACCESS_CACHE_SIZE`` maps are kept, the oldest dropped first.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from app.models import Connection, UserProfile
+
+
+class AccessMap:
+    __slots__ = ("viewer", "own_device", "token_version", "vitals", "diet", "devices")
+
+    def __init__(self, viewer, own_device, grants, token_version=0):
+        self.viewer = viewer
+        self.own_device = own_device
+        self.token_version = token_version
+        self.vitals = frozenset([viewer] + [owner for owner, _, vitals, _ in grants if vitals])
+        self.diet = frozenset([viewer] + [owner for owner, _, _, diet in grants if diet])
+        devices = [own_device] + [device for _, device, vitals, _ in grants if vitals]
+        self.devices = tuple(sorted({device for device in devices if device}))
+
+    def may_view_vitals(self, owner):
+        return owner in self.vitals
+
+    def may_view_diet(self, owner):
+        return owner in self.diet
+
+
+def build(viewer):
+    own_device, token_version = UserProfile.objects.filter(username=viewer).values_list(
+        "device_id", "token_version").first() or (None, 0)
+    grants = list(Connection.objects.filter(monitored_by__username=viewer, accepted=True).values_list(
+        "monitored__username", "monitored__device_id", "access_vital_signs_data", "access_diet_data",
+    ))
+    return AccessMap(viewer, own_device, grants, token_version)
+
+
+_maps = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_map(viewer):
+    entry = _maps.get(viewer)
+    if entry is not None and time.monotonic() - entry[1] < settings.ACCESS_CACHE_TTL:
+        return entry[0]
+    access_map = build(viewer)
+    with _lock:
+        _maps[viewer] = (access_map, time.monotonic())
+        _maps.move_to_end(viewer)
+        # ?username= is unauthenticated, so anyone can add entries
+        while len(_maps) > settings.ACCESS_CACHE_SIZE:
+            _maps.popitem(last=False)
+    return access_map
+
+
+async def aget_map(viewer):
+    """``get_map`` for async views: no thread hop when the map is cached."""
+    entry = _maps.get(viewer)
+    if entry is not None and time.monotonic() - entry[1] < settings.ACCESS_CACHE_TTL:
+        return entry[0]
+    return await sync_to_async(get_map)(viewer)
+
+
+def invalidate(*viewers):
+    """Forget the maps of ``viewers``, or every map if none are given."""
+    with _lock:
+        if not viewers:
+            _maps.clear()
+        for viewer in viewers:
+            _maps.pop(viewer, None)
+
+
+def may_view_vitals(viewer, owner):
+    return get_map(viewer).may_view_vitals(owner)
+
+
+def may_view_diet(viewer, owner):
+    return get_map(viewer).may_view_diet(owner)
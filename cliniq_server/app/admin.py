@@ -7,9 +7,11 @@ from .models import *
 admin.site.register(UserProfile)
 admin.site.register(Connection)
 admin.site.register(Config)
+admin.site.register(VitalsRollup)
+admin.site.register(IngestCheckpoint)
 
 
 @admin.register(DeviceRecords)
 class DeviceRecordsAdmin(admin.ModelAdmin):
     def get_list_display(self, request):
-        return ["timestamp", "age", "gender", "temp", "blood_oxygen", "heart_rate", "sbp", "dbp", "ecg_sensor_frame"]
\ No newline at end of file
+        return ["device_id", "timestamp", "age", "gender", "temp", "blood_oxygen", "heart_rate", "sbp", "dbp"]
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""
+Anomaly alerts on incoming vitals.
+
+Every device has one row in a few NumPy arrays: an exponentially weighted
+mean and variance per metric plus a reading count. That is O(1) memory per
+device. Ingest queues readings with ``add``. Every
+``settings.ANOMALY_INTERVAL`` seconds a background thread scores the whole
+queue in one vectorized pass:
+
+* z-score against the device's EWMA baseline, once it has
+  ``ANOMALY_WARMUP`` readings, beyond ``ANOMALY_Z_THRESHOLD``, with the
+  deviation floored at ``ANOMALY_MIN_STD``;
+* fixed clinical bands from ``ANOMALY_BANDS``, from the first reading.
+
+Flagged readings become alerts. Each one is published as an "alert" event
+on the device's live streams. Those streams reach the owner and the
+``monitored_by`` users granted vitals access. The last
+``ANOMALY_HISTORY`` alerts per device are kept for ``get_alerts``.
+
+Alerts and streams live in the web process, so readings are scored where
+they arrive. With ``INGEST_MODE=log`` that is before ``drain_ingest_log``
+has run inference, and blood pressure is not scored.
+"""
+
+import atexit
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from app import streaming
+
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("heart_rate", "blood_oxygen", "temp", "sbp", "dbp")
+
+
+class AnomalyDetector:
+    def __init__(self, alpha=0.05, z_threshold=4.0, warmup=30, bands=None, min_std=None, interval=1.0, history=50,
+                 capacity=1024):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.interval = interval
+        bands = bands or {}
+        self.low = np.array([bands.get(m, (None, None))[0] for m in METRICS], dtype=np.float64)
+        self.high = np.array([bands.get(m, (None, None))[1] for m in METRICS], dtype=np.float64)
+        # integer readings often repeat exactly; without a floor a flat baseline would make any spike unscorable
+        self.min_std = np.array([(min_std or {}).get(m, 0.0) for m in METRICS], dtype=np.float64)
+        self.history = history
+
+        self._slots = {}
+        self._mean = np.zeros((capacity, len(METRICS)))
+        self._var = np.zeros((capacity, len(METRICS)))
+        self._count = np.zeros(capacity, dtype=np.int64)
+        self._alerts = {}
+        self._pending = []
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._worker = None
+
+    def add(self, records):
+        self._queue((record.device_id, record.timestamp.timestamp(), [getattr(record, m) for m in METRICS]) for record in records)
+
+    def add_readings(self, readings):
+        """Queue raw (device_id, unix_ts, spo2, bpm, temp, ecg_samples) pushes,
+        which have no blood pressure yet."""
+        self._queue((device_id, ts, [bpm, spo2, temp, None, None]) for device_id, ts, spo2, bpm, temp, _ in readings)
+
+    def _queue(self, items):
+        with self._lock:
+            self._pending.extend(items)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="anomaly-detector", daemon=True)
+                self._worker.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            device_ids, timestamps, values = zip(*pending)
+            self.observe(device_ids, np.array(timestamps), np.array(values, dtype=np.float64))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("failed to score vitals for anomalies")
+
+    def slots(self, device_ids):
+        index = np.empty(len(device_ids), dtype=np.int64)
+        for i, device_id in enumerate(device_ids):
+            slot = self._slots.get(device_id)
+            if slot is None:
+                slot = self._slots[device_id] = len(self._slots)
+                if slot == len(self._count):
+                    self._mean = np.concatenate([self._mean, np.zeros_like(self._mean)])
+                    self._var = np.concatenate([self._var, np.zeros_like(self._var)])
+                    self._count = np.concatenate([self._count, np.zeros_like(self._count)])
+            index[i] = slot
+        return index
+
+    def observe(self, device_ids, timestamps, values):
+        """Score ``values`` (one row of METRICS per reading, NaN where
+        missing), fold them into the baselines and raise alerts. Returns the
+        (n, len(METRICS)) boolean array of flags."""
+        with self._state_lock:
+            index = self.slots(device_ids)
+            flags = np.zeros(values.shape, dtype=bool)
+            z = np.zeros(values.shape)
+            # several readings of one device in a batch must update its
+            # baseline in order: handle the k-th reading of every device in round k
+            order = np.argsort(index, kind="stable")
+            sorted_index = index[order]
+            positions = np.arange(len(index))
+            starts = np.maximum.accumulate(np.where(np.r_[True, sorted_index[1:] != sorted_index[:-1]], positions, 0))
+            rank = np.empty_like(index)
+            rank[order] = positions - starts
+            for k in range(int(rank.max()) + 1 if len(rank) else 0):
+                selected = np.nonzero(rank == k)[0]
+                flags[selected], z[selected] = self._step(index[selected], values[selected])
+        self._raise(device_ids, timestamps, values, flags, z)
+        return flags
+
+    def _step(self, slots, x):
+        mean = self._mean[slots]
+        var = self._var[slots]
+        count = self._count[slots]
+
+        std = np.maximum(np.sqrt(var), self.min_std)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.where(std > 0, (x - mean) / std, 0.0)
+        z = np.nan_to_num(z)
+        flags = (count[:, None] >= self.warmup) & (np.abs(z) > self.z_threshold)
+        with np.errstate(invalid="ignore"):
+            flags |= (x < self.low) | (x > self.high)
+
+        valid = ~np.isnan(x)
+        first = count[:, None] == 0
+        delta = x - mean
+        new_mean = np.where(first, x, mean + self.alpha * delta)
+        new_var = np.where(first, 0.0, (1 - self.alpha) * (var + self.alpha * delta ** 2))
+        self._mean[slots] = np.where(valid, new_mean, mean)
+        self._var[slots] = np.where(valid, new_var, var)
+        self._count[slots] = count + 1
+        return flags, z
+
+    def _raise(self, device_ids, timestamps, values, flags, z):
+        for i in np.nonzero(flags.any(axis=1))[0].tolist():
+            device_id = device_ids[i]
+            alert = {"timestamp": float(timestamps[i]), "metrics": {}}
+            for j in np.nonzero(flags[i])[0].tolist():
+                value = float(values[i, j])
+                in_band = not (value < self.low[j] or value > self.high[j])
+                alert["metrics"][METRICS[j]] = {
+                    "value": value,
+                    "z": round(float(z[i, j]), 2),
+                    "reason": "deviation" if in_band else "out_of_range",
+                }
+            with self._state_lock:
+                alerts = self._alerts.get(device_id)
+                if alerts is None:
+                    alerts = self._alerts[device_id] = collections.deque(maxlen=self.history)
+                alerts.append(alert)
+            streaming.broker.publish(device_id, alert, kind="alert")
+
+    def recent(self, device_ids, since=0):
+        """Alerts for ``device_ids`` newer than ``since`` (unix time), oldest first."""
+        with self._state_lock:
+            found = [
+                dict(alert, device_id=device_id)
+                for device_id in device_ids
+                for alert in self._alerts.get(device_id, ())
+                if alert["timestamp"] > since
+            ]
+        return sorted(found, key=lambda alert: alert["timestamp"])
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_detector():
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            _detector = AnomalyDetector(
+                alpha=settings.ANOMALY_ALPHA,
+                z_threshold=settings.ANOMALY_Z_THRESHOLD,
+                warmup=settings.ANOMALY_WARMUP,
+                bands=settings.ANOMALY_BANDS,
+                min_std=settings.ANOMALY_MIN_STD,
+                interval=settings.ANOMALY_INTERVAL,
+                history=settings.ANOMALY_HISTORY,
+            )
+            atexit.register(_detector.flush)
+        return _detector
+
+
+def add(records):
+    if settings.ANOMALY_ENABLED:
+        get_detector().add(records)
+
+
+def add_readings(readings):
+    if settings.ANOMALY_ENABLED:
+        get_detector().add_readings(readings)
@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class AppConfig(AppConfig):
     name = 'app'
+
+    def ready(self):
+        from app import device_context, metrics, response_cache
+        from app.models import Config, Connection, UserProfile
+        connection_created.connect(metrics.install_query_wrapper, dispatch_uid="cliniq_query_metrics")
+        for model in (UserProfile, Config):
+            for signal in (post_save, post_delete):
+                signal.connect(device_context.profile_changed, sender=model, dispatch_uid="cliniq_device_context_%s" % model.__name__)
+        for signal in (post_save, post_delete):
+            signal.connect(response_cache.profile_changed, sender=UserProfile, dispatch_uid="cliniq_response_cache_profile")
+            signal.connect(response_cache.connection_changed, sender=Connection, dispatch_uid="cliniq_response_cache_connection")
@@ -0,0 +1,220 @@
+"""
+Cold tier for old ``DeviceRecords``.
+
+``manage.py archive_records`` moves rows older than ``settings.RETENTION_DAYS``
+out of the database into one NumPy ``.npz`` file per device per UTC day::
+
+    <ARCHIVE_DIR>/<device_id>/<YYYY-MM-DD>.npz
+
+Each column is its own array, so a reader loads only what it needs (history
+never touches the ECG samples). Integer columns use ``NULL_INT`` for NULL,
+float columns NaN; ECG frames are stored decoded, concatenated in
+``ecg_samples`` with ``ecg_offsets`` marking where each row's frame starts.
+With ``ARCHIVE_COMPRESS`` off, members are stored uncompressed and
+``load_columns`` memory-maps them instead of reading them into memory.
+
+Archived rows keep their primary keys, so history cursors work across both
+tiers; ``history.page`` and ``get_ecg`` merge the two.
+"""
+
+import datetime
+import os
+import struct
+import zipfile
+from urllib.parse import quote
+
+import numpy as np
+from django.conf import settings
+
+from app import ecg
+
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+NULL_INT = np.iinfo(np.int32).min
+COLUMNS = {
+    "temp": np.float64,
+    "heart_rate": np.int32,
+    "blood_oxygen": np.float64,
+    "sbp": np.int32,
+    "dbp": np.int32,
+    "age": np.int32,
+    "gender": np.int32,
+}
+# DeviceRecords fields in the order archive rows are built from
+FIELDS = ("id", "timestamp") + tuple(COLUMNS) + ("ecg_frame",)
+
+
+def micros(timestamp):
+    return (timestamp - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def from_micros(value):
+    return EPOCH + datetime.timedelta(microseconds=int(value))
+
+
+def device_dir(device_id):
+    name = quote(device_id, safe="")
+    if name.startswith("."):
+        # "." and ".." would resolve outside the device's own directory
+        name = "%2E" + name[1:]
+    return os.path.join(settings.ARCHIVE_DIR, name)
+
+
+def day_path(device_id, day):
+    return os.path.join(device_dir(device_id), "%s.npz" % day.isoformat())
+
+
+def days(device_id, start, end):
+    """(day, path) of every archived day of ``device_id`` overlapping [start, end), oldest first."""
+    directory = device_dir(device_id)
+    if not os.path.isdir(directory):
+        return []
+    first, last = start.date(), end.date()
+    found = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".npz"):
+            continue
+        day = datetime.date.fromisoformat(name[:-4])
+        if first <= day <= last:
+            found.append((day, os.path.join(directory, name)))
+    return found
+
+
+def to_columns(rows):
+    """Column arrays from ``FIELDS``-ordered tuples."""
+    columns = {
+        "id": np.array([row[0] for row in rows], dtype=np.int64),
+        "timestamp": np.array([micros(row[1]) for row in rows], dtype=np.int64),
+    }
+    for i, (name, dtype) in enumerate(COLUMNS.items(), start=2):
+        null = np.nan if dtype is np.float64 else NULL_INT
+        columns[name] = np.array([null if row[i] is None else row[i] for row in rows], dtype=dtype)
+    frames = [ecg.decode(row[-1]) for row in rows]
+    columns["ecg_offsets"] = np.concatenate([[0], np.cumsum([len(frame) for frame in frames], dtype=np.int64)]).astype(np.int64)
+    columns["ecg_samples"] = np.concatenate(frames) if frames else np.empty(0, dtype=ecg.SAMPLE_DTYPE)
+    return columns
+
+
+def load_columns(path, names):
+    """The named columns of one day file, memory-mapped when stored uncompressed."""
+    columns = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for name in names:
+            info = archive.getinfo(name + ".npy")
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    columns[name] = np.lib.format.read_array(member)
+                continue
+            # local file header: 30 fixed bytes, then the name and extra field
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if not shape or not shape[0]:
+                columns[name] = np.empty(shape, dtype=dtype)
+            else:
+                columns[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                          order="F" if fortran_order else "C")
+    return columns
+
+
+def write_day(device_id, day, rows):
+    """Add ``rows`` to the day file, merging with what is already archived.
+    Rows already present (same id) are kept once, so a rerun after a crash
+    between writing and deleting is harmless."""
+    path = day_path(device_id, day)
+    columns = to_columns(rows)
+    if os.path.exists(path):
+        existing = load_columns(path, ["id", "timestamp", *COLUMNS, "ecg_offsets", "ecg_samples"])
+        columns = merge(existing, columns)
+    order = np.lexsort((columns["id"], columns["timestamp"]))
+    columns = take(columns, order)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        (np.savez_compressed if settings.ARCHIVE_COMPRESS else np.savez)(f, **columns)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def frames(columns):
+    offsets = columns["ecg_offsets"]
+    return [columns["ecg_samples"][offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def take(columns, index):
+    taken = {name: np.asarray(columns[name])[index] for name in ("id", "timestamp", *COLUMNS)}
+    every = frames(columns)
+    picked = [every[i] for i in index]
+    taken["ecg_offsets"] = np.concatenate([[0], np.cumsum([len(frame) for frame in picked], dtype=np.int64)]).astype(np.int64)
+    taken["ecg_samples"] = np.concatenate(picked) if picked else np.empty(0, dtype=ecg.SAMPLE_DTYPE)
+    return taken
+
+
+def merge(a, b):
+    merged = {name: np.concatenate([a[name], b[name]]) for name in ("id", "timestamp", *COLUMNS)}
+    merged["ecg_offsets"] = np.concatenate([a["ecg_offsets"], b["ecg_offsets"][1:] + a["ecg_offsets"][-1]])
+    merged["ecg_samples"] = np.concatenate([a["ecg_samples"], b["ecg_samples"]])
+    _, first = np.unique(merged["id"], return_index=True)
+    return take(merged, np.sort(first))
+
+
+def values(column, index):
+    """Python values of ``column[index]``, with NULL markers as None."""
+    selected = np.asarray(column)[index]
+    null = selected == NULL_INT if selected.dtype == np.int32 else np.isnan(selected)
+    values = selected.tolist()
+    for i in np.nonzero(null)[0].tolist():
+        values[i] = None
+    return values
+
+
+def select(columns, start, end, after):
+    timestamps = np.asarray(columns["timestamp"])
+    mask = (timestamps >= micros(start)) & (timestamps < micros(end))
+    if after is not None:
+        after_us, after_pk = micros(after[0]), after[1]
+        ids = np.asarray(columns["id"])
+        mask &= (timestamps > after_us) | ((timestamps == after_us) & (ids > after_pk))
+    return np.nonzero(mask)[0]
+
+
+def rows(device_id, start, end, limit, after=None, fields=("temp", "heart_rate", "blood_oxygen", "sbp", "dbp")):
+    """Up to ``limit`` archived readings in [start, end), oldest first, after
+    the ``(timestamp, id)`` key ``after``; dicts shaped like
+    ``DeviceRecords.values("id", "timestamp", *fields)``."""
+    found = []
+    for _, path in days(device_id, start, end):
+        keys = load_columns(path, ["id", "timestamp"])
+        index = select(keys, start, end, after)[:limit - len(found)]
+        if not len(index):
+            continue
+        columns = load_columns(path, fields)
+        ids = np.asarray(keys["id"])[index].tolist()
+        timestamps = [from_micros(value) for value in np.asarray(keys["timestamp"])[index].tolist()]
+        picked = [values(columns[name], index) for name in fields]
+        for i in range(len(index)):
+            row = {"id": ids[i], "timestamp": timestamps[i]}
+            for name, column in zip(fields, picked):
+                row[name] = column[i]
+            found.append(row)
+        if len(found) >= limit:
+            break
+    return found
+
+
+def ecg_frames(device_id, start, end):
+    """``(timestamp, id, samples)`` of every archived non-empty ECG frame in [start, end), oldest first."""
+    for _, path in days(device_id, start, end):
+        columns = load_columns(path, ["id", "timestamp", "ecg_offsets", "ecg_samples"])
+        offsets = columns["ecg_offsets"]
+        for i in select(columns, start, end, None):
+            if offsets[i + 1] > offsets[i]:
+                yield from_micros(columns["timestamp"][i]), int(columns["id"][i]), columns["ecg_samples"][offsets[i]:offsets[i + 1]]
@@ -0,0 +1,44 @@
+"""
+The ASGI handler for the API.
+
+Django builds one middleware chain per handler, from ``settings.MIDDLEWARE``.
+``APIHandler`` builds its chain from ``settings.API_MIDDLEWARE`` instead,
+which holds only async-native middleware, and resolves requests against
+``settings.API_URLCONF``, whose async views then run on the event loop
+without a thread hop anywhere on the way. The admin needs the full stack,
+so ``cliniq_server.asgi`` routes it (and static files) to Django's own
+handler.
+"""
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.test.utils import override_settings
+
+
+class APIHandler(ASGIHandler):
+    def load_middleware(self, is_async=False):
+        # BaseHandler.load_middleware reads settings.MIDDLEWARE and offers no
+        # other way in; it runs once, when the handler is created
+        with override_settings(MIDDLEWARE=settings.API_MIDDLEWARE):
+            super().load_middleware(is_async)
+
+    async def get_response_async(self, request):
+        request.urlconf = settings.API_URLCONF
+        return await super().get_response_async(request)
+
+
+def is_admin(path):
+    return path == "/admin" or path.startswith(("/admin/", "/" + settings.STATIC_URL.lstrip("/")))
+
+
+def get_application(default):
+    """One ASGI callable sending the admin and static files to ``default``
+    (Django's handler, with the full MIDDLEWARE) and everything else to an
+    ``APIHandler``."""
+    api = APIHandler()
+
+    async def application(scope, receive, send):
+        handler = default if scope["type"] == "http" and is_admin(scope["path"]) else api
+        await handler(scope, receive, send)
+
+    return application
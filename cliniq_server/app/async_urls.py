@@ -0,0 +1,14 @@
+from django.urls import path
+from app import urls, views
+
+
+# The API as served under ASGI (settings.API_URLCONF): the polled endpoints
+# and device_push by their async views, everything else as in app.urls.
+urlpatterns = [
+    path("get_connections", views.aget_connections),
+    path("has_device", views.ahas_device),
+    path("is_premium", views.ais_premium),
+    path("device_push", views.adevice_push_data),
+    path("user_profile", views.auser_profile),
+    path("get_vitals", views.aget_vitals),
+] + urls.urlpatterns
@@ -0,0 +1,106 @@
+"""
+Login tokens.
+
+Passwords are stored salted and slow-hashed by Django's password hashers
+(``settings.PASSWORD_HASHERS``), and only ``login`` verifies one. A
+successful login returns a token signed with ``SECRET_KEY`` through
+``django.core.signing``. The token names the user, their own device, the
+devices whose vitals they may see and whether they are on the premium plan
+(for ``app/ratelimit.py``), and expires after
+``settings.TOKEN_MAX_AGE`` seconds. ``TokenMiddleware`` checks an
+``Authorization: Bearer <token>`` header and sets ``request.claims``, so the
+reads take the viewer and devices from there instead of looking them up.
+Requests without a token keep working from ``?username=``.
+
+A token also carries its user's ``token_version``. ``revoke_tokens`` bumps
+the version, and the middleware rejects any token whose version differs from
+the one in the user's cached ``AccessMap`` (``app/access.py``), so revocation
+costs no query per request and reaches other workers within
+``ACCESS_CACHE_TTL``. A grant or device change reaches its holder on the
+next ``refresh_token`` or login, and within ``TOKEN_MAX_AGE`` at the latest.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.http import JsonResponse
+
+from app import access
+
+
+SALT = "cliniq.auth.token"
+
+
+class Claims:
+    __slots__ = ("user_id", "username", "own_device", "devices", "premium", "version")
+
+    def __init__(self, user_id, username, own_device, devices, premium=False, version=0):
+        self.user_id = user_id
+        self.username = username
+        self.own_device = own_device
+        self.devices = tuple(devices)
+        self.premium = premium
+        self.version = version
+
+
+def issue(user_id, access_map, premium=False):
+    return signing.dumps(
+        {"u": user_id, "n": access_map.viewer, "o": access_map.own_device, "d": list(access_map.devices), "p": premium,
+         "v": access_map.token_version},
+        salt=SALT, compress=True,
+    )
+
+
+def verify(token):
+    """Claims of ``token``; raises ``signing.BadSignature`` (or its subclass
+    ``SignatureExpired``) if it was not issued here or is too old."""
+    payload = signing.loads(token, salt=SALT, max_age=settings.TOKEN_MAX_AGE)
+    return Claims(payload["u"], payload["n"], payload["o"], payload["d"], payload.get("p", False), payload.get("v", 0))
+
+
+def viewer(request):
+    """The requesting user: the token's when there is one, else ``?username=``."""
+    claims = request.claims
+    return claims.username if claims is not None else request.GET["username"]
+
+
+class TokenMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        rejected = self.authenticate(request)
+        if rejected is None and request.claims is not None:
+            rejected = self.check_version(request.claims, access.get_map(request.claims.username))
+        return rejected or self.get_response(request)
+
+    async def __acall__(self, request):
+        rejected = self.authenticate(request)
+        if rejected is None and request.claims is not None:
+            rejected = self.check_version(request.claims, await access.aget_map(request.claims.username))
+        return rejected or await self.get_response(request)
+
+    def authenticate(self, request):
+        request.claims = None
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme != "Bearer":
+            return None
+        try:
+            request.claims = verify(token.strip())
+        except signing.SignatureExpired:
+            return JsonResponse({"success": False, "error": "token expired"}, status=401)
+        except signing.BadSignature:
+            return JsonResponse({"success": False, "error": "invalid token"}, status=401)
+        return None
+
+    def check_version(self, claims, access_map):
+        if claims.version != access_map.token_version:
+            return JsonResponse({"success": False, "error": "token revoked"}, status=401)
+        return None
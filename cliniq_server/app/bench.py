@@ -0,0 +1,79 @@
+"""
+Helpers shared by the ``bench_*`` management commands.
+"""
+
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import override_settings
+
+from app import ingest, rollups
+
+
+@contextmanager
+def scratch_database():
+    """Run the block against a throwaway, file-backed copy of the schema so
+    benchmarks never write to the real database and SQLite pays real disk
+    locking costs rather than in-memory ones. Rate limits are off inside, as
+    benchmarks send far more requests per user than a client would."""
+    with tempfile.TemporaryDirectory() as tmp, override_settings(RATE_LIMIT_ENABLED=False):
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        previous_name = test_settings.get("NAME")
+        if connection.vendor == "sqlite":
+            test_settings["NAME"] = os.path.join(tmp, "bench.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            # land buffered writes now rather than in an atexit hook that
+            # would find the scratch database gone
+            ingest.get_buffer().drain()
+            rollups.get_accumulator().flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings["NAME"] = previous_name
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def rate(count, seconds):
+    return count / seconds if seconds else float("inf")
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, seconds):
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput": rate(len(latencies), seconds),
+        "mean": sum(latencies) / len(latencies) if latencies else None,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def rss_bytes():
+    """Current resident set size, or the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
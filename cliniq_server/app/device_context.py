@@ -0,0 +1,102 @@
+"""
+Per-device inputs for BP inference.
+
+A device's readings are scored with the age and gender of the ``UserProfile``
+that registered it (``set_device_id``). Devices without an owner, or owners
+without age/gender on file, fall back to the ``Config`` singleton. Contexts
+are kept in memory so ``device_push`` does not query for them; saving or
+deleting a profile or the Config clears the cache (see ``apps.py``), and
+``settings.DEVICE_CONTEXT_TTL`` bounds staleness across worker processes.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+from app.models import Config, UserProfile
+
+
+# UserProfile.gender is stored lowercased at signup; the model takes an int.
+GENDER_CODES = {"male": 1, "m": 1, "female": 0, "f": 0}
+
+
+class DeviceContext:
+    __slots__ = ("age", "gender", "owner")
+
+    def __init__(self, age, gender, owner=None):
+        self.age = age
+        self.gender = gender
+        self.owner = owner
+
+
+_contexts = {}
+_default = None
+_lock = threading.Lock()
+
+
+def default_context():
+    global _default
+    entry = _default
+    if entry is not None and time.monotonic() - entry[1] < settings.DEVICE_CONTEXT_TTL:
+        return entry[0]
+    config = Config.objects.all()[0]
+    context = DeviceContext(config.age, config.gender)
+    _default = (context, time.monotonic())
+    return context
+
+
+def from_profile(username, age, gender):
+    gender = GENDER_CODES.get((gender or "").strip().lower())
+    if age is None or gender is None:
+        default = default_context()
+        age = default.age if age is None else age
+        gender = default.gender if gender is None else gender
+    return DeviceContext(age, gender, username)
+
+
+def get_contexts(device_ids):
+    """Context per device id, loading every uncached one in a single query."""
+    now = time.monotonic()
+    found = {}
+    missing = []
+    for device_id in device_ids:
+        entry = _contexts.get(device_id)
+        if entry is not None and now - entry[1] < settings.DEVICE_CONTEXT_TTL:
+            found[device_id] = entry[0]
+        else:
+            missing.append(device_id)
+    if missing:
+        loaded = {}
+        for device_id, username, age, gender in UserProfile.objects.filter(device_id__in=missing).order_by("id").values_list(
+            "device_id", "username", "age", "gender",
+        ):
+            loaded[device_id] = from_profile(username, age, gender)  # newest registration wins
+        with _lock:
+            for device_id in missing:
+                context = loaded.get(device_id) or default_context()
+                _contexts[device_id] = (context, now)
+                found[device_id] = context
+    return found
+
+
+def get_context(device_id):
+    return get_contexts([device_id])[device_id]
+
+
+def invalidate(*device_ids):
+    """Forget the contexts of ``device_ids``, or every context (and the
+    Config fallback) if none are given."""
+    global _default
+    with _lock:
+        if not device_ids:
+            _contexts.clear()
+            _default = None
+        for device_id in device_ids:
+            _contexts.pop(device_id, None)
+
+
+def profile_changed(sender, **kwargs):
+    # the old device id of a re-registered device is not known here, and
+    # profile edits are rare: start over
+    invalidate()
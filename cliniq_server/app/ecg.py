@@ -0,0 +1,73 @@
+"""
+Packed binary ECG frames.
+
+A frame is a 10-byte header followed by little-endian int16 samples::
+
+    magic  "EC"      2 bytes
+    flags  uint8     bit 0: delta-encoded, bit 1: zlib-compressed
+    rate   uint16    samples per second (settings.ECG_SAMPLE_RATE at write time)
+    count  uint32    number of samples
+    (pad)  1 byte    keeps the sample payload 2-byte aligned
+
+Raw frames decode zero-copy with ``np.frombuffer``; delta and zlib frames
+trade one decoding pass for a smaller row.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+
+HEADER = struct.Struct("<2sBHIx")
+MAGIC = b"EC"
+DELTA = 0x01
+ZLIB = 0x02
+ENCODINGS = {"raw": 0, "delta": DELTA, "delta+zlib": DELTA | ZLIB}
+SAMPLE_DTYPE = np.dtype("<i2")
+
+
+def encode(samples, sample_rate, encoding="raw"):
+    samples = np.asarray(samples, dtype=SAMPLE_DTYPE)
+    flags = ENCODINGS[encoding]
+    if flags & DELTA:
+        samples = np.diff(samples, prepend=SAMPLE_DTYPE.type(0)).astype(SAMPLE_DTYPE)
+    payload = samples.tobytes()
+    if flags & ZLIB:
+        compressed = zlib.compress(payload)
+        if len(compressed) < len(payload):
+            payload = compressed
+        else:
+            flags &= ~ZLIB
+    return HEADER.pack(MAGIC, flags, sample_rate, len(samples)) + payload
+
+
+def header(blob):
+    magic, flags, sample_rate, count = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("not an ECG frame")
+    return flags, sample_rate, count
+
+
+def decode(blob):
+    """int16 samples of a frame; an empty array for a missing frame."""
+    if not blob:
+        return np.empty(0, dtype=SAMPLE_DTYPE)
+    flags, _, count = header(blob)
+    if flags & ZLIB:
+        samples = np.frombuffer(zlib.decompress(memoryview(blob)[HEADER.size:]), dtype=SAMPLE_DTYPE, count=count)
+    else:
+        samples = np.frombuffer(blob, dtype=SAMPLE_DTYPE, count=count, offset=HEADER.size)
+    if flags & DELTA:
+        samples = np.cumsum(samples, dtype=SAMPLE_DTYPE)
+    return samples
+
+
+def parse_text(text):
+    """Samples from the comma-separated (optionally bracketed) text form used
+    by query strings and the old ``ecg_sensor_frame`` column."""
+    text = (text or "").strip().strip("[]")
+    if not text:
+        return np.empty(0, dtype=SAMPLE_DTYPE)
+    values = np.array([int(float(value)) for value in text.split(",")], dtype=np.int64)
+    return np.clip(values, -32768, 32767).astype(SAMPLE_DTYPE)
@@ -0,0 +1,59 @@
+"""
+Time-range reads over one device's ``DeviceRecords``.
+
+Pages are fetched with keyset pagination on (timestamp, id) so every page is
+an index range scan on ``devicerecords_device_time``, however deep the page.
+Readings moved to the archive tier (app/archive.py) keep their ids and are
+merged in on the same key.
+"""
+
+import datetime
+
+from django.db.models import Q
+
+from app import archive
+from app.models import DeviceRecords
+
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+FIELDS = ("id", "timestamp", "temp", "heart_rate", "blood_oxygen", "sbp", "dbp")
+
+
+def encode_cursor(timestamp, pk):
+    return "%d-%d" % ((timestamp - EPOCH) // datetime.timedelta(microseconds=1), pk)
+
+
+def decode_cursor(cursor):
+    micros, pk = cursor.split("-")
+    return EPOCH + datetime.timedelta(microseconds=int(micros)), int(pk)
+
+
+def from_unix(value):
+    return datetime.datetime.fromtimestamp(float(value), datetime.timezone.utc)
+
+
+def page(device_id, start, end, limit=500, cursor=None):
+    """Readings for ``device_id`` with ``start <= timestamp < end``, oldest
+    first. Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the
+    last page."""
+    records = DeviceRecords.objects.filter(device_id=device_id, timestamp__gte=start, timestamp__lt=end)
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        records = records.filter(Q(timestamp__gt=after[0]) | Q(timestamp=after[0], id__gt=after[1]))
+
+    rows = list(records.order_by("timestamp", "id").values(*FIELDS)[:limit + 1])
+    # nothing before the cursor is wanted, so skip the day files before its day
+    archived = archive.rows(device_id, max(start, after[0]) if after else start, end, limit + 1, after)
+    if archived:
+        # a row caught mid-archival can be in both tiers for a moment
+        merged = {row["id"]: row for row in archived + rows}
+        rows = sorted(merged.values(), key=lambda row: (row["timestamp"], row["id"]))[:limit + 1]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    for row in rows:
+        row["timestamp"] = row["timestamp"].timestamp()
+        del row["id"]
+    return rows, next_cursor
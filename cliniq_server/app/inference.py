@@ -0,0 +1,242 @@
+"""
+Blood pressure inference service.
+
+Concurrent ``getBP`` calls are coalesced by a single worker thread into one
+vectorized model call per micro-batch, and results are kept in a bounded LRU
+cache keyed on the quantized input, since a resting patient's readings repeat.
+
+The model itself sits behind a predictor backend chosen by
+``settings.BP_PREDICTOR``. Backends load lazily, on first use or from
+``warm_up()``, so importing the app never pays TensorFlow's startup cost.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, SimpleQueue
+
+import numpy as np
+from django.conf import settings
+
+
+MODEL_DIR = os.path.abspath(os.path.dirname(__file__))
+KERAS_MODEL_PATH = os.path.join(MODEL_DIR, "model.keras")
+NUMPY_MODEL_PATH = os.path.join(MODEL_DIR, "model.npz")
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "tanh": np.tanh,
+}
+
+
+class LazyPredictor:
+    def __init__(self, path):
+        self.path = path
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+        return self
+
+    def __call__(self, x):
+        if not self._loaded:
+            self.load()
+        return self._predict(x)
+
+
+class KerasPredictor(LazyPredictor):
+    def __init__(self, path=KERAS_MODEL_PATH):
+        super().__init__(path)
+
+    def _load(self):
+        import tensorflow as tf
+        self.model = tf.keras.models.load_model(self.path)
+
+    def _predict(self, x):
+        return self.model(x, training=False).numpy()
+
+
+class NumpyPredictor(LazyPredictor):
+    """Dense stack exported by ``manage.py export_bp_model``, evaluated with
+    plain matmuls. Needs only NumPy at serve time."""
+
+    def __init__(self, path=NUMPY_MODEL_PATH):
+        super().__init__(path)
+
+    def _load(self):
+        with np.load(self.path, allow_pickle=False) as data:
+            self.layers = [
+                (data["kernel_%d" % i], data["bias_%d" % i], ACTIVATIONS[str(name)])
+                for i, name in enumerate(data["activations"])
+            ]
+
+    def _predict(self, x):
+        for kernel, bias, activation in self.layers:
+            x = activation(x @ kernel + bias)
+        return x
+
+
+PREDICTORS = {
+    "keras": KerasPredictor,
+    "numpy": NumpyPredictor,
+}
+
+
+def quantize(age, gender, spo2, bpm, temp):
+    return int(age), int(gender), int(spo2), int(bpm), round(float(temp), 1)
+
+
+class LRUCache:
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class BPInferenceEngine:
+    """``predict_batch`` maps an (n, 5) float32 array of
+    (age, gender, spo2, bpm, temp) rows to an (n, 2) array of (sbp, dbp)."""
+
+    def __init__(self, predict_batch, max_batch=64, max_wait=0.005, cache_size=4096):
+        self.predict_batch = predict_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cache = LRUCache(cache_size)
+
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+
+        self._queue = SimpleQueue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def predict(self, age, gender, spo2, bpm, temp):
+        return self.predict_many([(age, gender, spo2, bpm, temp)])[0]
+
+    def predict_many(self, rows):
+        results = [None] * len(rows)
+        pending = {}
+        for i, row in enumerate(rows):
+            key = quantize(*row)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.hits += 1
+                results[i] = cached
+            else:
+                self.misses += 1
+                pending.setdefault(key, []).append(i)
+
+        if pending:
+            self._start_worker()
+            futures = {}
+            for key in pending:
+                futures[key] = Future()
+                self._queue.put((key, futures[key]))
+            for key, indices in pending.items():
+                value = futures[key].result()
+                for i in indices:
+                    results[i] = value
+        return results
+
+    def _start_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="bp-inference", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            waiting = {}
+            for key, future in batch:
+                waiting.setdefault(key, []).append(future)
+            keys = list(waiting)
+            try:
+                preds = self.predict_batch(np.array(keys, dtype=np.float32))
+                self.batches += 1
+            except Exception as exc:
+                for futures in waiting.values():
+                    for future in futures:
+                        future.set_exception(exc)
+                continue
+            for key, pred in zip(keys, preds):
+                value = (float(pred[0]), float(pred[1]))
+                self.cache.put(key, value)
+                for future in waiting[key]:
+                    future.set_result(value)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = BPInferenceEngine(
+                PREDICTORS[settings.BP_PREDICTOR](),
+                max_batch=settings.BP_BATCH_SIZE,
+                max_wait=settings.BP_BATCH_WAIT,
+                cache_size=settings.BP_CACHE_SIZE,
+            )
+        return _engine
+
+
+_executor = None
+
+
+def get_executor():
+    """Threads that async views hand blocking BP inference to, so the event
+    loop keeps serving other requests meanwhile."""
+    global _executor
+    with _engine_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.BP_EXECUTOR_WORKERS, thread_name_prefix="bp-inference")
+        return _executor
+
+
+def warm_up():
+    """Load the configured model in the background so the first push does not
+    wait on it. Called from the WSGI/ASGI entry points, never from imports."""
+    if settings.BP_PREDICTOR in PREDICTORS and settings.BP_PREDICTOR_WARMUP:
+        threading.Thread(target=get_engine().predict_batch.load, name="bp-warmup", daemon=True).start()
@@ -0,0 +1,228 @@
+"""
+In-process write buffer for device telemetry.
+
+Readings are queued in memory and written by a background flusher thread
+through a single ``bulk_create`` per batch, so a busy fleet costs one SQLite
+write transaction per flush instead of one per reading. A batch whose write
+fails (say the database is locked) stays queued, counting against the
+capacity, and is retried a few times with backoff before it is dropped.
+
+``make_records`` turns raw pushes into ``DeviceRecords`` (BP inference,
+device context, packed ECG). It lives here rather than in the views so
+``drain_ingest_log`` can use it without importing them.
+"""
+
+import atexit
+import collections
+import datetime
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from app import device_context, ecg, inference, metrics
+from app.models import DeviceRecords
+
+
+logger = logging.getLogger(__name__)
+
+
+class BufferFull(Exception):
+    pass
+
+
+class WriteBuffer:
+    def __init__(self, flush_size=500, max_age=1.0, capacity=10000, model=DeviceRecords, retries=3, retry_delay=0.5):
+        self.flush_size = flush_size
+        self.max_age = max_age
+        self.capacity = capacity
+        self.model = model
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        self.rows_written = 0
+        self.flushes = 0
+        self.rows_dropped = 0
+
+        self._rows = []
+        self._oldest = None
+        self._in_flight = 0
+        self._failed = collections.deque()  # (rows, attempts so far, retry at)
+        self._failed_rows = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._flusher = None
+
+    def __len__(self):
+        with self._lock:
+            return self._pending()
+
+    def put(self, rows, timeout=0.5):
+        """Queue ``rows`` (unsaved model instances), blocking up to ``timeout``
+        seconds while the buffer is full. Raises ``BufferFull`` on expiry."""
+        if len(rows) > self.capacity:
+            raise ValueError("batch of %d rows exceeds buffer capacity %d" % (len(rows), self.capacity))
+
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._pending() + len(rows) > self.capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise BufferFull()
+                self._not_full.wait(remaining)
+
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            self._start_flusher()
+            self._wakeup.notify()
+
+    def flush(self):
+        """Write everything queued so far, failed batches included, from the
+        calling thread. Returns the number of rows written."""
+        with self._lock:
+            batches = [(rows, attempts) for rows, attempts, _ in self._failed]
+            self._failed.clear()
+            self._in_flight += self._failed_rows
+            self._failed_rows = 0
+            batches.append((self._take(), 0))
+        return sum(len(rows) for rows, attempts in batches if self._write(rows, attempts))
+
+    def drain(self):
+        """Flush and wait until background writes in progress have landed."""
+        self.flush()
+        with self._lock:
+            while self._pending():
+                self._not_full.wait()
+
+    def _pending(self):
+        return len(self._rows) + self._in_flight + self._failed_rows
+
+    def _start_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+            self._flusher.start()
+
+    def _take(self):
+        rows, self._rows = self._rows, []
+        self._oldest = None
+        self._in_flight += len(rows)
+        return rows
+
+    def _seconds_until_due(self):
+        waits = []
+        if self._failed:
+            waits.append(self._failed[0][2] - time.monotonic())
+        if self._rows:
+            waits.append(0 if len(self._rows) >= self.flush_size else self.max_age - (time.monotonic() - self._oldest))
+        return min(waits) if waits else None
+
+    def _next_batch(self):
+        # a failed batch is retried on its own, so one bad row can't sink newer ones
+        if self._failed and self._failed[0][2] <= time.monotonic():
+            rows, attempts, _ = self._failed.popleft()
+            self._failed_rows -= len(rows)
+            self._in_flight += len(rows)
+            return rows, attempts
+        return self._take(), 0
+
+    def _run(self):
+        while True:
+            with self._lock:
+                wait = self._seconds_until_due()
+                while wait is None or wait > 0:
+                    self._wakeup.wait(wait)
+                    wait = self._seconds_until_due()
+                rows, attempts = self._next_batch()
+            self._write(rows, attempts)
+
+    def _write(self, rows, attempts=0):
+        """Write one batch; on failure queue it for another try, up to
+        ``retries`` of them with a doubling delay, then drop it."""
+        if not rows:
+            return False
+        retry = False
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create(rows, batch_size=self.flush_size)
+            self.rows_written += len(rows)
+            self.flushes += 1
+            return True
+        except Exception:
+            retry = attempts < self.retries
+            if retry:
+                logger.exception("flush of %d buffered rows failed, retry %d of %d", len(rows), attempts + 1, self.retries)
+            else:
+                self.rows_dropped += len(rows)
+                logger.exception("dropping %d buffered rows after %d failed flushes", len(rows), attempts + 1)
+            return False
+        finally:
+            with self._lock:
+                self._in_flight -= len(rows)
+                if retry:
+                    self._failed.append((rows, attempts + 1, time.monotonic() + self.retry_delay * 2 ** attempts))
+                    self._failed_rows += len(rows)
+                    self._start_flusher()
+                    self._wakeup.notify()
+                self._not_full.notify_all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = WriteBuffer(
+                flush_size=getattr(settings, "INGEST_FLUSH_SIZE", 500),
+                max_age=getattr(settings, "INGEST_FLUSH_AGE", 1.0),
+                capacity=getattr(settings, "INGEST_BUFFER_CAPACITY", 10000),
+                retries=getattr(settings, "INGEST_FLUSH_RETRIES", 3),
+                retry_delay=getattr(settings, "INGEST_FLUSH_RETRY_DELAY", 0.5),
+            )
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+def getBP(age, gender, spo2, bpm, temp):
+    return getBPs([(age, gender, spo2, bpm, temp)])[0]
+
+
+def getBPs(rows):
+    start = time.perf_counter()
+    if settings.BP_PREDICTOR in inference.PREDICTORS:
+        bps = inference.get_engine().predict_many(rows)
+    else:
+        bps = [(random.randint(110, 130), random.randint(70, 90)) for _ in rows]
+    metrics.add_inference_time(time.perf_counter() - start)
+    return bps
+
+
+def pack_ecg(samples):
+    if len(samples) == 0:
+        return None
+    return ecg.encode(samples, settings.ECG_SAMPLE_RATE, settings.ECG_ENCODING)
+
+
+def make_records(readings):
+    # readings: (device_id, unix_ts, spo2, bpm, temp, ecg_samples) tuples
+    contexts = device_context.get_contexts({reading[0] for reading in readings})
+    bps = getBPs([
+        (contexts[device_id].age, contexts[device_id].gender, spo2, bpm, temp)
+        for device_id, _, spo2, bpm, temp, _ in readings
+    ])
+    records = []
+    for (device_id, ts, spo2, bpm, temp, samples), (sbp, dbp) in zip(readings, bps):
+        context = contexts[device_id]
+        records.append(DeviceRecords(
+            device_id=device_id,
+            timestamp=datetime.datetime.fromtimestamp(ts, datetime.timezone.utc),
+            age=context.age, gender=context.gender, blood_oxygen=spo2, heart_rate=bpm, temp=temp, sbp=sbp, dbp=dbp, ecg_frame=pack_ecg(samples)
+        ))
+    return records
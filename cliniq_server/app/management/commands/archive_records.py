@@ -0,0 +1,51 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app import archive
+from app.models import DeviceRecords
+
+
+class Command(BaseCommand):
+    help = (
+        "Move DeviceRecords older than RETENTION_DAYS into per-device, per-day archive files and delete "
+        "them from the database. Safe to rerun: a day already archived is merged, not duplicated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="retention horizon, defaults to settings.RETENTION_DAYS")
+        parser.add_argument("--device", help="only archive this device_id")
+        parser.add_argument("--chunk-size", type=int, default=500, help="rows per DELETE")
+
+    def handle(self, *args, **options):
+        days = settings.RETENTION_DAYS if options["days"] is None else options["days"]
+        # whole UTC days only, so a day file is never written while that day is still hot
+        cutoff = (timezone.now() - datetime.timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        old = DeviceRecords.objects.filter(timestamp__lt=cutoff).exclude(device_id=None)
+        if options["device"]:
+            old = old.filter(device_id=options["device"])
+
+        archived = files = 0
+        for device_id in list(old.values_list("device_id", flat=True).distinct()):
+            device_old = old.filter(device_id=device_id)
+            while True:
+                oldest = device_old.order_by("timestamp").values_list("timestamp", flat=True).first()
+                if oldest is None:
+                    break
+                day_start = oldest.replace(hour=0, minute=0, second=0, microsecond=0)
+                rows = list(device_old.filter(
+                    timestamp__gte=day_start, timestamp__lt=day_start + datetime.timedelta(days=1),
+                ).order_by("timestamp", "id").values_list(*archive.FIELDS))
+                # the file is durable before any row goes, so a crash in
+                # between leaves rows in both tiers, never in neither
+                archive.write_day(device_id, day_start.date(), rows)
+                ids = [row[0] for row in rows]
+                for i in range(0, len(ids), options["chunk_size"]):
+                    DeviceRecords.objects.filter(id__in=ids[i:i + options["chunk_size"]]).delete()
+                archived += len(rows)
+                files += 1
+
+        self.stdout.write("archived %d records older than %s into %d day files under %s" % (
+            archived, cutoff.date().isoformat(), files, settings.ARCHIVE_DIR))
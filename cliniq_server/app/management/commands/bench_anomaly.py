@@ -0,0 +1,57 @@
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.anomaly import METRICS, AnomalyDetector
+from app.bench import Timer, rate
+
+
+class Command(BaseCommand):
+    help = (
+        "Score simulated 1 Hz vitals from fleets of increasing size with the batched anomaly detector "
+        "and report readings/second, to show the per-reading cost stays flat as devices are added."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--devices", type=int, nargs="+", default=[100, 1000, 10000])
+        parser.add_argument("--ticks", type=int, default=60, help="readings per device, delivered one tick per batch")
+        parser.add_argument("--burst", type=int, default=10, help="readings per device in the bulk-upload case")
+        parser.add_argument("--anomaly-rate", type=float, default=0.001)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        baseline = np.array([72, 97, 36.7, 120, 80], dtype=np.float64)
+        spread = np.array([5, 1, 0.2, 6, 4], dtype=np.float64)
+
+        def readings(count):
+            values = baseline + rng.standard_normal((count, len(METRICS))) * spread
+            spikes = rng.random(count) < options["anomaly_rate"]
+            values[spikes, 0] += 60  # heart rate spike
+            return values
+
+        self.stdout.write("%-8s %-6s %10s %12s %12s %8s" % ("devices", "batch", "readings", "readings/s", "us/reading", "alerts"))
+        for devices in options["devices"]:
+            device_ids = ["device-%d" % i for i in range(devices)]
+            detector = AnomalyDetector(bands=settings.ANOMALY_BANDS, warmup=30)
+
+            # steady state: every device reports once per tick
+            alerts = 0
+            with Timer() as ticks:
+                for tick in range(options["ticks"]):
+                    flags = detector.observe(device_ids, np.full(devices, float(tick)), readings(devices))
+                    alerts += int(flags.any(axis=1).sum())
+            total = devices * options["ticks"]
+            self.report(devices, "tick", total, ticks.elapsed, alerts)
+
+            # bulk uploads: several readings per device in one batch
+            burst_ids = device_ids * options["burst"]
+            with Timer() as burst:
+                flags = detector.observe(burst_ids, np.zeros(len(burst_ids)), readings(len(burst_ids)))
+            self.report(devices, "burst", len(burst_ids), burst.elapsed, int(flags.any(axis=1).sum()))
+
+            self.stdout.write("%-8d state  %d bytes/device" % (
+                devices, (detector._mean.nbytes + detector._var.nbytes + detector._count.nbytes) // len(detector._count)))
+
+    def report(self, devices, kind, count, seconds, alerts):
+        self.stdout.write("%-8d %-6s %10d %12.0f %12.2f %8d" % (
+            devices, kind, count, rate(count, seconds), seconds / count * 1e6, alerts))
@@ -0,0 +1,146 @@
+import asyncio
+import io
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.test import Client, override_settings
+
+from app.asgi import APIHandler
+from app.bench import scratch_database, summarize
+from app.models import Config, Connection, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the read-heavy endpoints and device_push in-process through Django's WSGI handler (one "
+        "thread per in-flight request), its ASGI handler (one event loop, same middleware and views) and "
+        "the API's ASGI handler (async views behind settings.API_MIDDLEWARE), at several concurrency "
+        "levels, and compare throughput and latency. The handlers are called directly, without a server "
+        "or the test client, so each side pays exactly what it would behind gunicorn or uvicorn."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=3000, help="requests per run")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128])
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--predictor", default=None, help="override settings.BP_PREDICTOR")
+        parser.add_argument("--endpoints", nargs="+", default=[
+            "get_vitals", "get_vitals", "user_profile", "is_premium", "has_device", "get_connections", "device_push",
+        ], help="request mix; repeat a name to weight it")
+
+    def handle(self, *args, **options):
+        with scratch_database(), override_settings(BP_PREDICTOR=options["predictor"] or settings.BP_PREDICTOR):
+            plan = self.build(options)
+            self.stdout.write("%-8s %11s %9s %10s %10s %10s %7s" % (
+                "mode", "concurrency", "req/s", "p50 ms", "p95 ms", "p99 ms", "errors"))
+            for concurrency in options["concurrency"]:
+                for mode, run in (
+                    ("wsgi", self.run_wsgi),
+                    ("asgi", lambda plan, concurrency: self.run_asgi(ASGIHandler(), plan, concurrency)),
+                    ("asgi-api", lambda plan, concurrency: self.run_asgi(APIHandler(), plan, concurrency)),
+                ):
+                    r = run(plan, concurrency)
+                    self.stdout.write("%-8s %11d %9.1f %10.2f %10.2f %10.2f %7d" % (
+                        mode, concurrency, r["throughput"], r["p50"] * 1000, r["p95"] * 1000, r["p99"] * 1000, r["errors"]))
+
+    def build(self, options):
+        Config.objects.create(age=30, gender=1)
+        UserProfile.objects.bulk_create(
+            UserProfile(surname="User", first_name="U%d" % i, username="user%d" % i, password="x",
+                        email="user%d@example.com" % i, age=30 + i % 40, gender="female" if i % 2 else "male",
+                        device_id="device-%d" % i)
+            for i in range(options["users"])
+        )
+        users = list(UserProfile.objects.all())
+        Connection.objects.bulk_create(
+            Connection(monitored=user, monitored_by=users[(i + 1) % len(users)], accepted=True)
+            for i, user in enumerate(users)
+        )
+        client = Client()
+        for i in range(options["users"]):
+            client.get("/device_push", {"device_id": "device-%d" % i, "spo2": 97, "bpm": 70, "temp": 36.6})
+
+        endpoints = options["endpoints"]
+        plan = []
+        for _ in range(options["requests"]):
+            i = random.randrange(options["users"])
+            endpoint = random.choice(endpoints)
+            if endpoint == "device_push":
+                params = {"device_id": "device-%d" % i, "spo2": random.randint(95, 100),
+                          "bpm": random.randint(60, 100), "temp": round(random.uniform(36.0, 37.5), 2)}
+            else:
+                params = {"username": "user%d" % i}
+            plan.append(("/" + endpoint, params))
+        return plan
+
+    def run_wsgi(self, plan, concurrency):
+        application = WSGIHandler()
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def call(path, params):
+            environ = {
+                "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": urlencode(params),
+                "SERVER_NAME": "localhost", "SERVER_PORT": "80", "HTTP_HOST": "localhost",
+                "wsgi.input": io.BytesIO(b""), "wsgi.url_scheme": "http",
+            }
+            statuses = []
+            start = time.perf_counter()
+            body = application(environ, lambda status, headers: statuses.append(int(status.split()[0])))
+            b"".join(body)
+            body.close()
+            elapsed = time.perf_counter() - start
+            status = statuses[0]
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += status >= 400
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for path, params in plan:
+                pool.submit(call, path, params)
+        return summarize(latencies, errors[0], time.perf_counter() - start)
+
+    def run_asgi(self, application, plan, concurrency):
+        latencies = []
+        errors = [0]
+
+        async def worker(queue):
+            while queue:
+                path, params = queue.pop()
+                scope = {
+                    "type": "http", "method": "GET", "path": path, "query_string": urlencode(params).encode(),
+                    "headers": [(b"host", b"localhost")], "server": ("localhost", 80), "client": ("127.0.0.1", 0),
+                }
+                statuses = []
+                messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+                async def receive():
+                    if messages:
+                        return messages.pop()
+                    await asyncio.Future()  # the client never disconnects
+
+                async def send(message):
+                    if message["type"] == "http.response.start":
+                        statuses.append(message["status"])
+
+                start = time.perf_counter()
+                await application(scope, receive, send)
+                latencies.append(time.perf_counter() - start)
+                errors[0] += statuses[0] >= 400
+
+        async def main():
+            queue = list(reversed(plan))
+            await asyncio.gather(*(worker(queue) for _ in range(concurrency)))
+
+        start = time.perf_counter()
+        asyncio.run(main())
+        return summarize(latencies, errors[0], time.perf_counter() - start)
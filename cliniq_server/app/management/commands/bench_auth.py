@@ -0,0 +1,91 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from app import access, auth
+from app.bench import Timer, scratch_database
+from app.models import Config, Connection, UserProfile
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Show where credential checks cost: the old plaintext login query against a slow-hash login, and "
+        "authenticated reads identified by ?username= (profile lookups) against the signed token from login."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--logins", type=int, default=5)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--endpoints", nargs="+", default=["get_history", "get_trend", "get_alerts", "get_vitals"])
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.run(options)
+
+    def run(self, options):
+        Config.objects.create(age=30, gender=1)
+        password = make_password("s3cret")  # one hash shared by all users keeps setup quick
+        UserProfile.objects.bulk_create(
+            UserProfile(surname="User", first_name="U%d" % i, username="user%d" % i, password=password,
+                        email="user%d@example.com" % i, device_id="device-%d" % i)
+            for i in range(options["users"])
+        )
+        users = list(UserProfile.objects.all())
+        Connection.objects.bulk_create(
+            Connection(monitored=user, monitored_by=users[(i + 1) % len(users)], accepted=True)
+            for i, user in enumerate(users)
+        )
+        client = Client()
+
+        self.stdout.write("%-26s %12s %10s" % ("login", "ms/login", "queries"))
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries), Timer() as timer:
+            for i in range(options["logins"]):
+                # what login did before: the password in a WHERE clause
+                UserProfile.objects.filter(username="user%d" % i, password="s3cret").exists()
+        self.stdout.write("%-26s %12.3f %10.1f" % ("plaintext query", timer.elapsed / options["logins"] * 1e3,
+                                                  queries.count / options["logins"]))
+        tokens = {}
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries), Timer() as timer:
+            for i in range(options["logins"]):
+                tokens["user%d" % i] = client.get("/login", {"username": "user%d" % i, "password": "s3cret"}).json()["token"]
+        self.stdout.write("%-26s %12.3f %10.1f" % ("hashed check + token", timer.elapsed / options["logins"] * 1e3,
+                                                  queries.count / options["logins"]))
+        for i in range(options["logins"], options["users"]):
+            tokens["user%d" % i] = auth.issue(users[i].id, access.get_map("user%d" % i))
+
+        token = next(iter(tokens.values()))
+        with Timer() as timer:
+            for _ in range(options["requests"]):
+                auth.verify(token)
+        self.stdout.write("token verification: %.1f us" % (timer.elapsed / options["requests"] * 1e6))
+
+        self.stdout.write("")
+        self.stdout.write("%-14s %-10s %12s %10s" % ("endpoint", "identity", "us/request", "queries"))
+        for endpoint in options["endpoints"]:
+            plan = ["user%d" % random.randrange(options["users"]) for _ in range(options["requests"])]
+            for identity in ("username", "token"):
+                access.invalidate()
+                queries = QueryCounter()
+                with connection.execute_wrapper(queries), Timer() as timer:
+                    for username in plan:
+                        if identity == "token":
+                            client.get("/" + endpoint, headers={"Authorization": "Bearer %s" % tokens[username]})
+                        else:
+                            client.get("/" + endpoint, {"username": username})
+                self.stdout.write("%-14s %-10s %12.1f %10.2f" % (
+                    endpoint, identity, timer.elapsed / len(plan) * 1e6, queries.count / len(plan)))
@@ -0,0 +1,44 @@
+import json
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app import ecg
+from app.bench import Timer
+
+
+def synthetic_frame(samples, rate, rng):
+    # PQRST-like spikes on a wandering baseline, scaled to a 12-bit ADC.
+    t = np.arange(samples) / rate
+    beat = np.exp(-((t % 0.8) - 0.3) ** 2 / 0.0002) * 1500
+    wave = 2048 + beat + 80 * np.sin(2 * np.pi * 0.3 * t) + rng.normal(0, 12, samples)
+    return wave.astype(np.int16)
+
+
+class Command(BaseCommand):
+    help = "Compare stored size and encode/decode cost of ECG frames as text against the packed binary encodings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--frames", type=int, default=2000)
+        parser.add_argument("--samples", type=int, default=settings.ECG_SAMPLE_RATE, help="samples per frame")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        rate = settings.ECG_SAMPLE_RATE
+        frames = [synthetic_frame(options["samples"], rate, rng) for _ in range(options["frames"])]
+
+        formats = {"text": (lambda f: json.dumps(f.tolist()), lambda blob: np.array(json.loads(blob), dtype=np.int16))}
+        for encoding in ecg.ENCODINGS:
+            formats[encoding] = (lambda f, e=encoding: ecg.encode(f, rate, e), ecg.decode)
+
+        self.stdout.write("%-12s %12s %14s %14s" % ("format", "bytes/frame", "encode/frame", "decode/frame"))
+        for name, (encode, decode) in formats.items():
+            with Timer() as enc:
+                blobs = [encode(f) for f in frames]
+            with Timer() as dec:
+                decoded = [decode(b) for b in blobs]
+            assert all(np.array_equal(a, b) for a, b in zip(frames, decoded))
+            self.stdout.write("%-12s %12.0f %12.1fus %12.1fus" % (
+                name, sum(len(b) for b in blobs) / len(blobs),
+                enc.elapsed / len(frames) * 1e6, dec.elapsed / len(frames) * 1e6))
@@ -0,0 +1,82 @@
+import datetime
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import AsyncClient, Client
+
+from app.bench import Timer, rate, rss_bytes, scratch_database
+from app.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill a scratch table with one device's 1 Hz readings and download them through /export_vitals "
+        "in each format, under the WSGI and the ASGI handler, reporting throughput and resident memory while "
+        "the export streams."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000_000)
+        parser.add_argument("--formats", nargs="+", default=["csv", "ndjson"])
+        parser.add_argument("--handlers", nargs="+", choices=["wsgi", "asgi"], default=["wsgi", "asgi"])
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            UserProfile.objects.create(surname="User", first_name="U", username="patient", password="x",
+                                       email="patient@example.com", device_id="device-1")
+            start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+            with Timer() as timer:
+                self.fill(options["rows"], start)
+            self.stdout.write("inserted %d rows in %.1f s" % (options["rows"], timer.elapsed))
+
+            self.stdout.write("%-8s %-8s %10s %12s %10s %14s %14s" % (
+                "handler", "format", "rows", "MB", "rows/s", "RSS start MB", "RSS peak MB"))
+            for handler in options["handlers"]:
+                for name in options["formats"]:
+                    download = self.download if handler == "wsgi" else async_to_sync(self.adownload)
+                    start_rss = rss_bytes()
+                    with Timer() as timer:
+                        size, lines, peak_rss = download(name)
+                    rows = lines - (name == "csv")  # header
+                    self.stdout.write("%-8s %-8s %10d %12.1f %10.0f %14.1f %14.1f" % (
+                        handler, name, rows, size / 1e6, rate(rows, timer.elapsed), start_rss / 1e6,
+                        max(start_rss, peak_rss) / 1e6))
+
+    def download(self, name):
+        size = lines = peak_rss = 0
+        response = Client().get("/export_vitals", {"username": "patient", "format": name})
+        for i, chunk in enumerate(response.streaming_content):
+            size += len(chunk)
+            lines += chunk.count(b"\n")
+            if i % 100 == 0:
+                peak_rss = max(peak_rss, rss_bytes())
+        return size, lines, peak_rss
+
+    async def adownload(self, name):
+        size = lines = peak_rss = i = 0
+        response = await AsyncClient().get("/export_vitals", {"username": "patient", "format": name})
+        async for chunk in response:  # as ASGIHandler.send_response reads it
+            size += len(chunk)
+            lines += chunk.count(b"\n")
+            if i % 100 == 0:
+                peak_rss = max(peak_rss, rss_bytes())
+            i += 1
+        return size, lines, peak_rss
+
+    def fill(self, count, start, chunk=200_000):
+        rng = np.random.default_rng(0)
+        base = np.datetime64(start.replace(tzinfo=None), "s")
+        for offset in range(0, count, chunk):
+            n = min(chunk, count - offset)
+            stamps = np.char.replace(np.datetime_as_string(base + np.arange(offset, offset + n), unit="s"), "T", " ")
+            columns = [
+                ["device-1"] * n, stamps.tolist(),
+                np.round(rng.uniform(36, 37.5, n), 2).tolist(), rng.integers(55, 110, n).tolist(),
+                rng.integers(92, 100, n).tolist(), rng.integers(105, 135, n).tolist(), rng.integers(65, 90, n).tolist(),
+            ]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(
+                    "INSERT INTO app_devicerecords (device_id, timestamp, temp, heart_rate, blood_oxygen, sbp, dbp) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s)", list(zip(*columns)))
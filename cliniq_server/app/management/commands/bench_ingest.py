@@ -0,0 +1,48 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from app.bench import Timer, rate, scratch_database
+from app.ingest import WriteBuffer
+from app.models import DeviceRecords
+
+
+def make_reading():
+    return DeviceRecords(
+        device_id="bench", age=30, gender=1,
+        blood_oxygen=random.randint(95, 100), heart_rate=random.randint(60, 100),
+        temp=round(random.uniform(36.0, 37.5), 2),
+        sbp=random.randint(110, 130), dbp=random.randint(70, 90),
+    )
+
+
+class Command(BaseCommand):
+    help = "Compare per-row DeviceRecords inserts with the buffered bulk_create path (rows/second)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--request-size", type=int, default=10, help="readings per bulk push")
+        parser.add_argument("--flush-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        request_size = options["request_size"]
+
+        with scratch_database():
+            with Timer() as per_row:
+                for _ in range(rows):
+                    make_reading().save()
+
+            buffer = WriteBuffer(flush_size=options["flush_size"], max_age=0.05, capacity=max(rows, request_size))
+            with Timer() as buffered:
+                for start in range(0, rows, request_size):
+                    buffer.put([make_reading() for _ in range(min(request_size, rows - start))], timeout=30)
+                buffer.drain()
+
+            written = DeviceRecords.objects.count()
+
+        self.stdout.write("rows per path:     %d (%d written)" % (rows, written))
+        self.stdout.write("per-row create:    %10.0f rows/s  (%.3fs)" % (rate(rows, per_row.elapsed), per_row.elapsed))
+        self.stdout.write("buffered bulk:     %10.0f rows/s  (%.3fs, %d flushes)" % (
+            rate(rows, buffered.elapsed), buffered.elapsed, buffer.flushes))
+        self.stdout.write("speedup:           %10.1fx" % (per_row.elapsed / buffered.elapsed))
@@ -0,0 +1,55 @@
+import json
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.inference import PREDICTORS
+
+
+# Runs in a fresh interpreter so import and load costs are measured cold.
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import numpy as np
+from app.inference import PREDICTORS
+t1 = time.perf_counter()
+predictor = PREDICTORS[sys.argv[1]]().load()
+t2 = time.perf_counter()
+x = np.array([[30, 1, 98, 72, 36.6]], dtype=np.float32)
+predictor(x)
+t3 = time.perf_counter()
+for _ in range(int(sys.argv[2])):
+    predictor(x)
+t4 = time.perf_counter()
+print(json.dumps({
+    "import": t1 - t0, "load": t2 - t1, "first": t3 - t2,
+    "steady": (t4 - t3) / int(sys.argv[2]),
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure cold start (import + model load) and per-call latency of each BP predictor backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("backends", nargs="*", default=list(PREDICTORS))
+        parser.add_argument("--calls", type=int, default=200)
+
+    def handle(self, *args, **options):
+        self.stdout.write("%-8s %10s %10s %10s %10s %12s" % ("backend", "process", "import", "load", "first", "steady"))
+        for backend in options["backends"]:
+            start = time.perf_counter()
+            proc = subprocess.run(
+                [sys.executable, "-c", PROBE, backend, str(options["calls"])],
+                cwd=settings.BASE_DIR, capture_output=True, text=True,
+            )
+            wall = time.perf_counter() - start
+            if proc.returncode != 0:
+                self.stdout.write("%-8s failed: %s" % (backend, proc.stderr.strip().splitlines()[-1]))
+                continue
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            self.stdout.write("%-8s %9.3fs %9.3fs %9.3fs %9.4fs %10.1fus" % (
+                backend, wall, r["import"], r["load"], r["first"], r["steady"] * 1e6))
@@ -0,0 +1,62 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from app.bench import Timer
+from app.presence import PresenceTracker
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate fleets of 1 Hz devices, a few of which drop out each second, and time presence upkeep: "
+        "recording pushes, sweeping expiries, and a caregiver's full and incremental status polls, next to "
+        "a scan of every device's last-seen time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--devices", type=int, nargs="+", default=[1000, 10000, 100000])
+        parser.add_argument("--seconds", type=int, default=20)
+        parser.add_argument("--dropout", type=float, default=0.001, help="share of devices going silent each second")
+        parser.add_argument("--monitored", type=int, default=50, help="devices per caregiver poll")
+
+    def handle(self, *args, **options):
+        self.stdout.write("%-8s %11s %11s %11s %11s %11s %8s" % (
+            "devices", "push us", "sweep us", "full us", "since us", "scan us", "changes"))
+        for devices in options["devices"]:
+            now = [0.0]
+            tracker = PresenceTracker(timeout=3, sweep_interval=0.5, clock=lambda: now[0])
+            device_ids = ["device-%d" % i for i in range(devices)]
+            monitored = random.sample(device_ids, options["monitored"])
+            silent = set()
+            pushes = push_time = sweep_time = full_time = since_time = scan_time = 0.0
+            changes = 0
+            cursor = None
+            for second in range(options["seconds"]):
+                now[0] = float(second)
+                silent.update(random.sample(device_ids, int(devices * options["dropout"])))
+                active = [device_id for device_id in device_ids if device_id not in silent]
+                with Timer() as timer:
+                    for device_id in active:
+                        tracker.seen(device_id)
+                push_time += timer.elapsed
+                pushes += len(active)
+
+                with Timer() as timer:
+                    tracker.sweep()
+                sweep_time += timer.elapsed
+                with Timer() as timer:
+                    tracker.status(monitored)
+                full_time += timer.elapsed
+                with Timer() as timer:
+                    cursor, changed, _ = tracker.status(monitored, cursor)
+                since_time += timer.elapsed
+                changes += len(changed)
+                with Timer() as timer:
+                    # the per-poll alternative: check every device's last-seen time
+                    [device_id for device_id, seen in tracker._last_seen.items() if now[0] - seen < tracker.timeout]
+                scan_time += timer.elapsed
+
+            seconds = options["seconds"]
+            self.stdout.write("%-8d %11.2f %11.1f %11.1f %11.1f %11.1f %8d" % (
+                devices, push_time / pushes * 1e6, sweep_time / seconds * 1e6, full_time / seconds * 1e6,
+                since_time / seconds * 1e6, scan_time / seconds * 1e6, changes))
@@ -0,0 +1,88 @@
+import json
+from urllib.parse import urlencode
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.http import QueryDict
+
+from app import ecg, push_protocol
+from app.bench import Timer
+
+
+# what the firmware's HTTPClient sends around each body
+GET_TEMPLATE = "GET /device_push?%s HTTP/1.1\r\nHost: cliniq2.pythonanywhere.com\r\nUser-Agent: ESP32HTTPClient\r\nConnection: close\r\n\r\n"
+POST_TEMPLATE = (
+    "POST /%s HTTP/1.1\r\nHost: cliniq2.pythonanywhere.com\r\nUser-Agent: ESP32HTTPClient\r\n"
+    "Connection: keep-alive\r\nContent-Type: %s\r\nContent-Length: %d\r\n\r\n"
+)
+
+
+def parse_query(query):
+    params = QueryDict(query)
+    return [(params.get("device_id"), int(params["spo2"]), int(params["bpm"]), float(params["temp"]), ecg.parse_text(params.get("ecg")))]
+
+
+def parse_json(body):
+    payload = json.loads(body)
+    device_id = payload.get("device_id")
+    return [
+        (device_id, float(ts), int(spo2), int(bpm), float(temp), samples[0] if samples else [])
+        for ts, spo2, bpm, temp, *samples in payload["readings"]
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the device push encodings on server-side parse cost and bytes on the wire: the firmware's "
+        "one-reading query string, the JSON bulk body and the binary push_protocol packet, with and without "
+        "ECG and at several coalescing factors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readings", type=int, default=20000)
+        parser.add_argument("--batch", type=int, nargs="+", default=[1, 10, 60], help="readings coalesced per push")
+        parser.add_argument("--ecg-samples", type=int, nargs="+", default=[0, 250])
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        device_id = "56781234"
+        self.stdout.write("%-7s %-6s %-6s %12s %12s %14s" % ("ecg", "format", "batch", "body B/rdg", "wire B/rdg", "parse us/rdg"))
+        for samples in options["ecg_samples"]:
+            readings = [
+                (seq, 1760000000 + seq, int(rng.integers(95, 100)), int(rng.integers(60, 100)),
+                 round(float(rng.uniform(36, 37.5)), 2), rng.integers(1800, 2400, samples).astype(np.int16))
+                for seq in range(options["readings"])
+            ]
+
+            queries = [urlencode({"device_id": device_id, "spo2": spo2, "bpm": bpm, "temp": temp,
+                                  **({"ecg": ",".join(map(str, ecg_samples.tolist()))} if samples else {})})
+                       for _, _, spo2, bpm, temp, ecg_samples in readings]
+            wire = sum(len(GET_TEMPLATE % query) for query in queries)
+            with Timer() as timer:
+                for query in queries:
+                    parse_query(query)
+            self.report(samples, "query", 1, sum(map(len, queries)), wire, timer.elapsed, len(readings))
+
+            for batch in options["batch"]:
+                chunks = [readings[i:i + batch] for i in range(0, len(readings), batch)]
+
+                bodies = [json.dumps({"device_id": device_id, "readings": [
+                    [ts, spo2, bpm, temp] + ([ecg_samples.tolist()] if samples else [])
+                    for _, ts, spo2, bpm, temp, ecg_samples in chunk
+                ]}).encode() for chunk in chunks]
+                self.compare(samples, "json", batch, bodies, parse_json, "device_push_bulk", "application/json", len(readings))
+
+                bodies = [push_protocol.encode(device_id, chunk) for chunk in chunks]
+                self.compare(samples, "binary", batch, bodies, push_protocol.decode, "device_push_binary",
+                             "application/octet-stream", len(readings))
+
+    def compare(self, samples, name, batch, bodies, parse, path, content_type, count):
+        wire = sum(len(POST_TEMPLATE % (path, content_type, len(body))) + len(body) for body in bodies)
+        with Timer() as timer:
+            for body in bodies:
+                parse(body)
+        self.report(samples, name, batch, sum(map(len, bodies)), wire, timer.elapsed, count)
+
+    def report(self, samples, name, batch, body_bytes, wire_bytes, seconds, count):
+        self.stdout.write("%-7d %-6s %-6d %12.1f %12.1f %14.2f" % (
+            samples, name, batch, body_bytes / count, wire_bytes / count, seconds / count * 1e6))
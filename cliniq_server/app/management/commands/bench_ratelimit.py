@@ -0,0 +1,70 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from app import ratelimit
+from app.bench import Timer, scratch_database
+from app.management.commands.bench_auth import QueryCounter
+from app.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Time token-bucket checks across key counts and threads (sharded against a single lock), then "
+        "what an over-quota request costs end to end compared with one that reaches its view."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keys", type=int, nargs="+", default=[1000, 100000])
+        parser.add_argument("--checks", type=int, default=200000)
+        parser.add_argument("--threads", type=int, nargs="+", default=[1, 8])
+        parser.add_argument("--requests", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.stdout.write("%-8s %-8s %-8s %12s %8s" % ("keys", "threads", "shards", "us/check", "kept"))
+        for keys in options["keys"]:
+            for threads in options["threads"]:
+                for shards in (ratelimit.SHARDS, 1):
+                    buckets = ratelimit.TokenBuckets(shards=shards, max_keys=keys)
+                    per_thread = options["checks"] // threads
+
+                    def work(offset):
+                        take = buckets.take
+                        for i in range(per_thread):
+                            take(("poll", (offset + i * 7919) % keys), 1.0, 20)
+
+                    workers = [threading.Thread(target=work, args=(n * 104729,)) for n in range(threads)]
+                    with Timer() as timer:
+                        for worker in workers:
+                            worker.start()
+                        for worker in workers:
+                            worker.join()
+                    kept = sum(len(shard.buckets) for shard in buckets._shards)
+                    self.stdout.write("%-8d %-8d %-8d %12.3f %8d" % (
+                        keys, threads, shards, timer.elapsed / (per_thread * threads) * 1e6, kept))
+
+        with scratch_database(), override_settings(RATE_LIMIT_ENABLED=True):
+            self.requests(options["requests"])
+
+    def requests(self, count):
+        UserProfile.objects.create(surname="User", first_name="U", username="user", password="x",
+                                   email="user@example.com", device_id="device-1")
+        client = Client()
+        logging.getLogger("django.request").setLevel(logging.ERROR)  # one warning per 429 otherwise
+        self.stdout.write("")
+        self.stdout.write("%-22s %12s %10s" % ("get_history", "us/request", "queries"))
+        for label, limits in (("served", {"history": (1e9, 1e9)}), ("rejected (429)", {"history": (1e-9, 1)})):
+            with override_settings(RATE_LIMITS=dict(settings.RATE_LIMITS, **limits)):
+                ratelimit.invalidate()
+                client.get("/get_history", {"username": "user"})  # spends the burst
+                queries = QueryCounter()
+                with connection.execute_wrapper(queries), Timer() as timer:
+                    for _ in range(count):
+                        response = client.get("/get_history", {"username": "user"})
+                self.stdout.write("%-22s %12.1f %10.2f   (last status %d)" % (
+                    label, timer.elapsed / count * 1e6, queries.count / count, response.status_code))
+
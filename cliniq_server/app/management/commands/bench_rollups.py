@@ -0,0 +1,48 @@
+import datetime
+import random
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from app import rollups
+from app.bench import Timer, scratch_database
+from app.models import DeviceRecords
+
+
+class Command(BaseCommand):
+    help = "Compare long-range chart query latency from rollups against scanning raw DeviceRecords."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=2, help="days of 1 Hz data to generate")
+        parser.add_argument("--points", type=int, default=500)
+
+    def handle(self, *args, **options):
+        end = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        start = end - datetime.timedelta(days=options["days"])
+
+        with scratch_database():
+            seconds = int((end - start).total_seconds())
+            for offset in range(0, seconds, 10000):
+                DeviceRecords.objects.bulk_create([
+                    DeviceRecords(
+                        device_id="bench", timestamp=start + datetime.timedelta(seconds=s),
+                        temp=round(random.uniform(36.0, 37.5), 2), heart_rate=random.randint(60, 100),
+                        blood_oxygen=random.randint(95, 100), sbp=random.randint(110, 130), dbp=random.randint(70, 90),
+                    )
+                    for s in range(offset, min(offset + 10000, seconds))
+                ])
+            with Timer() as rebuild:
+                call_command("rebuild_rollups", stdout=self.stdout)
+            self.stdout.write("rebuild: %.2fs for %d rows" % (rebuild.elapsed, seconds))
+
+            self.stdout.write("%8s %14s %10s %14s %10s %6s" % ("range", "raw scan", "rows", "rollup", "points", "res"))
+            for label, span in (("1h", 3600), ("1d", 86400), ("%dd" % options["days"], seconds)):
+                range_start = end - datetime.timedelta(seconds=span)
+                with Timer() as raw:
+                    rows = list(DeviceRecords.objects.filter(
+                        device_id="bench", timestamp__gte=range_start, timestamp__lt=end,
+                    ).values("timestamp", *rollups.METRICS))
+                with Timer() as rolled:
+                    resolution, points = rollups.trend("bench", range_start, end, options["points"])
+                self.stdout.write("%8s %12.1fms %10d %12.1fms %10d %6d" % (
+                    label, raw.elapsed * 1000, len(rows), rolled.elapsed * 1000, len(points), resolution))
@@ -0,0 +1,61 @@
+import asyncio
+import gc
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.bench import rate, rss_bytes
+from app.streaming import broker, event_stream
+
+
+class Command(BaseCommand):
+    help = "Open thousands of idle vitals streams in-process and report memory per connection and fan-out latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, nargs="+", default=[1000, 5000, 10000])
+        parser.add_argument("--devices", type=int, default=100, help="distinct devices the streams watch")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(sorted(options["connections"]), options["devices"]))
+
+    async def run(self, steps, device_count):
+        received = 0
+        all_received = asyncio.Event()
+        target = 0
+
+        async def consume(devices):
+            nonlocal received
+            async for frame in event_stream(devices, heartbeat=3600):
+                received += 1
+                if received >= target:
+                    all_received.set()
+
+        gc.collect()
+        baseline = rss_bytes()
+        tasks = []
+        self.stdout.write("%12s %12s %14s" % ("connections", "rss (MiB)", "bytes/conn"))
+        for step in steps:
+            while len(tasks) < step:
+                tasks.append(asyncio.ensure_future(consume(["device-%d" % (len(tasks) % device_count)])))
+            await asyncio.sleep(0.1)
+            gc.collect()
+            used = rss_bytes()
+            self.stdout.write("%12d %12.1f %14.0f" % (
+                broker.connection_count(), used / 2 ** 20, (used - baseline) / step))
+
+        target = len(tasks)
+
+        def publish_all():
+            for i in range(device_count):
+                broker.publish("device-%d" % i, {"timestamp": time.time(), "heart_rate": 72})
+
+        start = time.perf_counter()
+        await asyncio.to_thread(publish_all)
+        await asyncio.wait_for(all_received.wait(), 60)
+        elapsed = time.perf_counter() - start
+        self.stdout.write("fan-out of %d readings to %d streams: %.3fs (%.0f deliveries/s)" % (
+            device_count, target, elapsed, rate(target, elapsed)))
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from app import views
+from app.bench import Timer, rate, scratch_database
+from app.management.commands.bench_ingest import make_reading
+from app.models import DeviceRecords, UserProfile
+
+
+def table_scan_vitals(username):
+    # What get_vitals did before the latest-vitals cache.
+    UserProfile.objects.get(username=username)
+    return DeviceRecords.objects.last()
+
+
+class Command(BaseCommand):
+    help = "Measure get_vitals reads/second served from the latest-vitals cache against the old per-poll queries, as the table grows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+        parser.add_argument("--polls", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        polls = options["polls"]
+        request = RequestFactory().get("/get_vitals", {"username": "bench"})
+        request.claims = None  # set by TokenMiddleware, which a factory request skips
+
+        with scratch_database():
+            UserProfile.objects.create(
+                surname="Bench", first_name="Bench", username="bench", password="x",
+                email="bench@example.com", device_id="bench",
+            )
+            self.stdout.write("%12s %16s %16s" % ("rows", "per-poll query", "cached"))
+            for size in sorted(options["sizes"]):
+                missing = size - DeviceRecords.objects.count()
+                DeviceRecords.objects.bulk_create((make_reading() for _ in range(missing)), batch_size=1000)
+                views.vitals_cache.record_latest("bench", DeviceRecords.objects.last())
+
+                with Timer() as uncached:
+                    for _ in range(polls):
+                        table_scan_vitals("bench")
+                with Timer() as cached:
+                    for _ in range(polls):
+                        views.get_vitals(request)
+
+                self.stdout.write("%12d %12.0f r/s %12.0f r/s" % (
+                    size, rate(polls, uncached.elapsed), rate(polls, cached.elapsed)))
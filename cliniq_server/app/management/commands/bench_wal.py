@@ -0,0 +1,69 @@
+import io
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from app import wal
+from app.bench import Timer, rate, scratch_database, summarize
+from app.models import Config, DeviceRecords
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare device_push acknowledgement latency with INGEST_MODE=direct and INGEST_MODE=log "
+        "(fsynced before the ack), then time drain_ingest_log loading the log into the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pushes", type=int, default=2000, help="pushes per mode")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--devices", type=int, default=50)
+
+    def handle(self, *args, **options):
+        with scratch_database(), tempfile.TemporaryDirectory() as log_dir:
+            Config.objects.create(age=30, gender=1)
+            results = {}
+            for mode in ("direct", "log"):
+                with override_settings(INGEST_MODE=mode, INGEST_LOG_DIR=log_dir):
+                    wal._log = None  # pick up the temporary directory
+                    results[mode] = self.push(options)
+                    if wal._log is not None:
+                        wal._log.close()  # seal the segment so the drain can finish it
+                        wal._log = None
+            direct_rows = DeviceRecords.objects.count()
+
+            with Timer() as drain:
+                call_command("drain_ingest_log", directory=log_dir, once=True, batch_size=2000, stdout=io.StringIO())
+            drained = DeviceRecords.objects.count() - direct_rows
+
+        self.stdout.write("%-8s %8s %10s %10s %10s %10s" % ("mode", "pushes", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+        for mode, r in results.items():
+            self.stdout.write("%-8s %8d %10.1f %10.2f %10.2f %10.2f" % (
+                mode, r["count"], r["throughput"], r["p50"] * 1000, r["p95"] * 1000, r["p99"] * 1000))
+        self.stdout.write("drain:   %d readings in %.3fs (%.0f rows/s)" % (drained, drain.elapsed, rate(drained, drain.elapsed)))
+
+    def push(self, options):
+        latencies = []
+
+        def worker(count):
+            client = Client()
+            for _ in range(count):
+                params = {
+                    "device_id": "device-%d" % random.randrange(options["devices"]),
+                    "spo2": random.randint(95, 100), "bpm": random.randint(60, 100),
+                    "temp": round(random.uniform(36.0, 37.5), 2),
+                }
+                start = time.perf_counter()
+                client.get("/device_push", params)
+                latencies.append(time.perf_counter() - start)
+
+        per_worker = options["pushes"] // options["concurrency"]
+        with Timer() as total:
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+                list(pool.map(worker, [per_worker] * options["concurrency"]))
+        return summarize(latencies, 0, total.elapsed)
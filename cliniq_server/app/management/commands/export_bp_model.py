@@ -0,0 +1,37 @@
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from app.inference import ACTIVATIONS, KERAS_MODEL_PATH, NUMPY_MODEL_PATH, NumpyPredictor
+
+
+class Command(BaseCommand):
+    help = "Export the Keras BP model's Dense weights to an .npz file served by the numpy predictor (BP_PREDICTOR=numpy)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=KERAS_MODEL_PATH)
+        parser.add_argument("--output", default=NUMPY_MODEL_PATH)
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+
+        model = tf.keras.models.load_model(options["source"])
+        arrays = {}
+        activations = []
+        for layer in model.layers:
+            if isinstance(layer, tf.keras.layers.InputLayer):
+                continue
+            if not isinstance(layer, tf.keras.layers.Dense):
+                raise CommandError("cannot export layer %r of type %s" % (layer.name, type(layer).__name__))
+            activation = layer.get_config()["activation"]
+            if activation not in ACTIVATIONS:
+                raise CommandError("unsupported activation %r on layer %r" % (activation, layer.name))
+            kernel, bias = layer.get_weights()
+            arrays["kernel_%d" % len(activations)] = kernel.astype(np.float32)
+            arrays["bias_%d" % len(activations)] = bias.astype(np.float32)
+            activations.append(activation)
+
+        np.savez(options["output"], activations=np.array(activations), **arrays)
+
+        probe = np.array([[30, 1, 98, 72, 36.6]], dtype=np.float32)
+        drift = np.abs(NumpyPredictor(options["output"])(probe) - model(probe, training=False).numpy()).max()
+        self.stdout.write("wrote %d layers to %s (max drift vs keras: %.2e)" % (len(activations), options["output"], drift))
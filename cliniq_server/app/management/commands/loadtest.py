@@ -0,0 +1,147 @@
+import datetime
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from app.bench import scratch_database, summarize
+from app.models import Config, Connection, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the API in-process against a synthetic fleet: N devices pushing at 1 Hz while M dashboards "
+        "poll get_vitals and get_connections. Reports p50/p95/p99 latency and throughput per endpoint, "
+        "optionally saves them as JSON and flags regressions against an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--devices", type=int, default=50)
+        parser.add_argument("--dashboards", type=int, default=20)
+        parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+        parser.add_argument("--vitals-interval", type=float, default=3.0, help="seconds between get_vitals polls")
+        parser.add_argument("--connections-interval", type=float, default=5.0, help="seconds between get_connections polls")
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--output", help="write results to this JSON file")
+        parser.add_argument("--compare", help="JSON results of an earlier run to check for regressions")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown before flagging (0.2 = 20%%)")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            schedule = self.build_fleet(options)
+            results = self.run(schedule, options)
+
+        report = {
+            "started": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "config": {key: options[key] for key in (
+                "devices", "dashboards", "duration", "vitals_interval", "connections_interval", "workers")},
+            "endpoints": results,
+        }
+        self.print_report(results)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write("results written to %s" % options["output"])
+        if options["compare"]:
+            self.compare(results, options["compare"], options["tolerance"])
+
+    def build_fleet(self, options):
+        Config.objects.create(age=30, gender=1)
+        patients = [
+            UserProfile(surname="Patient", first_name="P%d" % i, username="patient%d" % i, password="x",
+                        email="patient%d@example.com" % i, device_id="device-%d" % i)
+            for i in range(options["devices"])
+        ]
+        UserProfile.objects.bulk_create(patients)
+        patients = list(UserProfile.objects.filter(username__startswith="patient"))
+        dashboards = []
+        for i in range(options["dashboards"]):
+            caregiver = UserProfile.objects.create(surname="Carer", first_name="C%d" % i, username="carer%d" % i,
+                                                   password="x", email="carer%d@example.com" % i)
+            watched = random.sample(patients, min(3, len(patients)))
+            Connection.objects.bulk_create(
+                Connection(monitored=p, monitored_by=caregiver, accepted=True) for p in watched
+            )
+            dashboards.append((caregiver.username, watched[0].username if watched else caregiver.username))
+
+        # Open-loop schedule: (offset seconds, endpoint, params), each client starting at a random phase.
+        schedule = []
+        duration = options["duration"]
+        for i in range(options["devices"]):
+            t = random.random()
+            while t < duration:
+                schedule.append((t, "device_push", {
+                    "device_id": "device-%d" % i, "spo2": random.randint(95, 100),
+                    "bpm": random.randint(60, 100), "temp": round(random.uniform(36.0, 37.5), 2),
+                }))
+                t += 1.0
+        for caregiver, patient in dashboards:
+            for endpoint, interval, params in (
+                ("get_vitals", options["vitals_interval"], {"username": patient}),
+                ("get_connections", options["connections_interval"], {"username": caregiver}),
+            ):
+                t = random.uniform(0, interval)
+                while t < duration:
+                    schedule.append((t, endpoint, params))
+                    t += interval
+        schedule.sort(key=lambda item: item[0])
+        return schedule
+
+    def run(self, schedule, options):
+        latencies = {}
+        errors = {}
+        lock = threading.Lock()
+        local = threading.local()
+
+        def call(scheduled_at, endpoint, params):
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = Client()
+            try:
+                ok = client.get("/" + endpoint, params).status_code < 400
+            except Exception:
+                ok = False
+            # measured from the scheduled start so queueing delay counts
+            elapsed = time.perf_counter() - scheduled_at
+            with lock:
+                latencies.setdefault(endpoint, []).append(elapsed)
+                if not ok:
+                    errors[endpoint] = errors.get(endpoint, 0) + 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            for offset, endpoint, params in schedule:
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(call, start + offset, endpoint, params)
+        elapsed = time.perf_counter() - start
+
+        return {endpoint: summarize(values, errors.get(endpoint, 0), elapsed) for endpoint, values in latencies.items()}
+
+    def print_report(self, results):
+        self.stdout.write("%-16s %8s %7s %10s %10s %10s %10s" % ("endpoint", "count", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+        for endpoint, r in sorted(results.items()):
+            self.stdout.write("%-16s %8d %7d %10.1f %10.2f %10.2f %10.2f" % (
+                endpoint, r["count"], r["errors"], r["throughput"], r["p50"] * 1000, r["p95"] * 1000, r["p99"] * 1000))
+
+    def compare(self, results, path, tolerance):
+        with open(path) as f:
+            baseline = json.load(f)["endpoints"]
+        regressions = []
+        for endpoint, r in sorted(results.items()):
+            before = baseline.get(endpoint)
+            if not before or not before["p95"]:
+                continue
+            change = r["p95"] / before["p95"] - 1
+            self.stdout.write("%-16s p95 %+6.1f%% vs %s" % (endpoint, change * 100, path))
+            if change > tolerance or r["errors"] > before["errors"]:
+                regressions.append(endpoint)
+        if regressions:
+            raise CommandError("regression in: %s" % ", ".join(regressions))
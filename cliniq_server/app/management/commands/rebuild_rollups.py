@@ -0,0 +1,43 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from app.models import DeviceRecords, VitalsRollup
+from app.rollups import METRICS, RESOLUTIONS, add_to_buckets, bucket_start, save_buckets
+
+
+class Command(BaseCommand):
+    help = "Recompute VitalsRollup buckets from DeviceRecords, streaming the table in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--device", help="only rebuild this device_id")
+        parser.add_argument("--since", type=float, help="unix timestamp; rebuild from the hour containing it")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        records = DeviceRecords.objects.exclude(device_id=None)
+        rollups = VitalsRollup.objects.all()
+        if options["device"]:
+            records = records.filter(device_id=options["device"])
+            rollups = rollups.filter(device_id=options["device"])
+        if options["since"] is not None:
+            since = datetime.datetime.fromtimestamp(options["since"], datetime.timezone.utc)
+            since = bucket_start(since, max(RESOLUTIONS))
+            records = records.filter(timestamp__gte=since)
+            rollups = rollups.filter(bucket__gte=since)
+
+        deleted, _ = rollups.delete()
+        buckets = {}
+        rows = 0
+        for device_id, timestamp, *values in records.order_by("device_id", "timestamp").values_list(
+            "device_id", "timestamp", *METRICS
+        ).iterator(chunk_size=options["chunk_size"]):
+            add_to_buckets(buckets, device_id, timestamp, values)
+            rows += 1
+            if len(buckets) >= options["chunk_size"]:
+                save_buckets(buckets)
+                buckets = {}
+        save_buckets(buckets)
+
+        self.stdout.write("rebuilt rollups from %d records (%d old buckets removed, %d now stored)" % (
+            rows, deleted, VitalsRollup.objects.count()))
@@ -0,0 +1,190 @@
+import itertools
+import os
+import tempfile
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from app.inference import NUMPY_MODEL_PATH, NumpyPredictor
+from app.models import DeviceRecords
+
+
+# model inputs in the order getBP passes them, then the targets
+FEATURES = ("age", "gender", "blood_oxygen", "heart_rate", "temp")
+TARGETS = ("sbp", "dbp")
+
+
+class Command(BaseCommand):
+    help = (
+        "Fit a lightweight BP regressor on stored DeviceRecords and write it as an .npz served by the numpy "
+        "predictor (BP_PREDICTOR=numpy). Rows are streamed in chunks into memory-mapped .npy arrays and the "
+        "model is solved from per-chunk sums, so memory stays flat however large the table is. The model is "
+        "one ReLU layer of fixed random features followed by a ridge-regression output layer; a holdout is "
+        "scored against the mean-BP baseline and the model currently at --output."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=NUMPY_MODEL_PATH)
+        parser.add_argument("--arrays-dir", help="keep the feature/label .npy files here instead of a temporary directory")
+        parser.add_argument("--device", help="only train on this device_id")
+        parser.add_argument("--chunk-size", type=int, default=50000)
+        parser.add_argument("--holdout", type=float, default=0.2, help="fraction of rows held out for evaluation")
+        parser.add_argument("--hidden", type=int, default=64, help="random ReLU features; 0 fits a plain linear model")
+        parser.add_argument("--ridge", type=float, default=1e-3, help="L2 penalty on the output layer")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--dry-run", action="store_true", help="report metrics without writing the model")
+
+    def handle(self, *args, **options):
+        if options["arrays_dir"]:
+            os.makedirs(options["arrays_dir"], exist_ok=True)
+            self.run(options["arrays_dir"], options)
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                self.run(tmp, options)
+
+    def run(self, directory, options):
+        chunk = options["chunk_size"]
+        x, y, holdout = self.extract(directory, options)
+        n = len(y)
+        train_rows = n - int(holdout.sum())
+        if train_rows <= options["hidden"] + 1 or not holdout.any():
+            raise CommandError("only %d usable rows (%d held out); not enough to train and evaluate" % (n, n - train_rows))
+        self.stdout.write("extracted %d rows into %s (%d train, %d holdout)" % (n, directory, train_rows, n - train_rows))
+
+        # standardize on the training rows, then fold the scaling into layer 0
+        total = np.zeros(len(FEATURES))
+        squares = np.zeros(len(FEATURES))
+        for start in range(0, n, chunk):
+            rows = x[start:start + chunk][~holdout[start:start + chunk]].astype(np.float64)
+            total += rows.sum(axis=0)
+            squares += (rows ** 2).sum(axis=0)
+        mean = total / train_rows
+        std = np.sqrt(np.maximum(squares / train_rows - mean ** 2, 0))
+        std[std == 0] = 1  # constant column, e.g. one device's age
+
+        rng = np.random.default_rng(options["seed"])
+        hidden = options["hidden"]
+        if hidden:
+            weights = rng.standard_normal((len(FEATURES), hidden)) / np.sqrt(len(FEATURES))
+            offsets = rng.uniform(-1, 1, hidden)
+            layers = [(weights / std[:, None], offsets - (mean / std) @ weights, "relu")]
+        else:
+            layers = []
+
+        def features(rows):
+            rows = rows.astype(np.float64)
+            for kernel, bias, _ in layers:
+                rows = np.maximum(rows @ kernel + bias, 0)
+            if not layers:
+                rows = (rows - mean) / std
+            return np.hstack([rows, np.ones((len(rows), 1))])
+
+        # ridge normal equations, accumulated chunk by chunk
+        width = (hidden or len(FEATURES)) + 1
+        gram = np.zeros((width, width))
+        moment = np.zeros((width, len(TARGETS)))
+        for start in range(0, n, chunk):
+            train = ~holdout[start:start + chunk]
+            h = features(x[start:start + chunk][train])
+            gram += h.T @ h
+            moment += h.T @ y[start:start + chunk][train]
+        penalty = options["ridge"] * train_rows * np.eye(width)
+        penalty[-1, -1] = 0  # never shrink the intercept
+        solution = np.linalg.solve(gram + penalty, moment)
+        kernel, bias = solution[:-1], solution[-1]
+        if not hidden:
+            kernel, bias = kernel / std[:, None], bias - (mean / std) @ kernel
+        layers.append((kernel, bias, "linear"))
+
+        arrays = {"activations": np.array([name for _, _, name in layers])}
+        for i, (kernel, bias, _) in enumerate(layers):
+            arrays["kernel_%d" % i] = kernel.astype(np.float32)
+            arrays["bias_%d" % i] = bias.astype(np.float32)
+
+        # written beside the target and swapped in, so a worker loading the
+        # model never sees a partial file; scored through the serving code
+        tmp_path = options["output"] + ".tmp.npz"
+        np.savez(tmp_path, **arrays)
+        label_mean = moment[-1] / train_rows  # the intercept column sums the labels
+        candidates = [
+            ("baseline", lambda rows: np.broadcast_to(label_mean, (len(rows), len(TARGETS)))),
+            ("retrained", NumpyPredictor(tmp_path)),
+        ]
+        if os.path.exists(options["output"]):
+            candidates.append(("current", NumpyPredictor(options["output"])))
+        try:
+            self.evaluate(x, y, holdout, chunk, candidates)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        if options["dry_run"]:
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, options["output"])
+            self.stdout.write("wrote %d layers to %s; restart workers with BP_PREDICTOR=numpy to serve it" % (
+                len(layers), options["output"]))
+
+    def extract(self, directory, options):
+        """Stream usable rows into memory-mapped feature, label and holdout
+        arrays. Rows inserted meanwhile are left for the next run."""
+        records = DeviceRecords.objects.all()
+        if options["device"]:
+            records = records.filter(device_id=options["device"])
+        for field in FEATURES + TARGETS:
+            records = records.exclude(**{field: None})
+        last_id = records.order_by("-id").values_list("id", flat=True).first() or 0
+        records = records.filter(id__lte=last_id)
+        capacity = records.count()
+
+        x = np.lib.format.open_memmap(os.path.join(directory, "features.npy"), mode="w+", dtype=np.float32,
+                                      shape=(max(capacity, 1), len(FEATURES)))
+        y = np.lib.format.open_memmap(os.path.join(directory, "labels.npy"), mode="w+", dtype=np.float32,
+                                      shape=(max(capacity, 1), len(TARGETS)))
+        holdout = np.lib.format.open_memmap(os.path.join(directory, "holdout.npy"), mode="w+", dtype=bool,
+                                            shape=(max(capacity, 1),))
+        threshold = int(options["holdout"] * 2 ** 32)
+        rows = records.order_by("id").values_list("id", *FEATURES + TARGETS).iterator(chunk_size=options["chunk_size"])
+        n = 0
+        while n < capacity:
+            batch = list(itertools.islice(rows, min(options["chunk_size"], capacity - n)))
+            if not batch:
+                break  # rows deleted since the count
+            values = np.array(batch, dtype=np.float64)
+            x[n:n + len(batch)] = values[:, 1:1 + len(FEATURES)]
+            y[n:n + len(batch)] = values[:, 1 + len(FEATURES):]
+            # a fixed hash of the id, so reruns hold out the same rows
+            holdout[n:n + len(batch)] = (values[:, 0].astype(np.uint64) * 2654435761 % 2 ** 32) < threshold
+            n += len(batch)
+        for array in (x, y, holdout):
+            array.flush()
+        return x[:n], y[:n], holdout[:n]
+
+    def evaluate(self, x, y, holdout, chunk, candidates):
+        errors = {name: np.zeros(len(TARGETS)) for name, _ in candidates}
+        squares = {name: np.zeros(len(TARGETS)) for name, _ in candidates}
+        total = np.zeros(len(TARGETS))
+        total_squares = np.zeros(len(TARGETS))
+        count = 0
+        for start in range(0, len(y), chunk):
+            held = holdout[start:start + chunk]
+            rows = x[start:start + chunk][held]
+            truth = y[start:start + chunk][held].astype(np.float64)
+            count += len(truth)
+            total += truth.sum(axis=0)
+            total_squares += (truth ** 2).sum(axis=0)
+            for name, predict in candidates:
+                diff = np.asarray(predict(rows), dtype=np.float64) - truth
+                errors[name] += np.abs(diff).sum(axis=0)
+                squares[name] += (diff ** 2).sum(axis=0)
+
+        variance = total_squares - total ** 2 / count
+        self.stdout.write("holdout: %d rows" % count)
+        self.stdout.write("%-10s %9s %9s %9s %9s %9s %9s" % ("model", "sbp mae", "sbp rmse", "sbp r2", "dbp mae", "dbp rmse", "dbp r2"))
+        for name, _ in candidates:
+            mae = errors[name] / count
+            rmse = np.sqrt(squares[name] / count)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                r2 = 1 - squares[name] / variance
+            self.stdout.write("%-10s %9.2f %9.2f %9.3f %9.2f %9.2f %9.3f" % (
+                name, mae[0], rmse[0], r2[0], mae[1], rmse[1], r2[1]))
@@ -0,0 +1,200 @@
+"""
+Per-view request metrics in Prometheus text format.
+
+``MetricsMiddleware`` times every request and, through an execute wrapper
+installed on each new database connection, counts its queries and their
+time. Per-request state lives in a context variable, so it follows the
+request into ``sync_to_async`` threads under ASGI. A sampled fraction of
+requests (``settings.METRICS_QUERY_SAMPLE_RATE``) also keeps the SQL text.
+"""
+
+import bisect
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_current = ContextVar("cliniq_request_stats", default=None)
+sampled_queries = deque(maxlen=200)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, labels, buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(key, Histogram(buckets))
+        return hist
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def render(self):
+        lines = []
+        seen = set()
+
+        def header(name):
+            if name not in seen and name in self.help:
+                kind, text = self.help[name]
+                lines.append("# HELP %s %s" % (name, text))
+                lines.append("# TYPE %s %s" % (name, kind))
+            seen.add(name)
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name)
+            lines.append("%s{%s} %s" % (name, format_labels(labels), value))
+        for (name, labels), hist in sorted(self.histograms.items(), key=lambda item: item[0]):
+            header(name)
+            with hist.lock:
+                counts, total = list(hist.counts), hist.sum
+            cumulative = 0
+            for bound, count in zip(hist.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append("%s_bucket{%s} %d" % (name, format_labels(labels + (("le", le),)), cumulative))
+            lines.append("%s_sum{%s} %r" % (name, format_labels(labels), total))
+            lines.append("%s_count{%s} %d" % (name, format_labels(labels), cumulative))
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    return ",".join('%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels)
+
+
+registry = Registry()
+registry.describe("cliniq_requests_total", "counter", "Requests handled, by view and status code.")
+registry.describe("cliniq_request_duration_seconds", "histogram", "Wall time per request.")
+registry.describe("cliniq_db_queries", "histogram", "Database queries per request.")
+registry.describe("cliniq_db_duration_seconds", "histogram", "Database time per request.")
+registry.describe("cliniq_bp_inference_seconds", "histogram", "Blood pressure inference time per request.")
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "inference_time", "captured")
+
+    def __init__(self, capture):
+        self.queries = 0
+        self.db_time = 0.0
+        self.inference_time = 0.0
+        self.captured = [] if capture else None
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.queries += 1
+        stats.db_time += elapsed
+        if stats.captured is not None:
+            stats.captured.append((sql, elapsed))
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """``connection_created`` receiver, wired up in ``AppConfig.ready``."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def add_inference_time(seconds):
+    stats = _current.get()
+    if stats is not None:
+        stats.inference_time += seconds
+
+
+def view_label(request):
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.METRICS_ENABLED
+        self.sample_rate = settings.METRICS_QUERY_SAMPLE_RATE
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        stats, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        stats, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    def start(self):
+        stats = RequestStats(capture=self.sample_rate > 0 and random.random() < self.sample_rate)
+        return stats, _current.set(stats), time.perf_counter()
+
+    def finish(self, request, response, stats, start):
+        elapsed = time.perf_counter() - start
+        view = (("view", view_label(request)),)
+        registry.inc("cliniq_requests_total", view + (("status", response.status_code),))
+        registry.histogram("cliniq_request_duration_seconds", view).observe(elapsed)
+        registry.histogram("cliniq_db_queries", view, COUNT_BUCKETS).observe(stats.queries)
+        registry.histogram("cliniq_db_duration_seconds", view).observe(stats.db_time)
+        if stats.inference_time:
+            registry.histogram("cliniq_bp_inference_seconds", view).observe(stats.inference_time)
+        if stats.captured:
+            sampled_queries.append({
+                "view": view[0][1], "path": request.path, "duration": elapsed,
+                "queries": [{"sql": sql, "duration": duration} for sql, duration in stats.captured],
+            })
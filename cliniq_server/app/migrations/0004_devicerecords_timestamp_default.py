@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_devicerecords_age_devicerecords_gender'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='devicerecords',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
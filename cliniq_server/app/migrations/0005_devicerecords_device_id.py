@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_device_id(apps, schema_editor):
+    # Every reading so far came from the single firmware device. Update in
+    # primary key ranges so large tables don't build one huge statement.
+    DeviceRecords = apps.get_model("app", "DeviceRecords")
+    last = DeviceRecords.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    step = 50000
+    for start in range(0, last, step):
+        DeviceRecords.objects.filter(
+            id__gt=start, id__lte=start + step, device_id__isnull=True
+        ).update(device_id=settings.DEFAULT_DEVICE_ID)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_devicerecords_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicerecords',
+            name='device_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.RunPython(backfill_device_id, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='devicerecords',
+            index=models.Index(fields=['device_id', 'timestamp'], name='devicerecords_device_time'),
+        ),
+    ]
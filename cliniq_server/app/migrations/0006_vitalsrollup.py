@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_devicerecords_device_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalsRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=255)),
+                ('resolution', models.IntegerField()),
+                ('bucket', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('temp_min', models.FloatField(blank=True, null=True)),
+                ('temp_max', models.FloatField(blank=True, null=True)),
+                ('temp_sum', models.FloatField(default=0)),
+                ('heart_rate_min', models.FloatField(blank=True, null=True)),
+                ('heart_rate_max', models.FloatField(blank=True, null=True)),
+                ('heart_rate_sum', models.FloatField(default=0)),
+                ('blood_oxygen_min', models.FloatField(blank=True, null=True)),
+                ('blood_oxygen_max', models.FloatField(blank=True, null=True)),
+                ('blood_oxygen_sum', models.FloatField(default=0)),
+                ('sbp_min', models.FloatField(blank=True, null=True)),
+                ('sbp_max', models.FloatField(blank=True, null=True)),
+                ('sbp_sum', models.FloatField(default=0)),
+                ('dbp_min', models.FloatField(blank=True, null=True)),
+                ('dbp_max', models.FloatField(blank=True, null=True)),
+                ('dbp_sum', models.FloatField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device_id', 'resolution', 'bucket'), name='vitalsrollup_device_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:30
+
+import struct
+
+from django.db import migrations, models
+
+
+# Frozen copy of the app.ecg frame format as of this migration (raw int16 at
+# 250 Hz), so later changes to that module or to settings.ECG_* don't change
+# what this writes.
+HEADER = struct.Struct("<2sBHIx")
+SAMPLE_RATE = 250
+
+
+def parse_text(text):
+    text = (text or "").strip().strip("[]")
+    if not text:
+        return []
+    return [min(max(int(float(value)), -32768), 32767) for value in text.split(",")]
+
+
+def encode_raw(samples):
+    return HEADER.pack(b"EC", 0, SAMPLE_RATE, len(samples)) + struct.pack("<%dh" % len(samples), *samples)
+
+
+def pack_ecg_frames(apps, schema_editor):
+    DeviceRecords = apps.get_model("app", "DeviceRecords")
+    pending = []
+    records = DeviceRecords.objects.exclude(ecg_sensor_frame=None).exclude(ecg_sensor_frame__in=["", "[]"])
+    for record in records.only("id", "ecg_sensor_frame").iterator(chunk_size=2000):
+        try:
+            samples = parse_text(record.ecg_sensor_frame)
+        except ValueError:
+            continue
+        record.ecg_frame = encode_raw(samples)
+        pending.append(record)
+        if len(pending) >= 2000:
+            DeviceRecords.objects.bulk_update(pending, ["ecg_frame"])
+            pending = []
+    DeviceRecords.objects.bulk_update(pending, ["ecg_frame"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_vitalsrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicerecords',
+            name='ecg_frame',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(pack_ecg_frames, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='devicerecords',
+            name='ecg_sensor_frame',
+        ),
+    ]
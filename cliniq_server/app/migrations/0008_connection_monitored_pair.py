@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:23
+
+from django.db import migrations, models
+
+
+def drop_duplicate_connections(apps, schema_editor):
+    # Keep one row per (monitored, monitored_by), preferring an accepted one.
+    Connection = apps.get_model("app", "Connection")
+    seen = set()
+    duplicates = []
+    for pk, monitored, monitored_by in Connection.objects.order_by("-accepted", "id").values_list(
+        "id", "monitored_id", "monitored_by_id"
+    ):
+        if (monitored, monitored_by) in seen:
+            duplicates.append(pk)
+        seen.add((monitored, monitored_by))
+    Connection.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_devicerecords_ecg_frame'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_connections, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='connection',
+            constraint=models.UniqueConstraint(fields=('monitored', 'monitored_by'), name='connection_monitored_pair'),
+        ),
+    ]
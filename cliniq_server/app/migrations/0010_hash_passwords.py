@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:05
+
+from django.contrib.auth.hashers import get_hashers, make_password
+from django.db import migrations
+
+
+def hash_plaintext_passwords(apps, schema_editor):
+    # Passwords were stored as entered; replace each with its salted hash.
+    UserProfile = apps.get_model("app", "UserProfile")
+    algorithms = {hasher.algorithm for hasher in get_hashers()}
+    hashed = []
+    for user in UserProfile.objects.only("id", "password").iterator(chunk_size=500):
+        if user.password.partition("$")[0] not in algorithms:
+            user.password = make_password(user.password)
+            hashed.append(user)
+    UserProfile.objects.bulk_update(hashed, ["password"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_ingestcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(hash_plaintext_passwords, migrations.RunPython.noop),
+    ]
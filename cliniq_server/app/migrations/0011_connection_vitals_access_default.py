@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:40
+
+from django.db import migrations, models
+
+
+def grant_vitals_access(apps, schema_editor):
+    # Accepted connections showed vitals before the flag was enforced; keep
+    # them doing so. The monitored user can revoke it with set_connection_access.
+    Connection = apps.get_model("app", "Connection")
+    Connection.objects.filter(access_vital_signs_data=False).update(access_vital_signs_data=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_hash_passwords'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='connection',
+            name='access_vital_signs_data',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(grant_vitals_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:05
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_counts(apps, schema_editor):
+    # Older rows only kept the total; treat every reading as having each metric
+    # the bucket has values for. rebuild_rollups recomputes the exact counts.
+    VitalsRollup = apps.get_model("app", "VitalsRollup")
+    for metric in ("temp", "heart_rate", "blood_oxygen", "sbp", "dbp"):
+        VitalsRollup.objects.exclude(**{metric + "_min": None}).update(**{metric + "_count": F("count")})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_connection_vitals_access_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vitalsrollup',
+            name='blood_oxygen_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='vitalsrollup',
+            name='dbp_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='vitalsrollup',
+            name='heart_rate_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='vitalsrollup',
+            name='sbp_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='vitalsrollup',
+            name='temp_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
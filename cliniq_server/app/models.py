@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class Config(models.Model):
@@ -12,20 +13,75 @@ class Connection(models.Model):
     monitored_by = models.ForeignKey('UserProfile', related_name='connections_to', on_delete=models.CASCADE)
     accepted = models.BooleanField(default=False)
     access_diet_data = models.BooleanField(default=False)
-    access_vital_signs_data = models.BooleanField(default=False)
+    access_vital_signs_data = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["monitored", "monitored_by"], name="connection_monitored_pair"),
+        ]
 
 
 class DeviceRecords(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True)
+    device_id = models.CharField(max_length=255, blank=True, null=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     temp = models.FloatField(blank=True, null=True)
     heart_rate = models.IntegerField(blank=True, null=True)
     blood_oxygen = models.FloatField(blank=True, null=True)
     sbp = models.IntegerField(blank=True, null=True)  # Systolic Blood Pressure
     dbp = models.IntegerField(blank=True, null=True)  # Diastolic Blood Pressure
-    ecg_sensor_frame = models.TextField(blank=True, null=True)
+    ecg_frame = models.BinaryField(blank=True, null=True)  # packed int16 samples, see app/ecg.py
     age = models.IntegerField(blank=True, null=True)
     gender = models.IntegerField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["device_id", "timestamp"], name="devicerecords_device_time"),
+        ]
+
+
+class VitalsRollup(models.Model):
+    # Aggregate of one device's DeviceRecords over [bucket, bucket + resolution seconds).
+    device_id = models.CharField(max_length=255)
+    resolution = models.IntegerField()
+    bucket = models.DateTimeField()
+    count = models.IntegerField(default=0)
+    temp_min = models.FloatField(blank=True, null=True)
+    temp_max = models.FloatField(blank=True, null=True)
+    temp_sum = models.FloatField(default=0)
+    temp_count = models.IntegerField(default=0)
+    heart_rate_min = models.FloatField(blank=True, null=True)
+    heart_rate_max = models.FloatField(blank=True, null=True)
+    heart_rate_sum = models.FloatField(default=0)
+    heart_rate_count = models.IntegerField(default=0)
+    blood_oxygen_min = models.FloatField(blank=True, null=True)
+    blood_oxygen_max = models.FloatField(blank=True, null=True)
+    blood_oxygen_sum = models.FloatField(default=0)
+    blood_oxygen_count = models.IntegerField(default=0)
+    sbp_min = models.FloatField(blank=True, null=True)
+    sbp_max = models.FloatField(blank=True, null=True)
+    sbp_sum = models.FloatField(default=0)
+    sbp_count = models.IntegerField(default=0)
+    dbp_min = models.FloatField(blank=True, null=True)
+    dbp_max = models.FloatField(blank=True, null=True)
+    dbp_sum = models.FloatField(default=0)
+    dbp_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["device_id", "resolution", "bucket"], name="vitalsrollup_device_bucket"),
+        ]
+
+
+
+class IngestCheckpoint(models.Model):
+    """How far ``drain_ingest_log`` has moved one ingest log segment into
+    DeviceRecords. Updated in the same transaction as the rows it covers."""
+    segment = models.CharField(max_length=255, unique=True)
+    offset = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return "%s@%d" % (self.segment, self.offset)
+
 
 class UserProfile(models.Model):
     surname = models.CharField(max_length=150)
@@ -41,5 +97,6 @@ class UserProfile(models.Model):
     mental_health_summary = models.TextField(blank=True, null=True)
     model_context = models.TextField(blank=True, null=True)
     premium_plan = models.BooleanField(default=False)
+    token_version = models.IntegerField(default=0)  # bumped to revoke every token issued before
     def __str__(self):
         return str(self.username)
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+Online/offline presence of devices.
+
+``seen`` records when a device last pushed, in a dict, and brings it online.
+Expiry uses a timer wheel. Each online device sits in the slot of the
+``settings.PRESENCE_SWEEP_INTERVAL`` tick in which last seen +
+``settings.PRESENCE_TIMEOUT`` falls, and a push moves it to its new slot.
+A sweep empties only the slots that are due, and every device in them has
+really expired, so ingest is O(1) and nothing re-checks live devices.
+
+Every transition gets the next number in a change log and is published as
+a "presence" event on the device's live streams. ``get_presence`` returns
+a caregiver's devices once, then only the changes after the cursor it
+handed out. The map is per process, like the stream broker.
+"""
+
+import collections
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from app import streaming
+
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    def __init__(self, timeout=3.0, history=10000, sweep_interval=0.5, clock=time.time):
+        self.timeout = timeout
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._last_seen = {}
+        self._slot_of = {}  # online device -> wheel slot
+        self._slots = {}  # slot -> devices expiring in it
+        self._changes = collections.deque(maxlen=history)  # (version, device_id, online, at)
+        self._version = 0
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def seen(self, device_id, at=None):
+        at = self.clock() if at is None else at
+        with self._lock:
+            if at <= self._last_seen.get(device_id, 0):
+                return
+            self._last_seen[device_id] = at
+            slot = math.ceil((at + self.timeout) / self.sweep_interval)
+            current = self._slot_of.get(device_id)
+            if current != slot:
+                if current is not None:
+                    previous = self._slots[current]
+                    previous.discard(device_id)
+                    if not previous:
+                        del self._slots[current]  # an emptied set keeps its table, which a sweep would scan
+                self._slots.setdefault(slot, set()).add(device_id)
+                self._slot_of[device_id] = slot
+            change = self._change(device_id, True, at) if current is None else None
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="presence-sweep", daemon=True)
+                self._worker.start()
+        if change is not None:
+            self._publish(change)
+
+    def _change(self, device_id, online, at):
+        self._version += 1
+        change = (self._version, device_id, online, at)
+        self._changes.append(change)
+        return change
+
+    def _publish(self, change):
+        _, device_id, online, at = change
+        streaming.broker.publish(device_id, {"online": online, "last_seen": at}, kind="presence")
+
+    def sweep(self, now=None):
+        """Take devices not seen for ``timeout`` seconds offline."""
+        now = self.clock() if now is None else now
+        changes = []
+        due = math.floor(now / self.sweep_interval)
+        with self._lock:
+            for slot in sorted(slot for slot in self._slots if slot <= due):
+                for device_id in self._slots.pop(slot):
+                    del self._slot_of[device_id]
+                    changes.append(self._change(device_id, False, self._last_seen[device_id] + self.timeout))
+        for change in changes:
+            self._publish(change)
+
+    def _run(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("presence sweep failed")
+
+    def is_online(self, device_id):
+        self.sweep()
+        return device_id in self._slot_of
+
+    def last_seen(self, device_id):
+        return self._last_seen.get(device_id)
+
+    def status(self, device_ids, since=None):
+        """(cursor, {device_id: {"online", "last_seen"}}, full) for
+        ``device_ids``. With the cursor of an earlier call as ``since``, only
+        devices that changed after it are included; ``full`` is set when the
+        whole set had to be sent because the change log no longer reaches
+        back that far."""
+        self.sweep()
+        wanted = set(device_ids)
+        with self._lock:
+            cursor = self._version
+            oldest = self._changes[0][0] if self._changes else cursor + 1
+            if since is not None and oldest - 1 <= since <= cursor:
+                changed = set()
+                for version, device_id, _, _ in reversed(self._changes):
+                    if version <= since:
+                        break
+                    if device_id in wanted:
+                        changed.add(device_id)
+                wanted = changed
+                full = False
+            else:
+                full = True
+            devices = {
+                device_id: {"online": device_id in self._slot_of, "last_seen": self._last_seen.get(device_id)}
+                for device_id in wanted
+            }
+        return cursor, devices, full
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = PresenceTracker(
+                timeout=settings.PRESENCE_TIMEOUT,
+                history=settings.PRESENCE_HISTORY,
+                sweep_interval=settings.PRESENCE_SWEEP_INTERVAL,
+            )
+        return _tracker
+
+
+def seen(device_id):
+    get_tracker().seen(device_id)
+
+
+def is_online(device_id, reading_at=None):
+    """Whether ``device_id`` is online. The tracker is per process, so a
+    reading at ``reading_at`` (unix time) newer than anything this process
+    saw came through another worker; its age decides then."""
+    tracker = get_tracker()
+    if tracker.is_online(device_id):
+        return True
+    if reading_at is not None and reading_at > (tracker.last_seen(device_id) or 0):
+        return time.time() - reading_at < tracker.timeout
+    return False
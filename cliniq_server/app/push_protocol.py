@@ -0,0 +1,182 @@
+"""
+Binary device push protocol, the compact alternative to the
+``device_push`` query string.
+
+A push is a 22-byte header followed by ``count`` readings, all
+little-endian::
+
+    magic      "CQ"     2 bytes
+    version    uint8    1
+    flags      uint8    bit 0: the device restarted its sequence numbers
+    count      uint16   readings in this push
+    device_id  16 bytes ASCII, NUL-padded
+
+    seq        uint32   per-device sequence number, one per reading
+    timestamp  uint32   unix seconds, 0 if the device has no clock
+    spo2       uint8    percent
+    bpm        uint8    beats per minute
+    temp       int16    hundredths of a degree Celsius
+    ecg_count  uint16   ECG samples that follow
+    samples    int16    x ecg_count
+
+A device buffers readings and sends several per push. ``SequenceTracker``
+remembers each device's highest sequence number and the ranges skipped
+below it. Readings already received (a retransmit after a lost response)
+are dropped, and the open ranges go back in every response so the device
+can resend them from its buffer.
+
+The tracker is per process and lives only as long as the process does. With
+several workers, a device's pushes must all reach the same one (route
+``device_push_binary`` on the device id, e.g. a consistent hash of the
+``device_id`` bytes at the load balancer). Otherwise each worker sees its
+own subset of sequence numbers. Duplicates are then stored twice, and
+``missing`` asks for readings that another worker already holds. After a
+worker restart, the device's next push is taken as new and opens no gaps
+behind it.
+"""
+
+import struct
+import threading
+
+import numpy as np
+
+from app import metrics
+
+
+HEADER = struct.Struct("<2sBBH16s")
+READING = struct.Struct("<IIBBhH")
+MAGIC = b"CQ"
+VERSION = 1
+RESTARTED = 0x01
+SAMPLE_DTYPE = np.dtype("<i2")
+NO_SAMPLES = np.empty(0, dtype=SAMPLE_DTYPE)
+NO_SAMPLES.flags.writeable = False
+
+metrics.registry.describe("cliniq_push_duplicates_total", "counter", "Binary push readings dropped as already received.")
+metrics.registry.describe("cliniq_push_missing_total", "counter", "Binary push readings skipped by a sequence gap.")
+
+
+class Push:
+    __slots__ = ("device_id", "restarted", "readings")
+
+    def __init__(self, device_id, restarted, readings):
+        self.device_id = device_id
+        self.restarted = restarted
+        # (seq, unix_ts or 0, spo2, bpm, temp, ecg_samples) tuples
+        self.readings = readings
+
+
+def encode(device_id, readings, restarted=False):
+    """Build a push from (seq, unix_ts, spo2, bpm, temp, ecg_samples) tuples;
+    the device side of ``decode``, used by tests and benchmarks."""
+    parts = [HEADER.pack(MAGIC, VERSION, RESTARTED if restarted else 0, len(readings), device_id.encode("ascii"))]
+    for seq, ts, spo2, bpm, temp, samples in readings:
+        samples = np.asarray(samples, dtype=SAMPLE_DTYPE)
+        parts.append(READING.pack(seq, int(ts), spo2, bpm, round(temp * 100), len(samples)))
+        parts.append(samples.tobytes())
+    return b"".join(parts)
+
+
+def peek_device_id(body):
+    """The device id in a push's header, or None if it has none."""
+    if len(body) < HEADER.size or body[:2] != MAGIC:
+        return None
+    return HEADER.unpack_from(body)[4].rstrip(b"\0").decode("ascii", "replace") or None
+
+
+def decode(body):
+    """Parse a push; raises ``ValueError`` on anything malformed. ECG samples
+    are zero-copy views into ``body``."""
+    if len(body) < HEADER.size:
+        raise ValueError("push shorter than its header")
+    magic, version, flags, count, device_id = HEADER.unpack_from(body)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version %d push" % VERSION)
+    device_id = device_id.rstrip(b"\0").decode("ascii")
+    if not device_id:
+        raise ValueError("push without a device_id")
+
+    readings = []
+    offset = HEADER.size
+    for _ in range(count):
+        if offset + READING.size > len(body):
+            raise ValueError("push truncated in reading %d" % len(readings))
+        seq, ts, spo2, bpm, temp, ecg_count = READING.unpack_from(body, offset)
+        offset += READING.size
+        if offset + ecg_count * SAMPLE_DTYPE.itemsize > len(body):
+            raise ValueError("push truncated in the ECG of reading %d" % len(readings))
+        if ecg_count:
+            samples = np.frombuffer(body, dtype=SAMPLE_DTYPE, count=ecg_count, offset=offset)
+            offset += samples.nbytes
+        else:
+            samples = NO_SAMPLES
+        readings.append((seq, ts, spo2, bpm, temp / 100, samples))
+    if offset != len(body):
+        raise ValueError("%d trailing bytes after %d readings" % (len(body) - offset, count))
+    return Push(device_id, bool(flags & RESTARTED), readings)
+
+
+def _fill(gaps, seq):
+    for i, (first, last) in enumerate(gaps):
+        if first <= seq <= last:
+            gaps[i:i + 1] = [gap for gap in ((first, seq - 1), (seq + 1, last)) if gap[0] <= gap[1]]
+            return True
+    return False
+
+
+class SequenceTracker:
+    def __init__(self, max_gaps=64):
+        self.max_gaps = max_gaps
+        self._state = {}  # device_id -> [highest seq, open (first, last) gaps, oldest first]
+        self._lock = threading.Lock()
+
+    def accept(self, push):
+        """The readings of ``push`` not received before, in sequence order,
+        and the device's open gaps afterwards. A reading above the highest
+        sequence number opens a gap behind it if it skips any; one inside an
+        open gap fills it; anything else is a duplicate. Only the newest
+        ``max_gaps`` gaps are kept."""
+        readings = sorted(push.readings, key=lambda reading: reading[0])
+        fresh = []
+        skipped = 0
+        with self._lock:
+            state = self._state.get(push.device_id)
+            if state is None or push.restarted:
+                state = self._state[push.device_id] = [None, []]
+            last, gaps = state
+            for reading in readings:
+                seq = reading[0]
+                if last is None or seq > last:
+                    if last is not None and seq > last + 1:
+                        gaps.append((last + 1, seq - 1))
+                        skipped += seq - last - 1
+                    last = seq
+                elif not _fill(gaps, seq):
+                    continue
+                fresh.append(reading)
+            del gaps[:-self.max_gaps]
+            state[0] = last
+            missing = list(gaps)
+
+        duplicates = len(readings) - len(fresh)
+        if duplicates:
+            metrics.registry.inc("cliniq_push_duplicates_total", (), duplicates)
+        if skipped:
+            metrics.registry.inc("cliniq_push_missing_total", (), skipped)
+        return fresh, missing
+
+    def reopen(self, device_id, seqs):
+        """Mark accepted readings that could not be stored as missing again,
+        so the device's retry is not dropped as a duplicate."""
+        with self._lock:
+            state = self._state.get(device_id)
+            if state is not None:
+                state[1].extend((seq, seq) for seq in seqs)
+                state[1].sort()
+
+    def last(self, device_id):
+        state = self._state.get(device_id)
+        return state[0] if state is not None else None
+
+
+tracker = SequenceTracker()
@@ -0,0 +1,169 @@
+"""
+Request rate limits.
+
+Each device and each user has a token bucket per endpoint group (``GROUPS``):
+"ingest" counts pushes per device, "poll" counts a user's live reads and
+"history" their range reads and exports. A bucket holds up to ``burst``
+tokens and refills at ``rate`` per second. The refill is worked out from the
+time since the bucket was last touched, so a check is a dict lookup and a
+little arithmetic with no timer behind it. Buckets are spread over ``SHARDS``
+dicts, each with its own lock, so concurrent requests rarely wait on each
+other.
+
+``RateLimitMiddleware`` runs after ``TokenMiddleware`` and answers an
+over-quota request with 429 and ``Retry-After`` before the view, and so
+before any query. A user is only known from a login token, which also says
+whether its holder is on the premium plan and so gets
+``settings.PREMIUM_RATE_LIMITS`` instead of ``RATE_LIMITS``. Anyone can
+claim a ``?username=``, so such requests are counted per client address and
+username on the standard limits; a spoofed name neither drains the real
+user's bucket nor buys a larger one. Buckets are per process, like the
+presence map.
+"""
+
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+
+from app import metrics, push_protocol
+
+
+GROUPS = {
+    "/device_push": "ingest",
+    "/device_push_bulk": "ingest",
+    "/device_push_binary": "ingest",
+    "/get_vitals": "poll",
+    "/get_presence": "poll",
+    "/get_alerts": "poll",
+    "/stream_vitals": "poll",
+    "/user_profile": "poll",
+    "/is_premium": "poll",
+    "/has_device": "poll",
+    "/get_connections": "poll",
+    "/get_history": "history",
+    "/get_trend": "history",
+    "/get_ecg": "history",
+    "/export_vitals": "history",
+}
+SHARDS = 64
+
+metrics.registry.describe("cliniq_rate_limited_total", "counter", "Requests rejected with 429, by endpoint group and tier.")
+
+
+class _Shard:
+    __slots__ = ("lock", "buckets", "purge_at")
+
+    def __init__(self, purge_at):
+        self.lock = threading.Lock()
+        self.buckets = {}  # key -> [tokens, last refill, seconds to fill]
+        self.purge_at = purge_at
+
+
+class TokenBuckets:
+    def __init__(self, shards=SHARDS, max_keys=100000, clock=time.monotonic):
+        self.clock = clock
+        self._mask = shards - 1
+        self._shards = [_Shard(max(max_keys // shards, 1)) for _ in range(shards)]
+
+    def take(self, key, rate, burst, cost=1):
+        """Take ``cost`` tokens from ``key``'s bucket. Returns 0 when they were
+        there, else the seconds until they will be (nothing is taken)."""
+        shard = self._shards[hash(key) & self._mask]
+        now = self.clock()
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                tokens = burst
+                if len(shard.buckets) >= shard.purge_at:
+                    self._purge(shard, now)
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            if tokens < cost:
+                wait = (cost - tokens) / rate
+            else:
+                tokens -= cost
+                wait = 0
+            shard.buckets[key] = [tokens, now, (burst - tokens) / rate]
+        return wait
+
+    def _purge(self, shard, now):
+        # a bucket that has refilled is the same as no bucket
+        shard.buckets = {key: bucket for key, bucket in shard.buckets.items() if now - bucket[1] < bucket[2]}
+        shard.purge_at = max(shard.purge_at, 2 * len(shard.buckets))
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.buckets.clear()
+
+
+buckets = TokenBuckets()
+
+
+def invalidate():
+    """Refill every bucket."""
+    buckets.clear()
+
+
+def identify(request, group):
+    """(bucket key, premium) for ``request``."""
+    if group == "ingest":
+        device_id = request.GET.get("device_id")
+        if device_id is None and request.path_info == "/device_push_binary":
+            device_id = push_protocol.peek_device_id(request.body)
+        if device_id is None and request.path_info == "/device_push":
+            device_id = settings.DEFAULT_DEVICE_ID
+        if device_id is not None:
+            return ("device", device_id), False
+    else:
+        claims = request.claims
+        if claims is not None:
+            return ("user", claims.username), claims.premium
+        return ("address", request.META.get("REMOTE_ADDR"), request.GET.get("username")), False
+    return ("address", request.META.get("REMOTE_ADDR")), False
+
+
+def group_of(request):
+    return GROUPS.get(request.path_info) if settings.RATE_LIMIT_ENABLED else None
+
+
+def check(request, group):
+    """A 429 response if ``request`` is over its quota, else None."""
+    key, premium = identify(request, group)
+    limits = settings.PREMIUM_RATE_LIMITS if premium else settings.RATE_LIMITS
+    rate, burst = limits.get(group) or settings.RATE_LIMITS[group]
+    wait = buckets.take((group, key), rate, burst)
+    if not wait:
+        return None
+    metrics.registry.inc("cliniq_rate_limited_total", (("group", group), ("tier", "premium" if premium else "standard")))
+    response = JsonResponse({"success": False, "error": "rate limited", "retry_after": round(wait, 3)}, status=429)
+    response["Retry-After"] = str(math.ceil(wait))
+    return response
+
+
+class RateLimitMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        group = group_of(request)
+        if group is None:
+            return self.get_response(request)
+        return check(request, group) or self.get_response(request)
+
+    async def __acall__(self, request):
+        group = group_of(request)
+        if group is None:
+            return await self.get_response(request)
+        return check(request, group) or await self.get_response(request)
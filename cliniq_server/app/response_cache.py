@@ -0,0 +1,145 @@
+"""
+Conditional GET for the polled profile and connection endpoints.
+
+Each user has a version token per scope: "profile" covers ``user_profile``,
+``is_premium`` and ``has_device``, and "connections" covers
+``get_connections``. Saving or deleting a ``UserProfile`` or ``Connection``
+replaces the affected tokens (see ``apps.py``). Responses carry the token as
+their ETag. A request whose ``If-None-Match`` still matches gets
+``304 Not Modified`` straight from the token, without touching the
+database. Otherwise the body is served pre-serialized from a per-process LRU
+keyed on (path, user, version), and only built from the database on a miss.
+
+``settings.RESPONSE_CACHE`` selects where tokens live, like ``VITALS_CACHE``:
+"memory" (per process; tokens expire after ``RESPONSE_CACHE_TTL`` seconds so
+other workers' changes show within that bound) or a ``settings.CACHES``
+alias shared by all workers.
+"""
+
+import json
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from app.models import Connection, UserProfile
+from app.vitals_cache import DjangoCacheBackend, MemoryBackend
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if settings.RESPONSE_CACHE == "memory":
+            _backend = MemoryBackend()
+        else:
+            _backend = DjangoCacheBackend(settings.RESPONSE_CACHE, prefix="response_version")
+    return _backend
+
+
+def new_version():
+    return uuid.uuid4().hex[:16]
+
+
+def version(scope, username):
+    key = "%s:%s" % (scope, username)
+    current = get_backend().get(key)
+    if current is None:
+        current = new_version()
+        get_backend().set(key, current, timeout=settings.RESPONSE_CACHE_TTL)
+    return current
+
+
+async def aversion(scope, username):
+    key = "%s:%s" % (scope, username)
+    current = await get_backend().aget(key)
+    if current is None:
+        current = new_version()
+        await get_backend().aset(key, current, timeout=settings.RESPONSE_CACHE_TTL)
+    return current
+
+
+def bump(scope, *usernames):
+    for username in usernames:
+        get_backend().set("%s:%s" % (scope, username), new_version(), timeout=settings.RESPONSE_CACHE_TTL)
+
+
+_bodies = OrderedDict()
+_bodies_lock = threading.Lock()
+
+
+def remember(key, body):
+    with _bodies_lock:
+        _bodies[key] = body
+        _bodies.move_to_end(key)
+        while len(_bodies) > settings.RESPONSE_CACHE_SIZE:
+            _bodies.popitem(last=False)
+
+
+def invalidate():
+    """Forget every cached body and, with the "memory" backend, every version."""
+    global _backend
+    with _bodies_lock:
+        _bodies.clear()
+    if isinstance(_backend, MemoryBackend):
+        _backend = None
+
+
+def cached(request, username, token):
+    """The response for ``token`` without building anything: 304 when the
+    client's copy is current, else the pre-serialized body, else None."""
+    etag = '"%s"' % token
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        return finish(HttpResponseNotModified(), token)
+    body = _bodies.get((request.path, username, token))
+    return None if body is None else finish(HttpResponse(body, content_type="application/json"), token)
+
+
+def store(request, username, token, payload):
+    body = json.dumps(payload).encode()
+    remember((request.path, username, token), body)
+    return finish(HttpResponse(body, content_type="application/json"), token)
+
+
+def finish(response, token):
+    response["ETag"] = '"%s"' % token
+    response["Cache-Control"] = "no-cache"  # always revalidate
+    return response
+
+
+def respond(request, scope, username, build):
+    """JSON response for ``username`` in ``scope``; ``build`` is a callable
+    producing the payload when no pre-serialized copy is cached."""
+    token = version(scope, username)
+    response = cached(request, username, token)
+    if response is None:
+        response = store(request, username, token, build())
+    return response
+
+
+async def arespond(request, scope, username, build):
+    """``respond`` for async views; ``build`` is an async callable."""
+    token = await aversion(scope, username)
+    response = cached(request, username, token)
+    if response is None:
+        response = store(request, username, token, await build())
+    return response
+
+
+def profile_changed(sender, instance, **kwargs):
+    bump("profile", instance.username)
+    # counterparts' get_connections show this user's username and email
+    bump("connections", *Connection.objects.filter(monitored_id=instance.id).values_list("monitored_by__username", flat=True))
+    bump("connections", *Connection.objects.filter(monitored_by_id=instance.id).values_list("monitored__username", flat=True))
+
+
+def connection_changed(sender, instance, **kwargs):
+    usernames = UserProfile.objects.filter(
+        id__in=[instance.monitored_id, instance.monitored_by_id]
+    ).values_list("username", flat=True)
+    bump("connections", *usernames)
@@ -0,0 +1,227 @@
+"""
+Downsampled vitals for long-range charts.
+
+Every ingested reading is folded into per-device 1-minute, 15-minute and
+hourly ``VitalsRollup`` buckets (min/max/sum/count per metric, since a
+reading may lack some of them). Ingest only touches an in-memory
+accumulator; a background thread merges it into the table every
+``settings.ROLLUP_FLUSH_INTERVAL`` seconds, one read and one write per
+touched bucket. Buckets a failed write took out are merged back in for the
+next flush. ``manage.py rebuild_rollups`` recomputes them from
+``DeviceRecords``.
+"""
+
+import atexit
+import datetime
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from app import history
+from app.models import VitalsRollup
+
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("temp", "heart_rate", "blood_oxygen", "sbp", "dbp")
+RESOLUTIONS = (60, 900, 3600)
+STAT_FIELDS = ["count"] + ["%s_%s" % (m, s) for m in METRICS for s in ("min", "max", "sum", "count")]
+
+
+def bucket_start(timestamp, resolution):
+    seconds = int(timestamp.timestamp())
+    return datetime.datetime.fromtimestamp(seconds - seconds % resolution, datetime.timezone.utc)
+
+
+class Bucket:
+    __slots__ = ("count", "mins", "maxs", "sums", "counts")
+
+    def __init__(self):
+        self.count = 0
+        self.mins = [None] * len(METRICS)
+        self.maxs = [None] * len(METRICS)
+        self.sums = [0.0] * len(METRICS)
+        self.counts = [0] * len(METRICS)
+
+    def add(self, values):
+        self.count += 1
+        for i, value in enumerate(values):
+            if value is None:
+                continue
+            value = float(value)
+            if self.mins[i] is None or value < self.mins[i]:
+                self.mins[i] = value
+            if self.maxs[i] is None or value > self.maxs[i]:
+                self.maxs[i] = value
+            self.sums[i] += value
+            self.counts[i] += 1
+
+    @classmethod
+    def from_row(cls, row):
+        bucket = cls()
+        bucket.count = row["count"]
+        for i, metric in enumerate(METRICS):
+            bucket.mins[i] = row[metric + "_min"]
+            bucket.maxs[i] = row[metric + "_max"]
+            bucket.sums[i] = row[metric + "_sum"]
+            bucket.counts[i] = row[metric + "_count"]
+        return bucket
+
+    def merge(self, other):
+        self.count += other.count
+        for i in range(len(METRICS)):
+            if other.mins[i] is None:
+                continue
+            self.mins[i] = other.mins[i] if self.mins[i] is None else min(self.mins[i], other.mins[i])
+            self.maxs[i] = other.maxs[i] if self.maxs[i] is None else max(self.maxs[i], other.maxs[i])
+            self.sums[i] += other.sums[i]
+            self.counts[i] += other.counts[i]
+
+    def merge_into(self, rollup):
+        rollup.count += self.count
+        for i, metric in enumerate(METRICS):
+            if self.mins[i] is None:
+                continue
+            low, high = getattr(rollup, metric + "_min"), getattr(rollup, metric + "_max")
+            setattr(rollup, metric + "_min", self.mins[i] if low is None else min(low, self.mins[i]))
+            setattr(rollup, metric + "_max", self.maxs[i] if high is None else max(high, self.maxs[i]))
+            setattr(rollup, metric + "_sum", getattr(rollup, metric + "_sum") + self.sums[i])
+            setattr(rollup, metric + "_count", getattr(rollup, metric + "_count") + self.counts[i])
+
+
+def add_to_buckets(buckets, device_id, timestamp, values):
+    for resolution in RESOLUTIONS:
+        key = (device_id, resolution, bucket_start(timestamp, resolution))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = Bucket()
+        bucket.add(values)
+
+
+def save_buckets(buckets):
+    """Merge ``{(device_id, resolution, bucket): Bucket}`` into the table."""
+    groups = {}
+    for (device_id, resolution, start), bucket in buckets.items():
+        groups.setdefault((device_id, resolution), {})[start] = bucket
+
+    with transaction.atomic():
+        for (device_id, resolution), pending in groups.items():
+            existing = VitalsRollup.objects.select_for_update().filter(
+                device_id=device_id, resolution=resolution, bucket__in=list(pending)
+            )
+            updated = []
+            for rollup in existing:
+                pending.pop(rollup.bucket).merge_into(rollup)
+                updated.append(rollup)
+            created = []
+            for start, bucket in pending.items():
+                rollup = VitalsRollup(device_id=device_id, resolution=resolution, bucket=start)
+                bucket.merge_into(rollup)
+                created.append(rollup)
+            VitalsRollup.objects.bulk_update(updated, STAT_FIELDS, batch_size=500)
+            VitalsRollup.objects.bulk_create(created, batch_size=500)
+
+
+class RollupAccumulator:
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def add(self, records):
+        with self._lock:
+            for record in records:
+                add_to_buckets(self._buckets, record.device_id, record.timestamp,
+                               [getattr(record, m) for m in METRICS])
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._run, name="rollup-flusher", daemon=True)
+                self._flusher.start()
+
+    def flush(self):
+        with self._lock:
+            buckets, self._buckets = self._buckets, {}
+        if not buckets:
+            return
+        try:
+            save_buckets(buckets)
+        except Exception:
+            # put them back under whatever arrived meanwhile for the next flush
+            with self._lock:
+                for key, bucket in self._buckets.items():
+                    if key in buckets:
+                        buckets[key].merge(bucket)
+                    else:
+                        buckets[key] = bucket
+                self._buckets = buckets
+            raise
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("failed to write vitals rollups")
+
+
+_accumulator = None
+_accumulator_lock = threading.Lock()
+
+
+def get_accumulator():
+    global _accumulator
+    with _accumulator_lock:
+        if _accumulator is None:
+            _accumulator = RollupAccumulator(settings.ROLLUP_FLUSH_INTERVAL)
+            atexit.register(_accumulator.flush)
+        return _accumulator
+
+
+def choose_resolution(start, end, max_points):
+    """Finest resolution (raw 1 Hz readings count as 1 second) whose point
+    count over ``[start, end)`` fits in ``max_points``; the coarsest rollup
+    if none does."""
+    span = (end - start).total_seconds()
+    for resolution in (1,) + RESOLUTIONS:
+        if span / resolution <= max_points:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def trend(device_id, start, end, max_points=500):
+    resolution = choose_resolution(start, end, max_points)
+    points = []
+    if resolution == 1:
+        rows, _ = history.page(device_id, start, end, limit=max_points)
+        for row in rows:
+            point = {"timestamp": row["timestamp"], "count": 1}
+            for metric in METRICS:
+                point[metric + "_min"] = point[metric + "_max"] = point[metric + "_mean"] = row[metric]
+            points.append(point)
+        return resolution, points
+
+    # past the coarsest rollup's reach, merge runs of consecutive buckets so
+    # the answer still fits in max_points
+    width = resolution * max(1, math.ceil((end - start).total_seconds() / (resolution * max_points)))
+    origin = bucket_start(start, resolution)
+    rollups = VitalsRollup.objects.filter(
+        device_id=device_id, resolution=resolution,
+        bucket__gte=origin, bucket__lt=end,
+    ).order_by("bucket").values("bucket", *STAT_FIELDS)
+    groups = {}
+    for row in rollups:
+        key = int((row["bucket"] - origin).total_seconds()) // width
+        groups.setdefault(key, Bucket()).merge(Bucket.from_row(row))
+    for key, bucket in groups.items():
+        point = {"timestamp": (origin + datetime.timedelta(seconds=key * width)).timestamp(), "count": bucket.count}
+        for i, metric in enumerate(METRICS):
+            point[metric + "_min"] = bucket.mins[i]
+            point[metric + "_max"] = bucket.maxs[i]
+            point[metric + "_mean"] = bucket.sums[i] / bucket.counts[i] if bucket.counts[i] else None
+        points.append(point)
+    return width, points
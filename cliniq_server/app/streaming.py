@@ -0,0 +1,135 @@
+"""
+In-process pub/sub for live vitals, served as Server-Sent Events.
+
+Each open stream is one ``Stream``: an ``asyncio.Event`` and a dict holding
+the newest unsent event of each kind ("vitals", "alert") per watched device.
+Publishing overwrites that entry on the stream's event loop and sets the
+event, so an idle connection costs a few small objects, a slow client only
+ever sees the latest reading, and ingest never blocks on readers.
+
+The broker lives in the process that handles ``device_push``; run the ASGI
+app as a single process (or put a shared bus in front) for streams to see
+every push.
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+
+class Stream:
+    __slots__ = ("devices", "loop", "event", "pending")
+
+    def __init__(self, devices, loop):
+        self.devices = devices
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.pending = {}
+
+    def deliver(self, device_id, reading, kind="vitals"):
+        # always runs on self.loop
+        self.pending[kind, device_id] = reading
+        self.event.set()
+
+    async def next_batch(self, timeout):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.event.clear()
+        batch, self.pending = self.pending, {}
+        return batch
+
+
+class Broker:
+    def __init__(self):
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def open(self, devices):
+        stream = Stream(tuple(devices), asyncio.get_running_loop())
+        with self._lock:
+            for device_id in stream.devices:
+                self._streams.setdefault(device_id, set()).add(stream)
+        return stream
+
+    def close(self, stream):
+        with self._lock:
+            for device_id in stream.devices:
+                streams = self._streams.get(device_id)
+                if streams is not None:
+                    streams.discard(stream)
+                    if not streams:
+                        del self._streams[device_id]
+
+    def publish(self, device_id, reading, kind="vitals"):
+        """Safe to call from any thread."""
+        with self._lock:
+            streams = list(self._streams.get(device_id, ()))
+        for stream in streams:
+            try:
+                stream.loop.call_soon_threadsafe(stream.deliver, device_id, reading, kind)
+            except RuntimeError:
+                # the stream's event loop has already shut down
+                self.close(stream)
+
+    def connection_count(self):
+        with self._lock:
+            return len(set().union(*self._streams.values())) if self._streams else 0
+
+
+broker = Broker()
+
+
+def format_event(device_id, reading, kind="vitals"):
+    return "event: %s\ndata: %s\n\n" % (kind, json.dumps(dict(reading, device_id=device_id)))
+
+
+async def event_stream(devices, initial=None, heartbeat=15.0):
+    """Yield SSE frames for ``devices`` until the client goes away.
+    ``initial`` maps device ids to readings sent straight away."""
+    stream = broker.open(devices)
+    try:
+        for device_id, reading in (initial or {}).items():
+            yield format_event(device_id, reading)
+        while True:
+            batch = await stream.next_batch(heartbeat)
+            if batch is None:
+                yield ": keep-alive\n\n"
+                continue
+            for (kind, device_id), reading in batch.items():
+                yield format_event(device_id, reading, kind)
+    finally:
+        broker.close(stream)
+
+
+def body(request, chunks, batch=1):
+    """``chunks``, a sync iterator, as a ``StreamingHttpResponse`` body.
+
+    Django's ASGI handler reads a sync iterator to the end with
+    ``sync_to_async(list)`` before sending anything, so under ASGI the
+    chunks are handed over as an async iterator that pulls ``batch`` of
+    them per trip to the sync thread (where the database cursor lives).
+    Under WSGI the iterator is returned unchanged."""
+    if not isinstance(request, ASGIRequest):
+        return chunks
+    return _pull(iter(chunks), batch)
+
+
+async def _pull(chunks, batch):
+    fetch = sync_to_async(lambda: list(itertools.islice(chunks, batch)))
+    try:
+        while True:
+            items = await fetch()
+            if not items:
+                return
+            for item in items:
+                yield item
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            await sync_to_async(close)()
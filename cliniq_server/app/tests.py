@@ -1,3 +1,934 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+
+from app import (
+    access, anomaly, archive, auth, device_context, ecg, inference, ingest, presence, push_protocol, ratelimit,
+    response_cache, rollups, vitals_cache, wal,
+)
+from app.asgi import get_application
+from app.inference import NumpyPredictor
+from app.models import Config, Connection, DeviceRecords, IngestCheckpoint, UserProfile
+
+
+def make_user(username, **fields):
+    return UserProfile.objects.create(
+        surname="Test", first_name=username, username=username, password="x",
+        email="%s@example.com" % username, **fields
+    )
+
+
+class QueryCountTests(TestCase):
+    """Listing endpoints must issue a fixed number of queries, however many
+    rows they return."""
+
+    def setUp(self):
+        ratelimit.invalidate()
+
+    def connect(self, count):
+        caregiver = make_user("caregiver%d" % count)
+        for i in range(count):
+            patient = make_user("patient%d_%d" % (count, i))
+            Connection.objects.create(monitored=patient, monitored_by=caregiver, accepted=i % 2 == 0)
+            Connection.objects.create(monitored=caregiver, monitored_by=patient)
+        return caregiver
+
+    def test_get_connections_queries_do_not_scale_with_connections(self):
+        for count in (1, 25):
+            caregiver = self.connect(count)
+            with self.assertNumQueries(1):
+                response = self.client.get("/get_connections", {"username": caregiver.username})
+            data = response.json()
+            self.assertEqual(len(data["monitoring"]), count)
+            self.assertEqual(len(data["monitored_by"]), count)
+
+    def test_device_without_readings_is_looked_up_once(self):
+        make_user("patient", device_id="quiet-1")
+        access.invalidate()
+        with self.assertNumQueries(3):  # the access map (two) and the latest record
+            self.assertEqual(self.client.get("/get_vitals", {"username": "patient"}).json(), {"has_vitals": False})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/get_vitals", {"username": "patient"}).json(), {"has_vitals": False})
+
+    def test_written_through_reading_expires(self):
+        # another worker stores a newer reading; this one catches up once its own entry expires
+        now = [1000.0]
+        old = DeviceRecords.objects.create(device_id="dev-1", timestamp=timezone.now() - datetime.timedelta(seconds=30), heart_rate=60)
+        with mock.patch.object(vitals_cache, "_backend", vitals_cache.MemoryBackend()), \
+                mock.patch("app.vitals_cache.time.monotonic", lambda: now[0]):
+            vitals_cache.record_latest("dev-1", old)
+            DeviceRecords.objects.create(device_id="dev-1", timestamp=timezone.now(), heart_rate=80)
+            self.assertEqual(vitals_cache.get_latest("dev-1")["heart_rate"], 60)
+            now[0] += settings.VITALS_CACHE_TTL + 1
+            self.assertEqual(vitals_cache.get_latest("dev-1")["heart_rate"], 80)
+
+    def test_get_connections_fields(self):
+        caregiver = self.connect(1)
+        data = self.client.get("/get_connections", {"username": caregiver.username}).json()
+        self.assertEqual(data["monitoring"][0]["username"], "patient1_0")
+        self.assertEqual(data["monitoring"][0]["email"], "patient1_0@example.com")
+        self.assertTrue(data["monitoring"][0]["accepted"])
+        self.assertEqual(data["monitored_by"][0]["username"], "patient1_0")
+        self.assertFalse(data["monitored_by"][0]["accepted"])
+
+    def test_user_profiles_queries_do_not_scale_with_users(self):
+        for i in range(30):
+            make_user("user%d" % i)
+        for limit in (5, 25):
+            with self.assertNumQueries(1):
+                self.client.get("/user_profiles", {"limit": limit})
+
+    def test_user_profiles_cursor_pagination(self):
+        for i in range(7):
+            make_user("user%d" % i)
+        seen = []
+        cursor = 0
+        while cursor is not None:
+            data = self.client.get("/user_profiles", {"limit": 3, "cursor": cursor}).json()
+            seen += [user["username"] for user in data["users"]]
+            cursor = data["next_cursor"]
+        self.assertEqual(seen, ["user%d" % i for i in range(7)])
+
+        for limit in (0, -3):
+            data = self.client.get("/user_profiles", {"limit": limit}).json()
+            self.assertEqual(([user["username"] for user in data["users"]], data["next_cursor"] is None), (["user0"], False))
+
+
+class WriteBufferTests(TransactionTestCase):
+    # the flusher thread opens its own transaction, which TestCase's would block
+    def buffer(self, fail=0, **options):
+        batches = []
+        failures = [fail]
+
+        def bulk_create(rows, batch_size):
+            if failures[0]:
+                failures[0] -= 1
+                raise OperationalError("database is locked")
+            batches.append(list(rows))
+
+        return ingest.WriteBuffer(model=SimpleNamespace(objects=SimpleNamespace(bulk_create=bulk_create)), **options), batches
+
+    def wait_empty(self, buffer):
+        deadline = time.monotonic() + 5
+        while len(buffer) and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def test_flushes_on_size_and_age(self):
+        buffer, batches = self.buffer(flush_size=3, max_age=60)
+        buffer.put([1, 2])
+        time.sleep(0.05)
+        self.assertEqual((batches, len(buffer)), ([], 2))
+        buffer.put([3])
+        self.wait_empty(buffer)
+        self.assertEqual(batches, [[1, 2, 3]])
+
+        buffer, batches = self.buffer(flush_size=100, max_age=0.02)
+        buffer.put([1])
+        self.wait_empty(buffer)
+        self.assertEqual(batches, [[1]])
+
+    def test_rejects_when_full(self):
+        buffer, batches = self.buffer(flush_size=100, max_age=60, capacity=3)
+        buffer.put([1, 2])
+        with self.assertRaises(ingest.BufferFull):
+            buffer.put([3, 4], timeout=0)
+        with self.assertRaises(ValueError):
+            buffer.put([1, 2, 3, 4])
+        self.assertEqual(buffer.flush(), 2)
+        buffer.put([3, 4], timeout=0)
+
+    def test_failed_flush_is_retried_then_dropped(self):
+        buffer, batches = self.buffer(fail=1, flush_size=100, max_age=60, capacity=3, retry_delay=60)
+        buffer.put([1, 2])
+        with self.assertLogs("app.ingest", "ERROR"):
+            self.assertEqual(buffer.flush(), 0)
+        # the failed rows still hold their place in the buffer
+        self.assertEqual(len(buffer), 2)
+        with self.assertRaises(ingest.BufferFull):
+            buffer.put([3, 4], timeout=0)
+        buffer.put([3])
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(batches, [[1, 2], [3]])
+
+        buffer, batches = self.buffer(fail=3, flush_size=100, max_age=0, retries=2, retry_delay=0.001)
+        with self.assertLogs("app.ingest", "ERROR") as logs:
+            buffer.put([1, 2])
+            self.wait_empty(buffer)
+        self.assertEqual((batches, buffer.rows_dropped), ([], 2))
+        self.assertIn("dropping 2 buffered rows after 3 failed flushes", logs.output[-1])
+
+
+class BinaryPushTests(TestCase):
+    def setUp(self):
+        Config.objects.create(age=50, gender=0)
+        self.addCleanup(rollups.get_accumulator().flush)
+
+    def push(self, readings, restarted=False):
+        body = push_protocol.encode("bin-1", readings, restarted)
+        response = self.client.post("/device_push_binary", body, content_type="application/octet-stream")
+        ingest.get_buffer().drain()
+        return response.json()
+
+    def test_dedupes_and_fills_gaps(self):
+        now = int(timezone.now().timestamp())
+        reading = lambda seq, ecg_samples=(): (seq, now + seq, 97, 70, 36.62, ecg_samples)
+
+        result = self.push([reading(1, [100, -5, 7]), reading(2)], restarted=True)
+        self.assertEqual((result["accepted"], result["ack"], result["missing"]), (2, 2, []))
+        record = DeviceRecords.objects.get(timestamp=datetime.datetime.fromtimestamp(now + 1, datetime.timezone.utc))
+        self.assertEqual((record.device_id, record.heart_rate, record.temp), ("bin-1", 70, 36.62))
+        self.assertEqual(ecg.decode(record.ecg_frame).tolist(), [100, -5, 7])
+
+        # a retransmit plus a jump past 3..4
+        result = self.push([reading(2), reading(5), reading(6)])
+        self.assertEqual((result["accepted"], result["duplicates"], result["missing"]), (2, 1, [[3, 4]]))
+
+        result = self.push([reading(4)])
+        self.assertEqual((result["accepted"], result["ack"], result["missing"]), (1, 6, [[3, 3]]))
+        self.assertEqual(DeviceRecords.objects.filter(device_id="bin-1").count(), 5)
+
+    def test_failed_store_reopens_sequence_numbers(self):
+        now = int(timezone.now().timestamp())
+        readings = [(1, now, 97, 70, 36.6, ()), (2, now + 1, 97, 70, 36.6, ())]
+        with mock.patch("app.ingest.make_records", side_effect=RuntimeError("database down")):
+            with self.assertRaises(RuntimeError):
+                self.push(readings, restarted=True)
+        result = self.push(readings)  # the device resends
+        self.assertEqual((result["accepted"], result["duplicates"]), (2, 0))
+        self.assertEqual(DeviceRecords.objects.filter(device_id="bin-1").count(), 2)
+
+    def test_rejects_malformed_packets(self):
+        body = push_protocol.encode("bin-1", [(1, 0, 97, 70, 36.6, [1, 2])])
+        for bad in (body[:10], body[:-1], body + b"x", b"XX" + body[2:]):
+            response = self.client.post("/device_push_binary", bad, content_type="application/octet-stream")
+            self.assertEqual(response.status_code, 400)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        response_cache.invalidate()
+        ratelimit.invalidate()
+        self.patient = make_user("patient")
+        self.carer = make_user("carer")
+
+    def get(self, path, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.client.get(path, {"username": "patient"}, headers=headers)
+
+    def test_unchanged_profile_revalidates_without_queries(self):
+        first = self.get("/is_premium")
+        self.assertEqual(first.json(), {"value": False})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get("/is_premium", first["ETag"]).status_code, 304)
+            self.assertEqual(self.get("/is_premium").json(), {"value": False})
+
+        self.client.get("/set_premium", {"username": "patient", "value": "True"})
+        changed = self.get("/is_premium", first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+        self.assertEqual(changed.json(), {"value": True})
+
+    def test_connection_changes_update_both_sides(self):
+        etag = self.get("/get_connections")["ETag"]
+        self.client.get("/create_connection", {"monitored": "patient", "monitored_by": "carer"})
+        response = self.get("/get_connections", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["monitored_by"][0]["username"], "carer")
+
+        # the counterpart's email appears in the list
+        self.carer.email = "new@example.com"
+        self.carer.save()
+        response = self.get("/get_connections", response["ETag"])
+        self.assertEqual(response.json()["monitored_by"][0]["email"], "new@example.com")
+
+
+class AsyncAPITests(TransactionTestCase):
+    """Under ASGI the API is served by the async views through
+    settings.API_MIDDLEWARE; the admin keeps the full stack."""
+
+    def setUp(self):
+        access.invalidate()
+        ratelimit.invalidate()
+        response_cache.invalidate()
+        self.addCleanup(rollups.get_accumulator().flush)
+
+    def test_polled_endpoints_resolve_to_async_views(self):
+        for path in ("/get_vitals", "/user_profile", "/is_premium", "/has_device", "/get_connections", "/device_push"):
+            self.assertTrue(iscoroutinefunction(resolve(path, settings.API_URLCONF).func), path)
+        self.assertFalse(iscoroutinefunction(resolve("/get_vitals").func))
+
+    async def call(self, application, path, params=None, headers=()):
+        scope = {
+            "type": "http", "method": "GET", "path": path, "query_string": urlencode(params or {}).encode(),
+            "headers": [(b"host", b"localhost"), *headers], "server": ("localhost", 80), "client": ("127.0.0.1", 0),
+        }
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Future()  # the client never disconnects
+
+        async def send(message):
+            sent.append(message)
+
+        await application(scope, receive, send)
+        return sent[0]["status"], dict(sent[0]["headers"]), b"".join(m.get("body", b"") for m in sent[1:])
+
+    async def test_serves_api_and_admin_from_their_own_stacks(self):
+        await sync_to_async(make_user)("async-patient", device_id="async-dev", age=40, gender="female")
+        application = get_application(ASGIHandler())
+
+        status, _, _ = await self.call(application, "/device_push", {"device_id": "async-dev", "spo2": 97, "bpm": 71, "temp": 36.6})
+        self.assertEqual(status, 200)
+        status, headers, body = await self.call(application, "/get_vitals", {"username": "async-patient"})
+        self.assertEqual(json.loads(body)["heart_rate"], 71)
+        self.assertNotIn(b"X-Frame-Options", headers)  # no clickjacking middleware on the API
+
+        status, headers, body = await self.call(application, "/user_profile", {"username": "async-patient"})
+        self.assertEqual(json.loads(body)["device_id"], "async-dev")
+        status, _, _ = await self.call(application, "/user_profile", {"username": "async-patient"},
+                                       [(b"if-none-match", headers[b"ETag"])])
+        self.assertEqual(status, 304)
+
+        status, headers, _ = await self.call(application, "/admin/login/")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b"X-Frame-Options"], b"DENY")
+
+
+class TokenTests(TestCase):
+    def setUp(self):
+        access.invalidate()
+        ratelimit.invalidate()
+        self.client.get("/signup", {
+            "surname": "Test", "first_name": "Pat", "username": "patient", "password": "s3cret",
+            "phone_number": "", "email": "patient@example.com", "age": 40, "gender": "Female",
+        })
+        UserProfile.objects.filter(username="patient").update(device_id="dev-1")
+
+    def test_login_issues_token_used_instead_of_lookups(self):
+        self.assertNotEqual(UserProfile.objects.get().password, "s3cret")
+        self.assertFalse(self.client.get("/login", {"username": "patient", "password": "wrong"}).json()["success"])
+        self.assertFalse(self.client.get("/login", {"username": "nobody", "password": "s3cret"}).json()["success"])
+        result = self.client.get("/login", {"username": "patient", "password": "s3cret"}).json()
+        self.assertTrue(result["success"])
+        claims = auth.verify(result["token"])
+        self.assertEqual((claims.username, claims.own_device, claims.devices), ("patient", "dev-1", ("dev-1",)))
+
+        bearer = {"Authorization": "Bearer %s" % result["token"]}
+        with self.assertNumQueries(1):  # just the records page
+            response = self.client.get("/get_history", headers=bearer)
+        self.assertEqual(response.json(), {"records": [], "next_cursor": None})
+
+    def test_rejects_tampered_and_expired_tokens(self):
+        token = self.client.get("/login", {"username": "patient", "password": "s3cret"}).json()["token"]
+        response = self.client.get("/get_vitals", headers={"Authorization": "Bearer %sx" % token})
+        self.assertEqual(response.status_code, 401)
+        with self.settings(TOKEN_MAX_AGE=-1):
+            response = self.client.get("/get_vitals", headers={"Authorization": "Bearer %s" % token})
+        self.assertEqual(response.json()["error"], "token expired")
+
+    def test_revoked_tokens_are_rejected(self):
+        login = lambda: {"Authorization": "Bearer %s" % self.client.get(
+            "/login", {"username": "patient", "password": "s3cret"}).json()["token"]}
+        phone, laptop = login(), login()
+        self.assertEqual(self.client.get("/revoke_tokens").status_code, 401)
+        self.assertTrue(self.client.get("/revoke_tokens", headers=phone).json()["success"])
+        for bearer in (phone, laptop):
+            response = self.client.get("/get_vitals", headers=bearer)
+            self.assertEqual((response.status_code, response.json()["error"]), (401, "token revoked"))
+        self.assertEqual(self.client.get("/refresh_token", headers=laptop).status_code, 401)
+        # a later login is current again, and checking it costs no query
+        bearer = login()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get("/get_history", headers=bearer).status_code, 200)
+
+class AccessTests(TestCase):
+    def setUp(self):
+        access.invalidate()
+        ratelimit.invalidate()
+        self.patient = make_user("patient", device_id="dev-1")
+        self.carer = make_user("carer")
+
+    def test_connection_lifecycle_updates_access(self):
+        self.assertFalse(access.may_view_vitals("carer", "patient"))
+        self.assertTrue(access.may_view_vitals("patient", "patient"))
+
+        self.client.get("/create_connection", {"monitored": "patient", "monitored_by": "carer"})
+        self.assertFalse(access.may_view_vitals("carer", "patient"))
+        response = self.client.get("/create_connection", {"monitored": "patient", "monitored_by": "carer"})
+        self.assertFalse(response.json()["success"])
+
+        connection = Connection.objects.get()
+        self.client.get("/accept_connection", {"id": connection.id})
+        self.assertTrue(access.may_view_vitals("carer", "patient"))
+        self.assertFalse(access.may_view_diet("carer", "patient"))
+        self.assertEqual(access.get_map("carer").devices, ("dev-1",))
+
+        with self.assertNumQueries(0):
+            access.may_view_vitals("carer", "patient")
+
+        response = self.client.get("/set_connection_access", {"id": connection.id, "username": "carer", "vitals": "false"})
+        self.assertEqual(response.status_code, 403)
+        self.client.get("/set_connection_access", {"id": connection.id, "username": "patient", "vitals": "false", "diet": "true"})
+        self.assertFalse(access.may_view_vitals("carer", "patient"))
+        self.assertTrue(access.may_view_diet("carer", "patient"))
+        bearer = {"Authorization": "Bearer %s" % auth.issue(self.carer.id, access.get_map("carer"))}
+        response = self.client.get("/set_connection_access", {"id": connection.id, "vitals": "true"}, headers=bearer)
+        self.assertEqual(response.status_code, 403)
+        self.client.get("/set_connection_access", {"id": connection.id, "username": "patient", "vitals": "true"})
+        self.assertTrue(access.may_view_vitals("carer", "patient"))
+
+        self.client.get("/cancel_connection", {"id": connection.id})
+        self.assertFalse(access.may_view_vitals("carer", "patient"))
+
+    @override_settings(ACCESS_CACHE_SIZE=2)
+    def test_cache_keeps_the_newest_maps(self):
+        for viewer in ("patient", "carer", "spoofed-1", "spoofed-2"):
+            access.get_map(viewer)
+        self.assertEqual(list(access._maps), ["spoofed-1", "spoofed-2"])
+        with self.assertNumQueries(0):
+            access.get_map("spoofed-2")
+
+
+class IngestLogTests(TestCase):
+    def setUp(self):
+        Config.objects.create(age=30, gender=1)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def drain(self, batch_size=2):
+        call_command("drain_ingest_log", directory=self.tmp.name, once=True, batch_size=batch_size, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_drain_loads_sealed_segment_and_skips_torn_tail(self):
+        log = wal.IngestLog(self.tmp.name)
+        log.append_many([["dev-1", 1700000000 + i, 97, 70, 36.6, [1, 2, 3]] for i in range(5)])
+        (name,) = wal.segments(self.tmp.name)
+        path = os.path.join(self.tmp.name, name)
+
+        # still open: loaded and checkpointed, but the segment is kept
+        self.drain()
+        self.assertEqual(DeviceRecords.objects.count(), 5)
+        self.assertEqual(IngestCheckpoint.objects.get().offset, os.path.getsize(path))
+
+        log.append(["dev-1", 1700000005, 97, 70, 36.6, []])
+        with open(path, "ab") as f:
+            f.write(b"0000")  # crash mid-write
+        log.close()
+
+        self.drain()
+        self.assertEqual(DeviceRecords.objects.count(), 6)
+        self.assertEqual(ecg.decode(DeviceRecords.objects.earliest("timestamp").ecg_frame).tolist(), [1, 2, 3])
+        self.assertEqual(wal.segments(self.tmp.name), [])
+        self.assertFalse(IngestCheckpoint.objects.exists())
+
+    @override_settings(INGEST_MODE="log")
+    def test_logged_pushes_raise_alerts_in_the_web_process(self):
+        access.invalidate()
+        ratelimit.invalidate()
+        self.addCleanup(setattr, wal, "_log", wal._log)
+        wal._log = wal.IngestLog(self.tmp.name)
+        self.addCleanup(wal._log.close)
+        make_user("patient", device_id="log-1")
+        self.client.get("/device_push", {"device_id": "log-1", "spo2": 80, "bpm": 70, "temp": 36.6})
+        anomaly.get_detector().flush()
+        alerts = self.client.get("/get_alerts", {"username": "patient"}).json()["alerts"]
+        self.assertEqual([list(alert["metrics"]) for alert in alerts], [["blood_oxygen"]])
+        self.drain()
+        anomaly.get_detector().flush()
+        self.assertEqual(len(self.client.get("/get_alerts", {"username": "patient"}).json()["alerts"]), 1)
+
+
+class DeviceContextTests(TestCase):
+    def setUp(self):
+        device_context.invalidate()
+        Config.objects.create(age=50, gender=0)
+        # land pushed rollups while the test database still exists
+        self.addCleanup(rollups.get_accumulator().flush)
+
+    def push(self, device_id):
+        self.client.get("/device_push", {"device_id": device_id, "spo2": 97, "bpm": 70, "temp": 36.6})
+        return DeviceRecords.objects.latest("id")
+
+    def test_push_uses_owner_profile_and_caches_it(self):
+        make_user("owner", age=34, gender="male", device_id="dev-1")
+        record = self.push("dev-1")
+        self.assertEqual((record.age, record.gender), (34, 1))
+        with self.assertNumQueries(1):  # just the insert
+            self.client.get("/device_push", {"device_id": "dev-1", "spo2": 97, "bpm": 70, "temp": 36.6})
+
+    def test_unowned_device_falls_back_to_config_until_registered(self):
+        record = self.push("dev-2")
+        self.assertEqual((record.age, record.gender), (50, 0))
+
+        make_user("owner", age=61, gender="female")
+        self.client.get("/set_device_id", {"username": "owner", "device_id": "dev-2"})
+        record = self.push("dev-2")
+        self.assertEqual((record.age, record.gender), (61, 0))
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        ratelimit.invalidate()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        make_user("patient", device_id="dev-1")
+        now = timezone.now()
+        self.start = (now - datetime.timedelta(days=100)).replace(hour=1, minute=0, second=0, microsecond=0)
+        for i in range(6):
+            # three readings a day on two archivable days
+            DeviceRecords.objects.create(device_id="dev-1", timestamp=self.start + datetime.timedelta(days=i // 3, hours=i % 3),
+                                         heart_rate=60 + i, temp=36.5, ecg_frame=ecg.encode([i, i], 250))
+        for i in range(3):
+            DeviceRecords.objects.create(device_id="dev-1", timestamp=now - datetime.timedelta(minutes=3 - i),
+                                         heart_rate=70 + i, ecg_frame=ecg.encode([9], 250))
+
+    def history(self):
+        rates = []
+        cursor = None
+        while True:
+            params = {"username": "patient", "start": self.start.timestamp() - 1, "limit": 4}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.client.get("/get_history", params).json()
+            rates += [row["heart_rate"] for row in data["records"]]
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return rates
+
+    def check_reads_across_tiers(self):
+        call_command("archive_records", days=30, stdout=io.StringIO())
+        self.assertEqual(DeviceRecords.objects.count(), 3)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp.name, "dev-1"))), 2)
+        self.assertEqual(self.history(), [60, 61, 62, 63, 64, 65, 70, 71, 72])
+        response = self.client.get("/get_ecg", {"username": "patient", "start": self.start.timestamp() - 1})
+        samples = memoryview(b"".join(response.streaming_content)).cast("h")
+        self.assertEqual(list(samples), [0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 9, 9, 9])
+
+        response = self.client.get("/export_vitals", {"username": "patient", "format": "csv"})
+        exported = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual([int(row["heart_rate"]) for row in exported], [60, 61, 62, 63, 64, 65, 70, 71, 72])
+        self.assertEqual(exported[0]["timestamp"], self.start.isoformat())
+        self.assertEqual((exported[0]["temp"], exported[-1]["temp"]), ("36.5", ""))
+        response = self.client.get("/export_vitals", {"username": "patient", "format": "ndjson", "start": self.start.timestamp() + 1})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["heart_rate"] for line in lines], [61, 62, 63, 64, 65, 70, 71, 72])
+
+        # a late upload for an archived day is merged into its file
+        DeviceRecords.objects.create(device_id="dev-1", timestamp=self.start + datetime.timedelta(minutes=30), heart_rate=99)
+        call_command("archive_records", days=30, stdout=io.StringIO())
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp.name, "dev-1"))), 2)
+        self.assertEqual(self.history(), [60, 99, 61, 62, 63, 64, 65, 70, 71, 72])
+
+    def test_device_dirs_stay_inside_the_archive(self):
+        with override_settings(ARCHIVE_DIR=self.tmp.name):
+            for device_id in (".", "..", "../dev-1", ".hidden"):
+                self.assertEqual(os.path.dirname(archive.device_dir(device_id)), self.tmp.name)
+            self.assertNotEqual(archive.device_dir(".."), archive.device_dir("%2E."))
+
+    def test_pages_only_load_days_from_the_cursor_on(self):
+        with override_settings(ARCHIVE_DIR=self.tmp.name):
+            call_command("archive_records", days=30, stdout=io.StringIO())
+            params = {"username": "patient", "start": self.start.timestamp() - 1, "limit": 4}
+            cursor = self.client.get("/get_history", params).json()["next_cursor"]
+            with mock.patch("app.archive.load_columns", wraps=archive.load_columns) as load:
+                data = self.client.get("/get_history", dict(params, cursor=cursor)).json()
+        self.assertEqual([row["heart_rate"] for row in data["records"]], [64, 65, 70, 71])
+        second_day = (self.start + datetime.timedelta(days=1)).date().isoformat()
+        self.assertEqual({os.path.basename(call.args[0]) for call in load.call_args_list}, {second_day + ".npz"})
+
+    def test_history_limit_is_clamped(self):
+        for limit in (0, -3):
+            data = self.client.get("/get_history", {"username": "patient", "start": self.start.timestamp() - 1, "limit": limit}).json()
+            self.assertEqual(len(data["records"]), 1)
+            self.assertIsNotNone(data["next_cursor"])
+
+    async def test_ecg_streams_asynchronously_under_asgi(self):
+        response = await self.async_client.get("/get_ecg", {"username": "patient", "start": self.start.timestamp() - 1})
+        self.assertTrue(response.is_async)
+        samples = memoryview(b"".join([chunk async for chunk in response])).cast("h")
+        self.assertEqual(list(samples), [0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 9, 9, 9])
+
+    def test_reads_across_tiers_compressed(self):
+        with override_settings(ARCHIVE_DIR=self.tmp.name, ARCHIVE_COMPRESS=True):
+            self.check_reads_across_tiers()
+
+    def test_reads_across_tiers_memory_mapped(self):
+        with override_settings(ARCHIVE_DIR=self.tmp.name, ARCHIVE_COMPRESS=False):
+            self.check_reads_across_tiers()
+
+
+class InferenceTests(TestCase):
+    def engine(self, **options):
+        calls = []
+
+        def predict_batch(x):
+            calls.append(x.copy())
+            return np.stack([x[:, 3] + 50, x[:, 2] - 20], axis=1)  # sbp from bpm, dbp from spo2
+
+        return inference.BPInferenceEngine(predict_batch, **options), calls
+
+    def test_concurrent_requests_share_a_batch(self):
+        engine, calls = self.engine(max_wait=0.05)
+        entered, release = threading.Event(), threading.Event()
+        inner = engine.predict_batch
+
+        def predict_batch(x):
+            entered.set()
+            release.wait(5)  # hold the first batch until the others have queued
+            return inner(x)
+
+        engine.predict_batch = predict_batch
+        results = {}
+        threads = [threading.Thread(target=lambda bpm=bpm: results.update({bpm: engine.predict(40, 1, 97, bpm, 36.6)}))
+                   for bpm in range(60, 66)]
+        threads[0].start()
+        entered.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while engine._queue.qsize() < 5 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([len(batch) for batch in calls], [1, 5])
+        self.assertEqual(results, {bpm: (bpm + 50.0, 77.0) for bpm in range(60, 66)})
+
+    def test_repeated_inputs_are_served_from_the_lru_cache(self):
+        engine, calls = self.engine(cache_size=2)
+        a, b, c = (40, 1, 97, 70, 36.62), (40, 1, 97, 71, 36.6), (40, 1, 97, 72, 36.6)
+        self.assertEqual(engine.predict_many([a, b, a]), [(120.0, 77.0), (121.0, 77.0), (120.0, 77.0)])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(engine.predict(40, 1, 97, 70, 36.64), (120.0, 77.0))  # same quantized key as a
+        engine.predict(*c)  # evicts b, the least recently used
+        self.assertEqual((engine.hits, engine.misses, len(calls)), (1, 4, 2))
+        engine.predict(*a)
+        engine.predict(*b)
+        self.assertEqual((engine.hits, engine.misses, len(calls)), (2, 5, 3))
+
+    def test_predictor_errors_reach_callers_and_are_not_cached(self):
+        engine, calls = self.engine()
+        inner = engine.predict_batch
+        failures = [RuntimeError("model unavailable")]
+
+        def predict_batch(x):
+            if failures:
+                raise failures.pop()
+            return inner(x)
+
+        engine.predict_batch = predict_batch
+        with self.assertRaisesMessage(RuntimeError, "model unavailable"):
+            engine.predict(40, 1, 97, 70, 36.6)
+        # the worker carries on, and the failed input is predicted afresh
+        self.assertEqual(engine.predict(40, 1, 97, 70, 36.6), (120.0, 77.0))
+        self.assertEqual((engine.misses, engine.batches, len(calls)), (2, 1, 1))
+
+
+class TrainBPModelTests(TestCase):
+    def test_fits_linear_relationship_and_serves_it(self):
+        rng = np.random.default_rng(0)
+        DeviceRecords.objects.bulk_create(
+            DeviceRecords(device_id="dev-1", age=age, gender=gender, blood_oxygen=spo2, heart_rate=bpm, temp=temp,
+                          sbp=round(60 + age + bpm / 2), dbp=round(40 + age / 2 + 10 * gender))
+            for age, gender, spo2, bpm, temp in zip(rng.integers(20, 80, 500), rng.integers(0, 2, 500),
+                                                    rng.integers(90, 100, 500), rng.integers(50, 120, 500),
+                                                    rng.uniform(36, 38, 500))
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "model.npz")
+            out = io.StringIO()
+            call_command("train_bp_model", output=output, hidden=0, ridge=0, chunk_size=64, stdout=out)
+            self.assertIn("extracted 500 rows", out.getvalue())
+            sbp, dbp = NumpyPredictor(output)(np.array([[50, 1, 97, 80, 36.6]], dtype=np.float32))[0]
+        self.assertAlmostEqual(sbp, 150, delta=1)
+        self.assertAlmostEqual(dbp, 75, delta=1)
+
+
+class AnomalyTests(TestCase):
+    def test_spike_and_out_of_band_readings_are_flagged(self):
+        detector = anomaly.AnomalyDetector(warmup=5, bands={"blood_oxygen": (90, None)})
+        steady = [72, 97, 36.7, 120, 80]
+        for i in range(10):
+            flags = detector.observe(["a", "b"], np.array([i, i]), np.array([steady, steady], dtype=float) + i % 2)
+            self.assertFalse(flags.any())
+
+        # several readings of one device in a batch are scored in order
+        flags = detector.observe(["a", "a", "b"], np.array([10, 11, 10]), np.array([
+            steady, [150, 97, 36.7, 120, 80], [72, 85, np.nan, 120, 80],
+        ]))
+        self.assertEqual(flags.tolist(), [
+            [False] * 5, [True, False, False, False, False], [False, True, False, False, False],
+        ])
+        alerts = detector.recent(["a", "b"])
+        self.assertEqual([(a["device_id"], list(a["metrics"])) for a in alerts], [("b", ["blood_oxygen"]), ("a", ["heart_rate"])])
+        self.assertEqual(alerts[0]["metrics"]["blood_oxygen"]["reason"], "out_of_range")
+
+    def test_spike_after_flat_series_is_flagged(self):
+        detector = anomaly.AnomalyDetector(warmup=5, min_std={"heart_rate": 2.0})
+        flat = [72, 97, 36.7, 120, 80]
+        for i in range(10):
+            self.assertFalse(detector.observe(["a"], np.array([i]), np.array([flat], dtype=float)).any())
+        flags = detector.observe(["a", "a"], np.array([10, 11]), np.array([[80, 97, 36.7, 120, 80], [95, 97, 36.7, 120, 80]]))
+        self.assertEqual(flags[:, 0].tolist(), [False, True])  # z 4.0 is not beyond the threshold, z 11.3 is
+        self.assertFalse(flags[:, 1:].any())  # unfloored metrics still never score on a zero deviation
+
+
+class RollupTests(TestCase):
+    start = datetime.datetime(2026, 1, 5, 10, tzinfo=datetime.timezone.utc)
+
+    def test_choose_resolution(self):
+        hour = datetime.timedelta(hours=1)
+        self.assertEqual(rollups.choose_resolution(self.start, self.start + datetime.timedelta(minutes=5), 500), 1)
+        self.assertEqual(rollups.choose_resolution(self.start, self.start + 8 * hour, 500), 60)
+        self.assertEqual(rollups.choose_resolution(self.start, self.start + 24 * hour, 500), 900)
+        self.assertEqual(rollups.choose_resolution(self.start, self.start + 30 * 24 * hour, 1000), 3600)
+        self.assertEqual(rollups.choose_resolution(self.start, self.start + 365 * 24 * hour, 100), 3600)
+
+    def test_trend_mean_counts_each_metric(self):
+        accumulator = rollups.RollupAccumulator()
+        for seconds, heart_rate, sbp in ((0, 60, 120), (10, 70, None), (20, 80, None), (70, 90, 130)):
+            rollups.add_to_buckets(accumulator._buckets, "dev-1", self.start + datetime.timedelta(seconds=seconds),
+                                   [None, heart_rate, None, sbp, None])
+        accumulator.flush()
+        resolution, points = rollups.trend("dev-1", self.start, self.start + datetime.timedelta(hours=8))
+        self.assertEqual(resolution, 60)
+        self.assertEqual([p["count"] for p in points], [3, 1])
+        self.assertEqual([p["heart_rate_mean"] for p in points], [70, 90])
+        self.assertEqual([p["sbp_mean"] for p in points], [120, 130])  # not 40, over readings without one
+        self.assertEqual([p["temp_mean"] for p in points], [None, None])
+
+    def test_trend_merges_hours_beyond_max_points(self):
+        accumulator = rollups.RollupAccumulator()
+        for hours in range(10):
+            rollups.add_to_buckets(accumulator._buckets, "dev-1", self.start + datetime.timedelta(hours=hours),
+                                   [None, 60 + hours, None, None, None])
+        accumulator.flush()
+        resolution, points = rollups.trend("dev-1", self.start, self.start + datetime.timedelta(hours=10), 4)
+        self.assertEqual(resolution, 3 * 3600)
+        self.assertEqual([p["count"] for p in points], [3, 3, 3, 1])
+        self.assertEqual([p["heart_rate_mean"] for p in points], [61, 64, 67, 69])
+        self.assertEqual(points[1]["timestamp"], (self.start + datetime.timedelta(hours=3)).timestamp())
+
+    def test_get_trend_points_are_clamped(self):
+        ratelimit.invalidate()
+        make_user("patient", device_id="dev-1")
+        accumulator = rollups.RollupAccumulator()
+        for hours in range(2):
+            rollups.add_to_buckets(accumulator._buckets, "dev-1", self.start + datetime.timedelta(hours=hours),
+                                   [None, 60, None, None, None])
+        accumulator.flush()
+        response = self.client.get("/get_trend", {"username": "patient", "points": 0, "start": self.start.timestamp(),
+                                                  "end": (self.start + datetime.timedelta(hours=2)).timestamp()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["points"]), 1)
+
+    def test_failed_flush_merges_buckets_back(self):
+        accumulator = rollups.RollupAccumulator()
+        at = self.start + datetime.timedelta(seconds=5)
+        rollups.add_to_buckets(accumulator._buckets, "dev-1", self.start, [None, 60, None, None, None])
+
+        def fail(buckets):
+            # a reading for the same minute arrives while the write is failing
+            rollups.add_to_buckets(accumulator._buckets, "dev-1", at, [None, 80, None, None, None])
+            raise RuntimeError("database is locked")
+
+        with mock.patch("app.rollups.save_buckets", side_effect=fail), self.assertRaises(RuntimeError):
+            accumulator.flush()
+        self.assertEqual(len(accumulator._buckets), len(rollups.RESOLUTIONS))
+        accumulator.flush()
+        self.assertEqual(accumulator._buckets, {})
+        _, points = rollups.trend("dev-1", self.start, self.start + datetime.timedelta(hours=8))
+        self.assertEqual([(p["count"], p["heart_rate_min"], p["heart_rate_max"], p["heart_rate_mean"]) for p in points],
+                         [(2, 60, 80, 70)])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        access.invalidate()
+        ratelimit.invalidate()
+
+    def test_requires_vitals_access(self):
+        make_user("patient", device_id="dev-1")
+        make_user("stranger")
+        response = self.client.get("/export_vitals", {"username": "stranger", "device_id": "dev-1"})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get("/export_vitals", {"username": "patient", "format": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_streams_asynchronously_under_asgi(self):
+        # a sync body would be read to the end by the ASGI handler before sending
+        await sync_to_async(make_user)("patient", device_id="dev-1")
+        for minute in range(3):
+            await DeviceRecords.objects.acreate(device_id="dev-1", timestamp=timezone.now() - datetime.timedelta(minutes=3 - minute),
+                                                heart_rate=70 + minute)
+        response = await self.async_client.get("/export_vitals", {"username": "patient", "format": "ndjson"})
+        self.assertTrue(response.is_async)
+        lines = b"".join([chunk async for chunk in response]).decode().splitlines()
+        self.assertEqual([json.loads(line)["heart_rate"] for line in lines], [70, 71, 72])
+
+
+class PresenceTests(TestCase):
+    def test_transitions_and_incremental_status(self):
+        now = [1000.0]
+        tracker = presence.PresenceTracker(timeout=3, sweep_interval=0.5, clock=lambda: now[0])
+        tracker.seen("a")
+        tracker.seen("b")
+        cursor, devices, full = tracker.status(["a", "b", "c"])
+        self.assertTrue(full)
+        self.assertEqual({d: s["online"] for d, s in devices.items()}, {"a": True, "b": True, "c": False})
+
+        now[0] = 1002.0
+        tracker.seen("a")
+        self.assertEqual(tracker.status(["a", "b", "c"], since=cursor)[1], {})  # still online, nothing changed
+
+        now[0] = 1003.5  # b's deadline passed; a's was re-armed to 1005
+        cursor, devices, full = tracker.status(["a", "b", "c"], since=cursor)
+        self.assertEqual((devices, full), ({"b": {"online": False, "last_seen": 1000.0}}, False))
+
+        now[0] = 1005.0
+        self.assertEqual(list(tracker.status(["a", "b"], since=cursor)[1]), ["a"])
+        self.assertTrue(tracker.status(["a"], since=cursor + 100)[2])  # unknown cursor: full answer
+
+    def test_push_brings_monitored_device_online(self):
+        Config.objects.create(age=50, gender=0)
+        self.addCleanup(rollups.get_accumulator().flush)
+        access.invalidate()
+        patient = make_user("patient", device_id="presence-1")
+        carer = make_user("carer")
+        Connection.objects.create(monitored=patient, monitored_by=carer, accepted=True, access_vital_signs_data=True)
+        self.client.get("/device_push", {"device_id": "presence-1", "spo2": 97, "bpm": 70, "temp": 36.6})
+        data = self.client.get("/get_presence", {"username": "carer"}).json()
+        self.assertTrue(data["devices"]["presence-1"]["online"])
+        with self.assertNumQueries(0):
+            data = self.client.get("/get_presence", {"username": "carer", "since": data["cursor"]}).json()
+        self.assertEqual(data["devices"], {})
+
+        # get_vitals agrees with the tracker, not with the age of the cached reading
+        self.assertTrue(self.client.get("/get_vitals", {"username": "patient"}).json()["online"])
+        presence.get_tracker().sweep(time.time() + settings.PRESENCE_TIMEOUT + 1)
+        vitals = self.client.get("/get_vitals", {"username": "patient"}).json()
+        self.assertEqual((vitals["has_vitals"], vitals["online"]), (True, False))
+
+        # a fresh reading this process's tracker never saw was pushed to another worker
+        make_user("elsewhere", device_id="presence-2")
+        DeviceRecords.objects.create(device_id="presence-2", timestamp=timezone.now(), heart_rate=70)
+        self.assertTrue(self.client.get("/get_vitals", {"username": "elsewhere"}).json()["online"])
+        self.assertFalse(presence.is_online("presence-3", time.time() - 300))
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        access.invalidate()
+        ratelimit.invalidate()
+
+    def test_bucket_refills_over_time(self):
+        now = [0.0]
+        buckets = ratelimit.TokenBuckets(shards=4, clock=lambda: now[0])
+        self.assertEqual([buckets.take("a", 2, 3) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(buckets.take("a", 2, 3), 0.5)
+        self.assertEqual(buckets.take("b", 2, 3), 0)  # buckets are independent
+        now[0] = 0.5
+        self.assertEqual(buckets.take("a", 2, 3), 0)
+        now[0] = 100.0
+        self.assertEqual([buckets.take("a", 2, 3) for _ in range(4)][-1], 0.5)  # refilled only up to the burst
+
+    @override_settings(RATE_LIMITS={"ingest": (0.01, 2), "poll": (0.01, 2), "history": (0.01, 2)},
+                       PREMIUM_RATE_LIMITS={"poll": (0.01, 4)})
+    def test_over_quota_reads_rejected_before_queries(self):
+        make_user("patient", device_id="dev-1")
+        make_user("vip", device_id="dev-2")
+        self.client.get("/set_premium", {"username": "vip", "value": "True"})
+        for _ in range(2):
+            self.assertEqual(self.client.get("/is_premium", {"username": "patient"}).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get("/is_premium", {"username": "patient"})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "100")
+        # other groups and users have their own buckets
+        self.assertEqual(self.client.get("/get_history", {"username": "patient"}).status_code, 200)
+        # only a token earns the premium tier; a bare ?username= could be anyone
+        statuses = [self.client.get("/is_premium", {"username": "vip"}).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200] * 2 + [429])
+        vip = UserProfile.objects.get(username="vip")
+        bearer = {"Authorization": "Bearer %s" % auth.issue(vip.id, access.get_map("vip"), premium=True)}
+        statuses = [self.client.get("/is_premium", headers=bearer).status_code for _ in range(5)]
+        self.assertEqual(statuses, [200] * 4 + [429])
+        # and a ?username= caller elsewhere has their own bucket
+        response = self.client.get("/is_premium", {"username": "patient"}, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(RATE_LIMITS={"ingest": (0.01, 2), "poll": (0.01, 2), "history": (0.01, 2)})
+    def test_ingest_limited_per_device(self):
+        Config.objects.create(age=50, gender=0)
+        self.addCleanup(rollups.get_accumulator().flush)
+        now = int(timezone.now().timestamp())
+
+        def push(device_id, seq):
+            body = push_protocol.encode(device_id, [(seq, now + seq, 97, 70, 36.6, ())], restarted=seq == 1)
+            return self.client.post("/device_push_binary", body, content_type="application/octet-stream")
+
+        self.assertEqual([push("limited-1", seq).status_code for seq in (1, 2)], [200, 200])
+        with self.assertNumQueries(0):
+            self.assertEqual(push("limited-1", 3).status_code, 429)
+        self.assertEqual(push("limited-2", 1).status_code, 200)
+        ingest.get_buffer().drain()
+
+
+class BenchCommandTests(SimpleTestCase):
+    """Every benchmark runs end to end on tiny inputs, so a view change that
+    breaks one shows up here rather than when someone next measures. Each
+    runs in its own process, as it would from the shell: the benchmarks
+    build their own scratch database and leave worker threads behind."""
+
+    COMMANDS = [
+        ("bench_anomaly", "--devices", "10", "--ticks", "6", "--burst", "2"),
+        ("bench_asgi", "--requests", "20", "--concurrency", "2", "--users", "3"),
+        ("bench_auth", "--users", "3", "--logins", "1", "--requests", "10"),
+        ("bench_ecg", "--frames", "5", "--samples", "10"),
+        ("bench_export", "--rows", "50"),
+        ("bench_ingest", "--rows", "50", "--request-size", "5", "--flush-size", "10"),
+        ("bench_predictors", "--calls", "3"),
+        ("bench_presence", "--devices", "20", "--seconds", "2", "--monitored", "5"),
+        ("bench_push_protocol", "--readings", "20", "--batch", "2", "--ecg-samples", "0", "4"),
+        ("bench_ratelimit", "--keys", "10", "--checks", "100", "--threads", "1", "--requests", "5"),
+        ("bench_rollups", "--days", "1", "--points", "50"),
+        ("bench_stream", "--connections", "5", "--devices", "2"),
+        ("bench_vitals", "--sizes", "10", "--polls", "5"),
+        ("bench_wal", "--pushes", "20", "--concurrency", "2", "--devices", "3"),
+        ("loadtest", "--devices", "2", "--dashboards", "2", "--duration", "1", "--workers", "2"),
+    ]
+
+    def test_every_bench_command_runs(self):
+        manage = os.path.join(settings.BASE_DIR, "manage.py")
+        with tempfile.TemporaryDirectory() as tmp:
+            # never open the checked-in database, even to read it
+            env = dict(os.environ, DB_ENGINE="sqlite3", DB_NAME=os.path.join(tmp, "db.sqlite3"))
+            for name, *args in self.COMMANDS:
+                with self.subTest(name):
+                    result = subprocess.run([sys.executable, manage, name, *args], env=env, cwd=tmp,
+                                            capture_output=True, text=True, timeout=300)
+                    self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+                    self.assertTrue(result.stdout)
@@ -6,17 +6,31 @@ urlpatterns = [
     path("", views.home),
     path('signup', views.signup),
     path('login', views.login),
+    path('refresh_token', views.refresh_token),
+    path('revoke_tokens', views.revoke_tokens),
     path('create_connection', views.create_connection),
     path('get_connections', views.get_connections),
     path('accept_connection', views.accept_connection),
     path('cancel_connection', views.cancel_connection),
+    path('set_connection_access', views.set_connection_access),
     path("set_device_id", views.set_device_id),
     path("has_device", views.has_device),
     path("set_premium", views.set_premium),
     path("is_premium", views.is_premium),
     path("device_push", views.device_push_data),
+    path("device_push_bulk", views.device_push_bulk),
+    path("device_push_binary", views.device_push_binary),
     path("user_profile", views.user_profile),
     path("user_profiles", views.user_profiles),
     path("get_vitals", views.get_vitals),
+    path("get_history", views.get_history),
+    path("get_trend", views.get_trend),
+    path("get_ecg", views.get_ecg),
+    path("stream_vitals", views.stream_vitals),
+    path("get_alerts", views.get_alerts),
+    path("get_presence", views.get_presence),
+    path("export_vitals", views.export_vitals),
+    path("metrics", views.metrics_view),
+    path("metrics/queries", views.sampled_queries),
     # path("has_vitals", views.has_vitals),
 ]
\ No newline at end of file
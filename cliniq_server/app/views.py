@@ -1,23 +1,39 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from app.models import *
-import random
-import os
+from app import ingest
+from app import vitals_cache
+from app import history
+from app import streaming
+from app import rollups
+from app import ecg
+from app import metrics
+from app import access
+from app import wal
+from app import device_context
+from app import archive
+from app import anomaly
+from app import response_cache
+from app import push_protocol
+from app import auth
+from app import presence
+from app import export
+from app import inference
+import json
+import time
 import datetime
+import heapq
+import asyncio
+import contextvars
+import functools
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.db.models import F, Q
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 
 
-deployed_on_pythonanywhere = False
-if os.getenv("PYTHONANYWHERE_DOMAIN_") is not None:
-    deployed_on_pythonanywhere = True
-    global model
-    import tensorflow as tf
-    model_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), "model.keras")
-    model = tf.keras.models.load_model(model_path)
-
-
-
 def home(request):
     return redirect("/admin")
 
@@ -37,7 +53,7 @@ def signup(request):
             surname=surname,
             first_name=first_name,
             username=username,
-            password=password,
+            password=make_password(password),
             email=email,
             age=age,
             gender=gender.lower(),
@@ -51,9 +67,37 @@ def login(request):
     username = request.GET["username"]
     password = request.GET["password"]
 
-    if UserProfile.objects.filter(username=username, password=password).exists():
-        return JsonResponse({"success": True})
-    return JsonResponse({"success": False})
+    user = UserProfile.objects.filter(username=username).only("id", "password", "premium_plan").first()
+    if user is None:
+        make_password(password)  # as slow as a wrong password, so usernames cannot be probed
+        return JsonResponse({"success": False})
+
+    def upgrade(raw_password):
+        # rehash with the current hasher settings after a successful check
+        UserProfile.objects.filter(id=user.id).update(password=make_password(raw_password))
+
+    if not check_password(password, user.password, upgrade):
+        return JsonResponse({"success": False})
+    return JsonResponse({"success": True, "token": auth.issue(user.id, access.get_map(username), user.premium_plan)})
+
+
+def refresh_token(request):
+    # a fresh token with current grants, for a client holding a valid one
+    if request.claims is None:
+        return JsonResponse({"success": False, "error": "token required"}, status=401)
+    claims = request.claims
+    access.invalidate(claims.username)
+    premium = UserProfile.objects.filter(id=claims.user_id).values_list("premium_plan", flat=True).first()
+    return JsonResponse({"success": True, "token": auth.issue(claims.user_id, access.get_map(claims.username), bool(premium))})
+
+
+def revoke_tokens(request):
+    # every token issued to the caller so far stops working, this one included
+    if request.claims is None:
+        return JsonResponse({"success": False, "error": "token required"}, status=401)
+    UserProfile.objects.filter(id=request.claims.user_id).update(token_version=F("token_version") + 1)
+    access.invalidate(request.claims.username)
+    return JsonResponse({"success": True})
 
 
 def create_connection(request):
@@ -63,51 +107,93 @@ def create_connection(request):
     monitored = UserProfile.objects.get(username=monitored_username)
     monitored_by = UserProfile.objects.get(username=monitored_by_username)
 
-    if not Connection.objects.filter(monitored=monitored, monitored_by=monitored_by).exists():
-        Connection.objects.create(
-            monitored=monitored,
-            monitored_by=monitored_by
-        )
-        return JsonResponse({"success": True})
-    return JsonResponse({"success": False})
+    # get_or_create retries the lookup if a concurrent request inserted the pair first
+    _, created = Connection.objects.get_or_create(monitored=monitored, monitored_by=monitored_by, defaults={
+        "access_vital_signs_data": request.GET.get("vitals", "true") == "true",
+        "access_diet_data": request.GET.get("diet") == "true",
+    })
+    if created:
+        access.invalidate(monitored_by_username)
+    return JsonResponse({"success": created})
+
+
+def set_connection_access(request):
+    # the monitored user changes what an existing connection shares
+    connection = Connection.objects.select_related("monitored", "monitored_by").get(id=request.GET["id"])
+    if auth.viewer(request) != connection.monitored.username:
+        return JsonResponse({"success": False, "error": "only the monitored user can change access"}, status=403)
+    if "vitals" in request.GET:
+        connection.access_vital_signs_data = request.GET["vitals"] == "true"
+    if "diet" in request.GET:
+        connection.access_diet_data = request.GET["diet"] == "true"
+    connection.save()
+    access.invalidate(connection.monitored_by.username)
+    return JsonResponse({"success": True})
 
 
-def get_connections(request):
-    username = request.GET["username"]
-    user = UserProfile.objects.get(username=username)
+def connection_rows(username):
+    return Connection.objects.filter(
+        Q(monitored__username=username) | Q(monitored_by__username=username)
+    ).order_by("id").values(
+        "id", "accepted",
+        "monitored__username", "monitored__email",
+        "monitored_by__username", "monitored_by__email",
+    )
+
 
+def connections_payload(username, connections):
     monitoring = []
     monitored_by = []
+    for conn in connections:
+        if conn["monitored__username"] == username:
+            monitored_by.append({
+                "username": conn["monitored_by__username"],
+                "email": conn["monitored_by__email"],
+                "accepted": conn["accepted"],
+                "id": conn["id"],
+            })
+        if conn["monitored_by__username"] == username:
+            monitoring.append({
+                "username": conn["monitored__username"],
+                "email": conn["monitored__email"],
+                "accepted": conn["accepted"],
+                "id": conn["id"],
+            })
+    return {"monitoring": monitoring, "monitored_by": monitored_by}
+
+
+def get_connections(request):
+    username = auth.viewer(request)
+
+    def build():
+        return connections_payload(username, connection_rows(username))
+
+    return response_cache.respond(request, "connections", username, build)
+
+
+async def aget_connections(request):
+    username = auth.viewer(request)
 
-    for conn in Connection.objects.filter(monitored=user):
-        monitored_by.append({
-            "username": conn.monitored_by.username,
-            "email": conn.monitored_by.email,
-            "accepted": conn.accepted,
-            "id": conn.id,
-        })
-    for conn in Connection.objects.filter(monitored_by=user):
-        monitoring.append({
-            "username": conn.monitored.username,
-            "email": conn.monitored.email,
-            "accepted": conn.accepted,
-            "id": conn.id,
-        })
-    return JsonResponse({"monitoring": monitoring, "monitored_by": monitored_by})
+    async def build():
+        return connections_payload(username, [conn async for conn in connection_rows(username)])
+
+    return await response_cache.arespond(request, "connections", username, build)
 
 
 def accept_connection(request):
     connection_id = request.GET["id"]
-    connection = Connection.objects.get(id=connection_id)
+    connection = Connection.objects.select_related("monitored_by").get(id=connection_id)
     connection.accepted = True
     connection.save()
+    access.invalidate(connection.monitored_by.username)
     return JsonResponse({"success": True})
 
 
 def cancel_connection(request):
     connection_id = request.GET["id"]
-    connection = Connection.objects.get(id=connection_id)
+    connection = Connection.objects.select_related("monitored_by").get(id=connection_id)
     connection.delete()
+    access.invalidate(connection.monitored_by.username)
     return JsonResponse({"success": True})
 
 def set_device_id(request):
@@ -116,13 +202,28 @@ def set_device_id(request):
     user = UserProfile.objects.get(username=username)
     user.device_id = device_id
     user.save()
+    access.invalidate()
     return JsonResponse({"success": True})
 
 
 def has_device(request):
-    username = request.GET["username"]
-    user = UserProfile.objects.get(username=username)
-    return JsonResponse({"value": user.device_id is not None and user.device_id != ""})
+    username = auth.viewer(request)
+
+    def build():
+        device_id = UserProfile.objects.filter(username=username).values_list("device_id", flat=True).get()
+        return {"value": device_id is not None and device_id != ""}
+
+    return response_cache.respond(request, "profile", username, build)
+
+
+async def ahas_device(request):
+    username = auth.viewer(request)
+
+    async def build():
+        device_id = await UserProfile.objects.filter(username=username).values_list("device_id", flat=True).aget()
+        return {"value": device_id is not None and device_id != ""}
+
+    return await response_cache.arespond(request, "profile", username, build)
 
 
 def set_premium(request):
@@ -135,36 +236,167 @@ def set_premium(request):
 
 
 def is_premium(request):
-    username = request.GET["username"]
-    user = UserProfile.objects.get(username=username)
-    return JsonResponse({"value": user.premium_plan})
+    username = auth.viewer(request)
+
+    def build():
+        premium_plan = UserProfile.objects.filter(username=username).values_list("premium_plan", flat=True).get()
+        return {"value": premium_plan}
+
+    return response_cache.respond(request, "profile", username, build)
+
+
+async def ais_premium(request):
+    username = auth.viewer(request)
+
+    async def build():
+        premium_plan = await UserProfile.objects.filter(username=username).values_list("premium_plan", flat=True).aget()
+        return {"value": premium_plan}
+
+    return await response_cache.arespond(request, "profile", username, build)
+
+
+def publish_latest(device_id, record):
+    reading = vitals_cache.record_latest(device_id, record)
+    if reading is not None:
+        streaming.broker.publish(device_id, reading)
+
+def ingested(device_id, records):
+    # presence, live view, rollups and anomaly alerts for freshly stored records
+    presence.seen(device_id)
+    if records:
+        publish_latest(device_id, max(records, key=lambda r: r.timestamp))
+    rollups.get_accumulator().add(records)
+    anomaly.add(records)
+
+def log_readings(readings):
+    # Write-ahead path: make the readings durable, show them live with the
+    # last known BP, and leave inference and the insert to drain_ingest_log.
+    # Alerts are scored here, as the drainer's process serves no reads.
+    wal.get_log().append_many([list(reading[:5]) + [[int(v) for v in reading[5]]] for reading in readings])
+    anomaly.add_readings(readings)
+    device_id, ts, spo2, bpm, temp, samples = max(readings, key=lambda reading: reading[1])
+    presence.seen(device_id)
+    previous = vitals_cache.get_backend().get(device_id) or {}
+    publish_latest(device_id, DeviceRecords(
+        device_id=device_id, timestamp=datetime.datetime.fromtimestamp(ts, datetime.timezone.utc),
+        blood_oxygen=spo2, heart_rate=bpm, temp=temp, sbp=previous.get("sbp"), dbp=previous.get("dbp"), ecg_frame=ingest.pack_ecg(samples),
+    ))
+
+def push_params(request):
+    return (
+        request.GET.get("device_id", settings.DEFAULT_DEVICE_ID),
+        int(request.GET["spo2"]),
+        int(request.GET["bpm"]),
+        float(request.GET["temp"]),
+        ecg.parse_text(request.GET.get("ecg")),
+    )
+
+@csrf_exempt
+def device_push_data(request):
+    device_id, spo2, bpm, temp, samples = push_params(request)
+    if settings.INGEST_MODE == "log":
+        log_readings([(device_id, time.time(), spo2, bpm, temp, samples)])
+        return JsonResponse({"success": True})
+
+    context = device_context.get_context(device_id)
 
+    age = context.age
+    gender = context.gender
+    sbp, dbp = ingest.getBP(age, gender, spo2, bpm, temp)
 
-def getBP(age, gender, spo2, bpm, temp):
-    if deployed_on_pythonanywhere:
-        import tensorflow as tf
-        pred = model.predict(tf.constant([[int(age), int(gender), int(spo2), int(bpm), float(temp)]]))
-        return pred[0][0], pred[0][1]
-    return random.randint(110, 130), random.randint(70, 90)
+    record = DeviceRecords.objects.create(device_id=device_id, age=age, gender=gender, blood_oxygen=spo2, heart_rate=bpm, temp=temp, sbp=sbp, dbp=dbp, ecg_frame=ingest.pack_ecg(samples))
+    ingested(device_id, [record])
+    return JsonResponse({"success": True})
+
+async def run_inference(func, *args):
+    # A model call can block for a while; run it off the event loop, keeping
+    # the request's context so its inference time is still recorded.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference.get_executor(), functools.partial(contextvars.copy_context().run, func, *args))
 
 @csrf_exempt
-def device_push_data(request):
-    config = Config.objects.all()[0]
+async def adevice_push_data(request):
+    device_id, spo2, bpm, temp, samples = push_params(request)
+    if settings.INGEST_MODE == "log":
+        await sync_to_async(log_readings, thread_sensitive=False)([(device_id, time.time(), spo2, bpm, temp, samples)])
+        return JsonResponse({"success": True})
+
+    context = await sync_to_async(device_context.get_context)(device_id)
 
-    age = config.age
-    gender = config.gender
-    spo2 = int(request.GET["spo2"])
-    bpm = int(request.GET["bpm"])
-    temp = float(request.GET["temp"])
-    sbp, dbp = getBP(age, gender, spo2, bpm, temp)
+    age = context.age
+    gender = context.gender
+    sbp, dbp = await run_inference(ingest.getBP, age, gender, spo2, bpm, temp)
 
-    DeviceRecords.objects.create(age=age, gender=gender, blood_oxygen=spo2, heart_rate=bpm, temp=temp, sbp=sbp, dbp=dbp, ecg_sensor_frame="[]")
+    record = await DeviceRecords.objects.acreate(device_id=device_id, age=age, gender=gender, blood_oxygen=spo2, heart_rate=bpm, temp=temp, sbp=sbp, dbp=dbp, ecg_frame=ingest.pack_ecg(samples))
+    await sync_to_async(ingested, thread_sensitive=False)(device_id, [record])
     return JsonResponse({"success": True})
 
-def user_profile(request):
-    username = request.GET["username"]
-    user = UserProfile.objects.get(username=username)
+@csrf_exempt
+def device_push_bulk(request):
+    # body: {"device_id": "...", "readings": [[unix_ts, spo2, bpm, temp, <optional ecg samples>], ...]}
+    payload = json.loads(request.body)
+    device_id = payload.get("device_id", settings.DEFAULT_DEVICE_ID)
+    readings = [
+        (device_id, float(ts), int(spo2), int(bpm), float(temp), samples[0] if samples else [])
+        for ts, spo2, bpm, temp, *samples in payload["readings"]
+    ]
+    if settings.INGEST_MODE == "log":
+        if readings:
+            log_readings(readings)
+        return JsonResponse({"success": True, "accepted": len(readings)})
+
+    records = ingest.make_records(readings)
+
+    try:
+        ingest.get_buffer().put(records)
+    except ingest.BufferFull:
+        return JsonResponse({"success": False, "retry": True}, status=503)
+    ingested(device_id, records)
+    return JsonResponse({"success": True, "accepted": len(records)})
+
+
+@csrf_exempt
+def device_push_binary(request):
+    # body: a push_protocol packet of one or more coalesced readings
+    try:
+        push = push_protocol.decode(request.body)
+    except ValueError as exc:
+        return JsonResponse({"success": False, "error": str(exc)}, status=400)
+    fresh, missing = push_protocol.tracker.accept(push)
+    ack = push_protocol.tracker.last(push.device_id)
+    # a device without a clock reports at 1 Hz: stamp its readings back from now
+    now = time.time()
+    readings = [
+        (push.device_id, ts or now - (ack - seq), spo2, bpm, temp, samples)
+        for seq, ts, spo2, bpm, temp, samples in fresh
+    ]
+
+    records = None
+    if readings:
+        try:
+            if settings.INGEST_MODE == "log":
+                log_readings(readings)
+            else:
+                records = ingest.make_records(readings)
+                ingest.get_buffer().put(records)
+        except Exception as exc:
+            # not stored: reopen the sequence numbers so the device's resend is not dropped as a duplicate
+            push_protocol.tracker.reopen(push.device_id, [reading[0] for reading in fresh])
+            if isinstance(exc, ingest.BufferFull):
+                return JsonResponse({"success": False, "retry": True}, status=503)
+            raise
+    if records:
+        ingested(push.device_id, records)
     return JsonResponse({
+        "success": True,
+        "accepted": len(readings),
+        "duplicates": len(push.readings) - len(readings),
+        "ack": ack,
+        "missing": missing,
+    })
+
+def profile_payload(user):
+    return {
         "surname": user.surname,
         "first_name": user.first_name,
         "username": user.username,
@@ -173,43 +405,196 @@ def user_profile(request):
         "gender": user.gender,
         "premium_plan": user.premium_plan,
         "device_id": user.device_id,
-    })
+    }
 
-def user_profiles(request):
-    users = []
-    for user in UserProfile.objects.all():
-        users.append({
-            "surname": user.surname,
-            "first_name": user.first_name,
-            "username": user.username,
-            "email": user.email,
-            "age": user.age,
-            "gender": user.gender,
-            "premium_plan": user.premium_plan,
-            "device_id": user.device_id,
-        })
-    return JsonResponse({"users": users})
+def user_profile(request):
+    username = auth.viewer(request)
 
-def get_vitals(request):
-    username = request.GET["username"]
-    username_ = UserProfile.objects.get(username=username)
-    if username_.device_id != "56781234":
-        return JsonResponse({"has_vitals": False})
+    def build():
+        return profile_payload(UserProfile.objects.get(username=username))
+
+    return response_cache.respond(request, "profile", username, build)
+
+async def auser_profile(request):
+    username = auth.viewer(request)
 
-    record = DeviceRecords.objects.last()
-    time_diff = timezone.now() - record.timestamp
-    seconds_diff = time_diff.total_seconds()
+    async def build():
+        return profile_payload(await UserProfile.objects.aget(username=username))
+
+    return await response_cache.arespond(request, "profile", username, build)
+
+def user_profiles(request):
+    cursor = int(request.GET.get("cursor", 0))
+    limit = max(1, min(int(request.GET.get("limit", 100)), 1000))
+    users = list(UserProfile.objects.filter(id__gt=cursor).order_by("id").values(
+        "id", "surname", "first_name", "username", "email", "age", "gender", "premium_plan", "device_id",
+    )[:limit + 1])
+
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = users[-1]["id"]
+    for user in users:
+        del user["id"]
+    return JsonResponse({"users": users, "next_cursor": next_cursor})
+
+def vitals_response(device_id, reading):
+    if reading is None:
+        return JsonResponse({"has_vitals": False})
+    seconds_diff = time.time() - reading["timestamp"]
     return JsonResponse({
         "has_vitals": True,
-        "temp": record.temp,
-        "heart_rate": record.heart_rate,
-        "blood_oxygen": record.blood_oxygen,
-        "sbp": record.sbp,
-        "dbp": record.dbp,
-        "ecg_sensor_frame": list(record.ecg_sensor_frame),
+        "temp": reading["temp"],
+        "heart_rate": reading["heart_rate"],
+        "blood_oxygen": reading["blood_oxygen"],
+        "sbp": reading["sbp"],
+        "dbp": reading["dbp"],
+        "ecg_sensor_frame": reading["ecg_sensor_frame"],
         "time_diff_seconds": seconds_diff,
-        "online": (datetime.datetime.now(datetime.timezone.utc) - record.timestamp).total_seconds() < 3,
+        "online": presence.is_online(device_id, reading["timestamp"]),
     })
 
-
-
+def get_vitals(request):
+    # the viewer's own device comes from the token or the cached access map,
+    # so a poll answered from the vitals cache never touches the database
+    if request.claims is not None:
+        device_id = request.claims.own_device
+    else:
+        device_id = access.get_map(request.GET["username"]).own_device
+    if not device_id:
+        return JsonResponse({"has_vitals": False})
+    return vitals_response(device_id, vitals_cache.get_latest(device_id))
+
+async def aget_vitals(request):
+    if request.claims is not None:
+        device_id = request.claims.own_device
+    else:
+        device_id = (await access.aget_map(request.GET["username"])).own_device
+    if not device_id:
+        return JsonResponse({"has_vitals": False})
+    return vitals_response(device_id, await vitals_cache.aget_latest(device_id))
+
+
+def own_device(request):
+    # the requesting user's device, from their token when they send one
+    if request.claims is not None:
+        return request.claims.own_device
+    return UserProfile.objects.get(username=request.GET["username"]).device_id
+
+
+def get_history(request):
+    device_id = own_device(request)
+    if not device_id:
+        return JsonResponse({"records": [], "next_cursor": None})
+    end = history.from_unix(request.GET["end"]) if "end" in request.GET else timezone.now()
+    start = history.from_unix(request.GET["start"]) if "start" in request.GET else end - datetime.timedelta(hours=1)
+    limit = max(1, min(int(request.GET.get("limit", 500)), 5000))
+
+    records, next_cursor = history.page(device_id, start, end, limit, request.GET.get("cursor"))
+    return JsonResponse({"records": records, "next_cursor": next_cursor})
+
+
+def get_ecg(request):
+    # Raw little-endian int16 samples of every frame in [start, end), oldest first.
+    device_id = own_device(request)
+    end = history.from_unix(request.GET["end"]) if "end" in request.GET else timezone.now()
+    start = history.from_unix(request.GET["start"]) if "start" in request.GET else end - datetime.timedelta(minutes=1)
+    frames = DeviceRecords.objects.filter(
+        device_id=device_id, timestamp__gte=start, timestamp__lt=end
+    ).exclude(ecg_frame=None).order_by("timestamp", "id").values_list("timestamp", "id", "ecg_frame")
+    archived = archive.ecg_frames(device_id, start, end) if device_id else iter(())
+    if not device_id:
+        frames = frames.none()
+
+    def samples():
+        hot = ((timestamp, pk, ecg.decode(frame)) for timestamp, pk, frame in frames.iterator(chunk_size=500))
+        seen = None
+        for _, pk, frame in heapq.merge(archived, hot, key=lambda row: row[:2]):
+            if pk == seen:
+                continue  # caught mid-archival in both tiers
+            seen = pk
+            yield frame.tobytes()
+
+    # frames are small, so pull a batch of them per trip to the sync thread under ASGI
+    response = StreamingHttpResponse(streaming.body(request, samples(), batch=64), content_type="application/octet-stream")
+    response["X-ECG-Sample-Rate"] = str(settings.ECG_SAMPLE_RATE)
+    response["X-ECG-Sample-Format"] = "int16le"
+    return response
+
+
+def export_vitals(request):
+    # A device's whole history (or [start, end)) as CSV or NDJSON, streamed.
+    if request.claims is not None:
+        own, devices = request.claims.own_device, request.claims.devices
+    else:
+        access_map = access.get_map(request.GET["username"])
+        own, devices = access_map.own_device, access_map.devices
+    device_id = request.GET.get("device_id") or own
+    if device_id not in devices:
+        return JsonResponse({"success": False, "error": "no vitals access to this device"}, status=403)
+    chunks, content_type = export.FORMATS.get(request.GET.get("format", "csv"), (None, None))
+    if chunks is None:
+        return JsonResponse({"success": False, "error": "format must be one of %s" % ", ".join(export.FORMATS)}, status=400)
+    end = history.from_unix(request.GET["end"]) if "end" in request.GET else timezone.now()
+    start = history.from_unix(request.GET["start"]) if "start" in request.GET else history.EPOCH
+
+    rows = export.rows(device_id, start, end)
+    response = StreamingHttpResponse(streaming.body(request, chunks(rows)), content_type=content_type)
+    response["Content-Disposition"] = 'attachment; filename="vitals-%s.%s"' % (
+        "".join(c if c.isalnum() or c in "-_" else "_" for c in device_id), request.GET.get("format", "csv"))
+    return response
+
+
+def get_trend(request):
+    device_id = own_device(request)
+    end = history.from_unix(request.GET["end"]) if "end" in request.GET else timezone.now()
+    start = history.from_unix(request.GET["start"]) if "start" in request.GET else end - datetime.timedelta(days=1)
+    max_points = max(1, min(int(request.GET.get("points", 500)), 5000))
+    if not device_id:
+        return JsonResponse({"resolution": None, "points": []})
+
+    resolution, points = rollups.trend(device_id, start, end, max_points)
+    return JsonResponse({"resolution": resolution, "points": points})
+
+
+async def stream_vitals(request):
+    # Server-Sent Events; needs the ASGI entry point (cliniq_server.asgi).
+    if request.claims is not None:
+        devices = request.claims.devices
+    else:
+        devices = (await access.aget_map(request.GET["username"])).devices
+
+    initial = {}
+    for device_id in devices:
+        reading = await vitals_cache.aget_latest(device_id)
+        if reading is not None:
+            initial[device_id] = reading
+
+    response = StreamingHttpResponse(streaming.event_stream(devices, initial), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def get_alerts(request):
+    # Anomaly alerts for every device the user may see vitals of.
+    since = float(request.GET.get("since", 0))
+    devices = request.claims.devices if request.claims is not None else access.get_map(request.GET["username"]).devices
+    return JsonResponse({"alerts": anomaly.get_detector().recent(devices, since)})
+
+
+def get_presence(request):
+    # Online status of every device the user may see vitals of; pass the
+    # returned cursor back as ``since`` to get only what changed.
+    since = int(request.GET["since"]) if "since" in request.GET else None
+    devices = request.claims.devices if request.claims is not None else access.get_map(request.GET["username"]).devices
+    cursor, status, full = presence.get_tracker().status(devices, since)
+    return JsonResponse({"cursor": cursor, "full": full, "devices": status})
+
+
+def metrics_view(request):
+    return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4")
+
+
+def sampled_queries(request):
+    return JsonResponse({"requests": list(metrics.sampled_queries)})
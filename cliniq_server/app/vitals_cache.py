@@ -0,0 +1,128 @@
+"""
+Latest reading per device.
+
+Ingest writes every accepted reading through to this cache and ``get_vitals``
+serves from it, so dashboard polling costs a dictionary lookup instead of a
+``DeviceRecords`` query. ``settings.VITALS_CACHE`` selects the backend:
+"memory" for a plain per-process dict, or the alias of a Django cache from
+``settings.CACHES`` (locmem, Redis, ...) when several workers must share it.
+Written-through readings expire after ``settings.VITALS_CACHE_TTL`` seconds,
+so with per-process caches a worker that once took a device's push still
+catches up with newer pushes stored by other workers. A device with no
+readings at all is remembered as ``MISSING`` for as long as a seeded reading
+would be, so polling it doesn't query the table each time.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from app import ecg
+from app.models import DeviceRecords
+
+
+# cached for a device without readings; falsy, and .get() finds no field
+MISSING = {}
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires < time.monotonic():
+            return None
+        return value
+
+    def set(self, key, value, timeout=None):
+        self._data[key] = (value, None if timeout is None else time.monotonic() + timeout)
+
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value, timeout=None):
+        self.set(key, value, timeout)
+
+
+class DjangoCacheBackend:
+    def __init__(self, alias, prefix="latest_vitals"):
+        self.cache = caches[alias]
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.cache.get("%s:%s" % (self.prefix, key))
+
+    def set(self, key, value, timeout=None):
+        self.cache.set("%s:%s" % (self.prefix, key), value, timeout)
+
+    async def aget(self, key):
+        return await self.cache.aget("%s:%s" % (self.prefix, key))
+
+    async def aset(self, key, value, timeout=None):
+        await self.cache.aset("%s:%s" % (self.prefix, key), value, timeout)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if settings.VITALS_CACHE == "memory":
+            _backend = MemoryBackend()
+        else:
+            _backend = DjangoCacheBackend(settings.VITALS_CACHE)
+    return _backend
+
+
+def reading_from_record(record):
+    return {
+        "timestamp": record.timestamp.timestamp(),
+        "temp": record.temp,
+        "heart_rate": record.heart_rate,
+        "blood_oxygen": record.blood_oxygen,
+        "sbp": record.sbp,
+        "dbp": record.dbp,
+        "ecg_sensor_frame": ecg.decode(record.ecg_frame).tolist(),
+    }
+
+
+def record_latest(device_id, record):
+    """Write ``record`` through unless a newer reading is already cached
+    (bulk uploads may arrive out of order). Returns the cached reading, or
+    None if it was stale."""
+    reading = reading_from_record(record)
+    backend = get_backend()
+    current = backend.get(device_id)
+    if not current or current["timestamp"] <= reading["timestamp"]:
+        backend.set(device_id, reading, timeout=settings.VITALS_CACHE_TTL)
+        return reading
+    return None
+
+
+def get_latest(device_id):
+    reading = get_backend().get(device_id)
+    if reading is None:
+        # Cold or expired (fresh worker, idle device, or pushes handled by
+        # another process with a per-process backend): seed from the newest
+        # row with a short TTL.
+        record = DeviceRecords.objects.filter(device_id=device_id).order_by("timestamp").last()
+        reading = MISSING if record is None else reading_from_record(record)
+        get_backend().set(device_id, reading, timeout=settings.VITALS_CACHE_SEED_TTL)
+    return reading or None
+
+
+async def aget_latest(device_id):
+    """``get_latest`` for async views."""
+    backend = get_backend()
+    reading = await backend.aget(device_id)
+    if reading is None:
+        record = await DeviceRecords.objects.filter(device_id=device_id).order_by("timestamp").alast()
+        reading = MISSING if record is None else reading_from_record(record)
+        await backend.aset(device_id, reading, timeout=settings.VITALS_CACHE_SEED_TTL)
+    return reading or None
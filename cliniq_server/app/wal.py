@@ -0,0 +1,187 @@
+"""
+Durable append-only ingest log.
+
+With ``settings.INGEST_MODE = "log"`` pushes are appended here and
+acknowledged straight away; ``manage.py drain_ingest_log`` later moves them
+into ``DeviceRecords`` with batched BP inference.
+
+Each web process writes its own segment files (``<time_ns>-<pid>-<seq>.log``) and holds
+an exclusive ``flock`` on the active one, so the drainer can tell live
+segments from finished or orphaned ones. Records are single lines::
+
+    <crc32 of payload, 8 hex digits> <JSON payload>\\n
+
+A torn or corrupt tail line (crash mid-write) fails the checksum and is
+ignored. A background thread fsyncs everything appended since its last
+fsync in one call (group commit), first pausing ``INGEST_LOG_FSYNC_INTERVAL``
+seconds to gather more if set; with ``INGEST_LOG_WAIT_FOR_FSYNC`` the caller
+waits for the fsync that covers its record before acknowledging.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+import zlib
+
+from django.conf import settings
+
+
+SUFFIX = ".log"
+
+
+def encode_record(payload):
+    data = json.dumps(payload, separators=(",", ":")).encode()
+    return b"%08x %s\n" % (zlib.crc32(data), data)
+
+
+def decode_line(line):
+    if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b" ":
+        return None
+    data = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(data):
+            return None
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+class IngestLog:
+    def __init__(self, directory, segment_bytes=64 * 2 ** 20, fsync_interval=0.0, wait_for_fsync=True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.wait_for_fsync = wait_for_fsync
+
+        self._fd = None
+        self._pid = None
+        self._seq = 0
+        self._size = 0
+        self._written = 0
+        self._synced = 0
+        self._lock = threading.Lock()
+        self._synced_cond = threading.Condition(self._lock)
+        self._dirty = threading.Event()
+        self._syncer = None
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, payload):
+        self.append_many([payload])
+
+    def append_many(self, payloads):
+        data = b"".join(encode_record(payload) for payload in payloads)
+        with self._lock:
+            if self._fd is None or self._pid != os.getpid() or self._size >= self.segment_bytes:
+                self._rotate()
+            os.write(self._fd, data)
+            self._size += len(data)
+            self._written += 1
+            ticket = self._written
+            self._dirty.set()
+            if self.wait_for_fsync:
+                while self._synced < ticket:
+                    self._synced_cond.wait()
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def _rotate(self):
+        self._close_segment()
+        if self._pid != os.getpid():
+            # forked worker: never share the parent's segment or syncer
+            self._pid = os.getpid()
+            self._seq = 0
+            self._syncer = None
+        self._seq += 1
+        path = os.path.join(self.directory, "%d-%d-%06d%s" % (time.time_ns(), self._pid, self._seq, SUFFIX))
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._size = 0
+        if self._syncer is None or not self._syncer.is_alive():
+            self._syncer = threading.Thread(target=self._run_syncer, name="ingest-log-fsync", daemon=True)
+            self._syncer.start()
+
+    def _close_segment(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            self._synced = max(self._synced, self._written)
+            self._synced_cond.notify_all()
+            os.close(self._fd)  # releases the flock: the segment is now sealed
+            self._fd = None
+
+    def _run_syncer(self):
+        while True:
+            self._dirty.wait()
+            if self.fsync_interval:
+                time.sleep(self.fsync_interval)
+            with self._lock:
+                self._dirty.clear()
+                target = self._written
+                # fsync a duplicate outside the lock so appends keep flowing
+                # (and a rotation can close the original) meanwhile
+                fd = None if self._fd is None else os.dup(self._fd)
+            if fd is not None:
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            with self._lock:
+                self._synced = max(self._synced, target)
+                self._synced_cond.notify_all()
+
+
+def segments(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if name.endswith(SUFFIX))
+
+
+def is_sealed(path):
+    """True once no writer holds the segment open."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+    finally:
+        os.close(fd)
+
+
+def read_records(path, offset, limit):
+    """Up to ``limit`` complete records after byte ``offset``. Returns
+    ``(records, new_offset, clean)``; ``clean`` is False when reading stopped
+    at a torn or corrupt line."""
+    records = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while len(records) < limit:
+            line = f.readline()
+            if not line:
+                return records, offset, True
+            payload = decode_line(line)
+            if payload is None:
+                return records, offset, False
+            records.append(payload)
+            offset += len(line)
+    return records, offset, True
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = IngestLog(
+                settings.INGEST_LOG_DIR,
+                segment_bytes=settings.INGEST_LOG_SEGMENT_BYTES,
+                fsync_interval=settings.INGEST_LOG_FSYNC_INTERVAL,
+                wait_for_fsync=settings.INGEST_LOG_WAIT_FOR_FSYNC,
+            )
+        return _log
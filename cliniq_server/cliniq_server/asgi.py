@@ -13,4 +13,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cliniq_server.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from app.asgi import get_application
+from app.inference import warm_up
+
+# the API is served by async views through a shorter, async-only middleware
+# stack (settings.API_MIDDLEWARE); only the admin gets the full MIDDLEWARE
+application = get_application(django_application)
+
+warm_up()
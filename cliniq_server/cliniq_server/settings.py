@@ -53,16 +53,31 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",  # must be at the top
+    "app.metrics.MetricsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    "app.auth.TokenMiddleware",
+    "app.ratelimit.RateLimitMiddleware",
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "django.middleware.common.CommonMiddleware",
 ]
 
+# Under ASGI (cliniq_server.asgi) everything but the admin and static files is
+# served by the async views in app.async_urls through this shorter stack. It
+# keeps only async-native middleware, so no request pays a sync_to_async hop
+# before reaching its view; the session, auth, messages, CSRF, security and
+# clickjacking middleware are only needed by the admin, which keeps MIDDLEWARE.
+API_MIDDLEWARE = [
+    "corsheaders.middleware.CorsMiddleware",
+    "app.metrics.MetricsMiddleware",
+    "app.auth.TokenMiddleware",
+    "app.ratelimit.RateLimitMiddleware",
+]
+API_URLCONF = "app.async_urls"
+
 ROOT_URLCONF = 'cliniq_server.urls'
 
 TEMPLATES = [
@@ -85,13 +100,63 @@ WSGI_APPLICATION = 'cliniq_server.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# DB_ENGINE picks the backend ("sqlite3", "postgresql", "mysql", ...).
+# SQLite runs in WAL mode so polls read while a push writes; writers wait up
+# to SQLITE_BUSY_TIMEOUT seconds for the lock instead of failing, and take it
+# at BEGIN (transaction_mode IMMEDIATE) so a read-then-write transaction can
+# never deadlock on the upgrade. synchronous=NORMAL is durable in WAL mode
+# against application crashes; set SQLITE_SYNCHRONOUS=FULL to survive power
+# loss as well. Server databases keep connections open for DB_CONN_MAX_AGE
+# seconds, or use a connection pool on PostgreSQL with DB_POOL_MAX_SIZE.
+#
+# WAL mode is recorded in the database file itself, so the first connection
+# rewrites the header of the db.sqlite3 checked into the repository, and
+# git shows it as modified. The db.sqlite3-wal and -shm files next to it are
+# ignored. Run with SQLITE_JOURNAL_MODE=DELETE to leave a checked-out copy
+# unchanged. That also switches an already converted file back.
+
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite3")
+if DB_ENGINE == "sqlite3":
+    SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", 20.0))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv("DB_NAME", BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", 0)),
+            'OPTIONS': {
+                'timeout': SQLITE_BUSY_TIMEOUT,
+                'transaction_mode': os.getenv("SQLITE_TRANSACTION_MODE", "IMMEDIATE") or None,
+                'init_command': ";".join([
+                    "PRAGMA journal_mode=%s" % os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+                    "PRAGMA synchronous=%s" % os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+                    "PRAGMA temp_store=MEMORY",
+                    "PRAGMA cache_size=-%d" % int(os.getenv("SQLITE_CACHE_KB", 20000)),
+                ]),
+            },
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.%s' % DB_ENGINE,
+            'NAME': os.getenv("DB_NAME", "cliniq"),
+            'USER': os.getenv("DB_USER", ""),
+            'PASSWORD': os.getenv("DB_PASSWORD", ""),
+            'HOST': os.getenv("DB_HOST", ""),
+            'PORT': os.getenv("DB_PORT", ""),
+            'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if DB_ENGINE == "postgresql" and os.getenv("DB_POOL_MAX_SIZE"):
+        # psycopg's pool replaces persistent connections (needs psycopg[pool])
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE")),
+        }
 
 
 # Password validation
@@ -131,3 +196,209 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
+
+
+# Device telemetry ingest
+# Bulk pushes are queued in memory and flushed with one bulk_create per batch,
+# once INGEST_FLUSH_SIZE rows are waiting or the oldest is INGEST_FLUSH_AGE
+# seconds old. Pushes are rejected with 503 while INGEST_BUFFER_CAPACITY rows
+# are pending. A failed flush is retried INGEST_FLUSH_RETRIES times, the
+# first after INGEST_FLUSH_RETRY_DELAY seconds and doubling, then dropped.
+
+INGEST_FLUSH_SIZE = int(os.getenv("INGEST_FLUSH_SIZE", 500))
+INGEST_FLUSH_AGE = float(os.getenv("INGEST_FLUSH_AGE", 1.0))
+INGEST_BUFFER_CAPACITY = int(os.getenv("INGEST_BUFFER_CAPACITY", 10000))
+INGEST_FLUSH_RETRIES = int(os.getenv("INGEST_FLUSH_RETRIES", 3))
+INGEST_FLUSH_RETRY_DELAY = float(os.getenv("INGEST_FLUSH_RETRY_DELAY", 0.5))
+
+
+# Blood pressure inference
+# BP_PREDICTOR picks the model backend: "keras" (model.keras, needs
+# TensorFlow), "numpy" (model.npz from `manage.py export_bp_model`) or
+# "random" for environments without a model. The model loads in the
+# background at worker start when BP_PREDICTOR_WARMUP is set, otherwise on
+# the first push. getBP calls arriving within BP_BATCH_WAIT seconds of each
+# other are run as one model call of up to BP_BATCH_SIZE rows; BP_CACHE_SIZE
+# quantized inputs are remembered.
+
+BP_PREDICTOR = os.getenv("BP_PREDICTOR", "keras" if os.getenv("PYTHONANYWHERE_DOMAIN_") is not None else "random")
+BP_PREDICTOR_WARMUP = os.getenv("BP_PREDICTOR_WARMUP", "1") == "1"
+BP_BATCH_SIZE = int(os.getenv("BP_BATCH_SIZE", 64))
+BP_BATCH_WAIT = float(os.getenv("BP_BATCH_WAIT", 0.005))
+BP_CACHE_SIZE = int(os.getenv("BP_CACHE_SIZE", 4096))
+# async views (device_push under ASGI) run inference on this many threads
+BP_EXECUTOR_WORKERS = int(os.getenv("BP_EXECUTOR_WORKERS", 8))
+
+
+# Latest vitals cache
+# Pushes that carry no device_id (the current firmware) belong to
+# DEFAULT_DEVICE_ID. get_vitals serves the newest reading per device from
+# VITALS_CACHE: "memory" (per-process dict) or a CACHES alias. With several
+# worker processes pick a shared cache (set REDIS_URL and VITALS_CACHE=default);
+# otherwise a worker serves its own last write-through reading for up to
+# VITALS_CACHE_TTL seconds before rereading the table. A worker that misses
+# seeds itself from the table for VITALS_CACHE_SEED_TTL seconds, and
+# remembers a device with no readings for as long.
+
+DEFAULT_DEVICE_ID = os.getenv("DEFAULT_DEVICE_ID", "56781234")
+VITALS_CACHE = os.getenv("VITALS_CACHE", "memory")
+VITALS_CACHE_TTL = float(os.getenv("VITALS_CACHE_TTL", 10.0))
+VITALS_CACHE_SEED_TTL = float(os.getenv("VITALS_CACHE_SEED_TTL", 2.0))
+
+# Conditional GET for user_profile, is_premium, has_device and
+# get_connections (app/response_cache.py). Version tokens live in
+# RESPONSE_CACHE ("memory" or a CACHES alias, as for VITALS_CACHE) for
+# RESPONSE_CACHE_TTL seconds; up to RESPONSE_CACHE_SIZE serialized bodies are
+# kept per process.
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "memory")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 30.0))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 10000))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+if os.getenv("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL"),
+    }
+
+
+# Vitals rollups
+# Ingested readings are folded into 1-minute/15-minute/hourly buckets in
+# memory and merged into VitalsRollup every ROLLUP_FLUSH_INTERVAL seconds.
+
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", 5.0))
+
+
+# ECG frames
+# Samples are stored as packed int16 (app/ecg.py) captured at ECG_SAMPLE_RATE
+# Hz. ECG_ENCODING is "raw" (zero-copy reads), "delta" or "delta+zlib"
+# (smallest rows, one decoding pass per read).
+
+ECG_SAMPLE_RATE = int(os.getenv("ECG_SAMPLE_RATE", 250))
+ECG_ENCODING = os.getenv("ECG_ENCODING", "raw")
+
+
+# Request metrics
+# Per-view latency, DB query count/time and BP inference time, served at
+# /metrics in Prometheus text format. METRICS_QUERY_SAMPLE_RATE is the share of
+# requests whose SQL is also kept (last 200 at /metrics/queries).
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_QUERY_SAMPLE_RATE = float(os.getenv("METRICS_QUERY_SAMPLE_RATE", 0.0))
+
+
+# Access control
+# Per-viewer permission maps are cached in memory for ACCESS_CACHE_TTL
+# seconds, up to ACCESS_CACHE_SIZE of them per process; connection changes
+# made in this process invalidate them at once.
+
+ACCESS_CACHE_TTL = float(os.getenv("ACCESS_CACHE_TTL", 30.0))
+ACCESS_CACHE_SIZE = int(os.getenv("ACCESS_CACHE_SIZE", 10000))
+
+
+# Presence
+# A device is online from a push until PRESENCE_TIMEOUT seconds pass without
+# one; a sweep every PRESENCE_SWEEP_INTERVAL seconds takes it offline.
+# get_presence answers "what changed" polls from the last PRESENCE_HISTORY
+# transitions.
+
+PRESENCE_TIMEOUT = float(os.getenv("PRESENCE_TIMEOUT", 3.0))
+PRESENCE_SWEEP_INTERVAL = float(os.getenv("PRESENCE_SWEEP_INTERVAL", 0.5))
+PRESENCE_HISTORY = int(os.getenv("PRESENCE_HISTORY", 10000))
+
+
+# Login tokens
+# login returns a token signed with SECRET_KEY that carries the user and the
+# devices they may see (app/auth.py). Reads sent with
+# "Authorization: Bearer <token>" use it instead of looking the user up;
+# grant changes reach a token on refresh_token or after TOKEN_MAX_AGE seconds.
+# revoke_tokens invalidates a user's tokens at once in this process and
+# within ACCESS_CACHE_TTL seconds in the others.
+
+TOKEN_MAX_AGE = int(os.getenv("TOKEN_MAX_AGE", 900))
+
+
+# Rate limits
+# Token buckets per device ("ingest") and per user ("poll", "history"), as
+# (tokens per second, burst); see app/ratelimit.py for the endpoints in each
+# group. Token holders on the premium plan get PREMIUM_RATE_LIMITS where a
+# group is listed there; ?username= requests are counted per client address
+# on RATE_LIMITS.
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMITS = {
+    "ingest": (5.0, 30),
+    "poll": (1.0, 20),
+    "history": (0.2, 20),
+}
+PREMIUM_RATE_LIMITS = {
+    "poll": (5.0, 60),
+    "history": (2.0, 60),
+}
+
+
+# Device context
+# Age/gender used for BP inference come from the profile that owns the
+# device (app/device_context.py), cached for DEVICE_CONTEXT_TTL seconds.
+
+DEVICE_CONTEXT_TTL = float(os.getenv("DEVICE_CONTEXT_TTL", 300.0))
+
+
+# Ingest mode
+# "direct" runs BP inference and writes DeviceRecords inside device_push.
+# "log" appends the reading to a crash-safe log under INGEST_LOG_DIR and
+# acknowledges at once; `manage.py drain_ingest_log` loads it into the
+# database. With INGEST_LOG_WAIT_FOR_FSYNC the ack waits for the group fsync
+# that makes the reading durable; INGEST_LOG_FSYNC_INTERVAL > 0 delays each
+# fsync to batch more appends into it, trading ack latency for fewer syncs.
+
+INGEST_MODE = os.getenv("INGEST_MODE", "direct")
+INGEST_LOG_DIR = os.getenv("INGEST_LOG_DIR", str(BASE_DIR / "ingest_log"))
+INGEST_LOG_SEGMENT_BYTES = int(os.getenv("INGEST_LOG_SEGMENT_BYTES", 64 * 2 ** 20))
+INGEST_LOG_FSYNC_INTERVAL = float(os.getenv("INGEST_LOG_FSYNC_INTERVAL", 0.0))
+INGEST_LOG_WAIT_FOR_FSYNC = os.getenv("INGEST_LOG_WAIT_FOR_FSYNC", "1") == "1"
+
+
+# Retention
+# `manage.py archive_records` moves DeviceRecords older than RETENTION_DAYS
+# into per-device, per-day column files under ARCHIVE_DIR (app/archive.py).
+# ARCHIVE_COMPRESS=0 stores them uncompressed so reads memory-map them.
+
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 30))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", str(BASE_DIR / "archive"))
+ARCHIVE_COMPRESS = os.getenv("ARCHIVE_COMPRESS", "1") == "1"
+
+
+# Anomaly alerts
+# Ingested readings are scored in batches every ANOMALY_INTERVAL seconds
+# against a per-device EWMA baseline (weight ANOMALY_ALPHA) once it has seen
+# ANOMALY_WARMUP readings, and against the fixed ANOMALY_BANDS (low, high)
+# from the first one. The baseline's standard deviation is floored at
+# ANOMALY_MIN_STD so a spike after identical readings still scores. Alerts go
+# out as "alert" events on stream_vitals and the last ANOMALY_HISTORY per
+# device are served by get_alerts.
+
+ANOMALY_ENABLED = os.getenv("ANOMALY_ENABLED", "1") == "1"
+ANOMALY_INTERVAL = float(os.getenv("ANOMALY_INTERVAL", 1.0))
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", 0.05))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", 4.0))
+ANOMALY_WARMUP = int(os.getenv("ANOMALY_WARMUP", 30))
+ANOMALY_HISTORY = int(os.getenv("ANOMALY_HISTORY", 50))
+ANOMALY_BANDS = {
+    "heart_rate": (40, 150),
+    "blood_oxygen": (90, None),
+    "temp": (35.0, 38.5),
+    "sbp": (85, 180),
+    "dbp": (50, 120),
+}
+ANOMALY_MIN_STD = {
+    "heart_rate": 2.0,
+    "blood_oxygen": 1.0,
+    "temp": 0.1,
+    "sbp": 3.0,
+    "dbp": 2.0,
+}
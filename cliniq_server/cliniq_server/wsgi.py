@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cliniq_server.settings')
 
 application = get_wsgi_application()
+
+from app.inference import warm_up
+
+warm_up()